@@ -1,10 +1,19 @@
 #!/usr/bin/env python3
 
+import argparse
+import builtins
 import contextlib
+import importlib
 import io
 import json
+import os
+import resource
+import select
 import signal
+import struct
 import sys
+import tempfile
+import threading
 import time
 import traceback
 
@@ -13,10 +22,50 @@ MAX_TIMEOUT = 25.0
 OUTPUT_LIMIT = 10_000
 
 
-class ExecutionTimeout(Exception):
+class ExecutionTimeout(BaseException):
+    # BaseException so that a snippet's broad `except Exception` cannot swallow the deadline
     pass
 
 
+class OutputLimitExceeded(BaseException):
+    # Raised from a capture's write(); BaseException for the same reason as ExecutionTimeout
+    pass
+
+
+class _TimeoutGuard:
+    """SIGALRM handler that holds ExecutionTimeout back while an output frame is written.
+
+    Raising in the middle of a write would leave half a frame on the protocol pipe.
+    Inside the guard the handler only records the timeout; leaving the outermost
+    guard raises it once the frame is complete. Python runs signal handlers in the
+    main thread only (the kernel may still deliver SIGALRM to the flusher thread, so
+    masking it with pthread_sigmask would not help), which is why only main-thread
+    writes take the guard: a write from another thread is never interrupted.
+    """
+
+    def __init__(self) -> None:
+        self.depth = 0
+        self.pending = False
+
+    def handler(self, signum, frame) -> None:
+        if self.depth:
+            self.pending = True
+            return
+        raise ExecutionTimeout()
+
+    def __enter__(self) -> "_TimeoutGuard":
+        self.depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.depth -= 1
+        if not self.depth and self.pending:
+            self.pending = False
+            if exc_type is None:
+                raise ExecutionTimeout()
+        return False
+
+
 def _parse_payload(raw: str) -> dict:
     if not raw.strip():
         return {}
@@ -36,47 +85,185 @@ def _clamp_timeout(value) -> float:
     return min(MAX_TIMEOUT, max(0.1, num))
 
 
-def _truncate(text: str) -> str:
-    if len(text) <= OUTPUT_LIMIT:
+class _BoundedCapture(io.TextIOBase):
+    """StringIO replacement that keeps at most `limit` characters.
+
+    Anything past the limit is counted (as UTF-8 bytes) and discarded instead of
+    accumulating until the container runs out of memory. With `abort_after`, the
+    write that brings the attempted total past that many characters raises
+    OutputLimitExceeded, ending a runaway print loop long before its timeout.
+    """
+
+    def __init__(self, limit: int, abort_after: int = 0) -> None:
+        self._parts = []
+        self._kept = 0
+        self._written = 0
+        self._limit = limit
+        self._abort_after = abort_after
+        self.dropped = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text) -> int:
+        if not isinstance(text, str):
+            raise TypeError(f"write() argument must be str, not {type(text).__name__}")
+        size = len(text)
+        self._written += size
+        room = self._limit - self._kept
+        if room > 0:
+            self._parts.append(text[:room])
+            self._kept += min(room, size)
+            text = text[room:]
+        if text:
+            self.dropped += len(text.encode("utf-8", errors="replace"))
+        if self._abort_after and self._written > self._abort_after:
+            raise OutputLimitExceeded()
+        return size
+
+    def getvalue(self) -> str:
+        text = "".join(self._parts)
+        if self.dropped:
+            text += f"\n...[output truncated, {self.dropped} bytes dropped]..."
         return text
-    return text[:OUTPUT_LIMIT] + "\n...[output truncated]..."
 
 
-def main() -> int:
-    raw = sys.stdin.read()
-    payload = _parse_payload(raw)
+def _abort_after(value) -> int:
+    # outputAbortFactor: abort once a stream has been written this many times OUTPUT_LIMIT (0 = never)
+    try:
+        factor = float(value or 0)
+    except (TypeError, ValueError):
+        return 0
+    return int(OUTPUT_LIMIT * max(factor, 1.0)) if factor > 0 else 0
+
+
+class _OutputStream:
+    """Shared state of a streaming run's stdout/stderr captures.
+
+    Writes are buffered and sent through `emit` as {"type": "output"} frames by a
+    flusher thread every FLUSH_INTERVAL seconds (or sooner once FLUSH_SIZE chars
+    are pending), so a tight print loop becomes a few frames, not thousands. Both
+    streams share one OUTPUT_LIMIT budget; the write that crosses it is cut at the
+    limit and raises OutputLimitExceeded, so a runaway loop stops right there.
+    """
+
+    FLUSH_INTERVAL = 0.05
+    FLUSH_SIZE = 4096
+
+    def __init__(self, emit, start: float, guard: _TimeoutGuard) -> None:
+        self._emit = emit
+        self._start = start
+        self._guard = guard
+        self._budget = OUTPUT_LIMIT
+        self._pending = []
+        self._pending_size = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="output-flusher", daemon=True)
+        self._flusher.start()
+
+    def write(self, name: str, text: str) -> None:
+        with self._lock:
+            allowed = text[: self._budget]
+            self._budget -= len(allowed)
+            if allowed:
+                if self._pending and self._pending[-1][0] == name:
+                    self._pending[-1][1].append(allowed)
+                else:
+                    self._pending.append((name, [allowed]))
+                self._pending_size += len(allowed)
+            if len(allowed) < len(text):
+                self._flush_locked()
+                raise OutputLimitExceeded()
+            if self._pending_size >= self.FLUSH_SIZE:
+                self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        if not self._pending:
+            return
+        elapsed = time.monotonic() - self._start
+        pending, self._pending, self._pending_size = self._pending, [], 0
+        on_main = threading.current_thread() is threading.main_thread()
+        with self._guard if on_main else contextlib.nullcontext():
+            for name, parts in pending:
+                self._emit({"type": "output", "stream": name, "data": "".join(parts), "elapsed": elapsed})
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_loop(self) -> None:
+        while not self._stopped.wait(self.FLUSH_INTERVAL):
+            self.flush()
+
+    def close(self) -> None:
+        self._stopped.set()
+        self._flusher.join()
+        self.flush()
+
+
+class _StreamCapture(io.TextIOBase):
+    def __init__(self, name: str, output: _OutputStream) -> None:
+        self.name = name
+        self._output = output
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text) -> int:
+        if not isinstance(text, str):
+            raise TypeError(f"write() argument must be str, not {type(text).__name__}")
+        self._output.write(self.name, text)
+        return len(text)
+
+    def flush(self) -> None:
+        pass
+
+
+def execute(payload: dict, emit=None) -> dict:
+    """Run one snippet in fresh globals and return the JSON-able result.
+
+    With `emit`, output is streamed through it as it is produced instead of being
+    returned; the result then carries empty stdout/stderr and "streamed": true.
+    """
     code = payload.get("code")
     if not isinstance(code, str) or not code.strip():
-        print(
-            json.dumps(
-                {
-                    "status": "error",
-                    "stdout": "",
-                    "stderr": "missing code",
-                    "timedOut": False,
-                    "duration": 0.0,
-                    "exitCode": None,
-                }
-            )
-        )
-        return 1
+        return {
+            "status": "error",
+            "stdout": "",
+            "stderr": "missing code",
+            "timedOut": False,
+            "duration": 0.0,
+            "exitCode": None,
+        }
 
     timeout = _clamp_timeout(payload.get("timeout", DEFAULT_TIMEOUT))
 
-    stdout_capture = io.StringIO()
-    stderr_capture = io.StringIO()
     globals_dict = {"__name__": "__main__"}
     status = "success"
     timed_out = False
+    truncated = False
     exit_code = 0
 
-    def _timeout_handler(signum, frame):
-        raise ExecutionTimeout()
-
-    signal.signal(signal.SIGALRM, _timeout_handler)
+    guard = _TimeoutGuard()
+    signal.signal(signal.SIGALRM, guard.handler)
     signal.setitimer(signal.ITIMER_REAL, timeout)
     start = time.monotonic()
 
+    if emit is None:
+        abort_after = _abort_after(payload.get("outputAbortFactor"))
+        stdout_capture = _BoundedCapture(OUTPUT_LIMIT, abort_after)
+        stderr_capture = _BoundedCapture(OUTPUT_LIMIT, abort_after)
+    else:
+        output = _OutputStream(emit, start, guard)
+        stdout_capture = _StreamCapture("stdout", output)
+        stderr_capture = _StreamCapture("stderr", output)
+
+    stdin = payload.get("stdin")
+    saved_stdin = sys.stdin
+    if isinstance(stdin, str):
+        sys.stdin = io.StringIO(stdin)
+
     try:
         with contextlib.redirect_stdout(stdout_capture), contextlib.redirect_stderr(stderr_capture):
             exec(compile(code, "<sandbox>", "exec"), globals_dict)
@@ -84,24 +271,387 @@ def main() -> int:
         status = "timeout"
         timed_out = True
         exit_code = None
+    except OutputLimitExceeded:
+        status = "error"
+        truncated = True
+        exit_code = None
+    except SystemExit as exc:
+        exit_code = exc.code if isinstance(exc.code, int) else (0 if exc.code is None else 1)
+        if exit_code != 0:
+            status = "error"
+            if not isinstance(exc.code, int):
+                stderr_capture.write(f"{exc.code}\n")
     except Exception:
         status = "error"
         exit_code = 1
         traceback.print_exc(file=stderr_capture)
     finally:
         signal.setitimer(signal.ITIMER_REAL, 0)
+        sys.stdin = saved_stdin
 
     duration = time.monotonic() - start
-    result = {
+    if emit is not None:
+        output.close()
+        return {
+            "status": status,
+            "stdout": "",
+            "stderr": "",
+            "timedOut": timed_out,
+            "duration": duration,
+            "exitCode": exit_code,
+            "streamed": True,
+            "truncated": truncated,
+        }
+    stderr_text = stderr_capture.getvalue()
+    if truncated:
+        stderr_text += "\n...[output limit exceeded, execution stopped]..."
+    return {
         "status": status,
-        "stdout": _truncate(stdout_capture.getvalue()),
-        "stderr": _truncate(stderr_capture.getvalue()),
+        "stdout": stdout_capture.getvalue(),
+        "stderr": stderr_text,
         "timedOut": timed_out,
         "duration": duration,
         "exitCode": exit_code,
+        "truncated": truncated or bool(stdout_capture.dropped or stderr_capture.dropped),
+        "dropped": {"stdout": stdout_capture.dropped, "stderr": stderr_capture.dropped},
     }
-    print(json.dumps(result))
-    return 0 if status == "success" else 1
+
+
+# ---------------------------------------------------------------------------
+# Serve mode: one long-lived process per warm container (see api_server's
+# SandboxContainerPool). By default it is a fork server: heavy modules are
+# imported once and every run executes in a forked child with rlimits applied.
+# Requests and results are length-prefixed frames on the original stdin/stdout:
+# a 4-byte big-endian length followed by that many bytes of UTF-8 JSON. Each
+# request carries its own timeout; with "stream": true, {"type": "output"}
+# frames precede the result. The server recycles the container whenever a
+# result reports "tainted" state that could leak into the next run.
+# ---------------------------------------------------------------------------
+
+FRAME_HEADER = struct.Struct(">I")
+MAX_FRAME = 16 * 1024 * 1024
+
+
+def read_frame(stream):
+    """Return the next frame body, or None at end of stream."""
+    header = stream.read(FRAME_HEADER.size)
+    if len(header) < FRAME_HEADER.size:
+        return None
+    (length,) = FRAME_HEADER.unpack(header)
+    if length > MAX_FRAME:
+        raise ValueError(f"frame too large: {length} bytes")
+    body = stream.read(length)
+    if len(body) < length:
+        return None
+    return body
+
+
+def encode_frame(message: dict) -> bytes:
+    body = json.dumps(message).encode("utf-8")
+    return FRAME_HEADER.pack(len(body)) + body
+
+
+def write_frame(stream, message: dict) -> None:
+    stream.write(encode_frame(message))
+    stream.flush()
+
+
+def _write_fd(fd: int, data: bytes) -> None:
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def _child_pids() -> list:
+    pids = []
+    with contextlib.suppress(OSError):
+        for task in os.listdir("/proc/self/task"):
+            with open(f"/proc/self/task/{task}/children") as handle:
+                pids.extend(handle.read().split())
+    return pids
+
+
+def _scratch_entries() -> set:
+    entries = set()
+    for directory in {tempfile.gettempdir(), os.path.expanduser("~")}:
+        with contextlib.suppress(OSError):
+            entries.update(os.path.join(directory, name) for name in os.listdir(directory))
+    return entries
+
+
+def _snapshot() -> dict:
+    module = sys.modules[__name__]
+    return {
+        "builtins": {name: id(value) for name, value in vars(builtins).items()},
+        "runner": {name: id(value) for name, value in vars(module).items()},
+        "modules": {name: id(sys.modules.get(name)) for name in ("json", "signal", "os", "sys", "io")},
+        "environ": dict(os.environ),
+        "path": list(sys.path),
+        "cwd": os.getcwd(),
+        "files": _scratch_entries(),
+    }
+
+
+def _tainted(baseline: dict) -> str:
+    """Describe state a snippet left behind, or return "" when the process is clean."""
+    module = sys.modules[__name__]
+    if {name: id(value) for name, value in vars(builtins).items()} != baseline["builtins"]:
+        return "builtins modified"
+    if {name: id(value) for name, value in vars(module).items()} != baseline["runner"]:
+        return "runner modified"
+    if {name: id(sys.modules.get(name)) for name in baseline["modules"]} != baseline["modules"]:
+        return "core modules replaced"
+    if sys.stdout is not sys.__stdout__ or sys.stderr is not sys.__stderr__:
+        return "standard streams replaced"
+    if dict(os.environ) != baseline["environ"] or list(sys.path) != baseline["path"]:
+        return "environment modified"
+    if os.getcwd() != baseline["cwd"]:
+        return "working directory changed"
+    if threading.active_count() > 1:
+        return "background threads left running"
+    if _child_pids():
+        return "child processes left running"
+    if _scratch_entries() != baseline["files"]:
+        return "files left on disk"
+    return ""
+
+
+# Modules imported once by the fork server so each forked run starts with them loaded.
+# Override with --preload (comma-separated; empty disables preloading).
+DEFAULT_PRELOAD = ("numpy", "pandas", "scipy", "matplotlib.pyplot", "sympy")
+# Per-run limits applied in the forked child on top of the container's cgroup limits
+CHILD_MAX_FILES = 256
+CHILD_MAX_FILE_SIZE = 16 * 1024 * 1024
+
+
+def _preload(names) -> list:
+    # One BLAS thread per process: the container gets a single CPU, and native
+    # thread pools do not survive fork() cleanly anyway.
+    for var in ("OPENBLAS_NUM_THREADS", "OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ.setdefault(var, "1")
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    loaded = []
+    for name in names:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            continue
+        loaded.append(name)
+    return loaded
+
+
+def _apply_child_limits(timeout: float, memory_mb: int) -> None:
+    cpu = int(timeout) + 2
+    limits = [
+        (resource.RLIMIT_CPU, (cpu, cpu)),
+        (resource.RLIMIT_NOFILE, (CHILD_MAX_FILES, CHILD_MAX_FILES)),
+        (resource.RLIMIT_FSIZE, (CHILD_MAX_FILE_SIZE, CHILD_MAX_FILE_SIZE)),
+        (resource.RLIMIT_CORE, (0, 0)),
+    ]
+    if memory_mb > 0:
+        limits.append((resource.RLIMIT_AS, (memory_mb * 1024 * 1024, memory_mb * 1024 * 1024)))
+    for kind, value in limits:
+        with contextlib.suppress(ValueError, OSError):
+            resource.setrlimit(kind, value)
+
+
+def _child_failure(status: int, duration: float) -> dict:
+    if os.WIFSIGNALED(status):
+        signum = os.WTERMSIG(status)
+        if signum == signal.SIGXCPU:
+            return {
+                "status": "timeout",
+                "stdout": "",
+                "stderr": "CPU time limit exceeded",
+                "timedOut": True,
+                "duration": duration,
+                "exitCode": None,
+            }
+        message = f"process killed by signal {signal.Signals(signum).name}"
+        exit_code = -signum
+    else:
+        exit_code = os.WEXITSTATUS(status)
+        message = "" if exit_code == 0 else f"process exited with code {exit_code}"
+    return {
+        "status": "success" if exit_code == 0 else "error",
+        "stdout": "",
+        "stderr": message,
+        "timedOut": False,
+        "duration": duration,
+        "exitCode": exit_code,
+    }
+
+
+def _reap_orphans() -> None:
+    # As PID 1 in the container, the runner inherits processes that escaped the run's group
+    with contextlib.suppress(ChildProcessError):
+        while os.waitpid(-1, os.WNOHANG)[0]:
+            pass
+
+
+def _tainted_after_fork(baseline: dict) -> str:
+    if _child_pids():
+        return "child processes left running"
+    if _scratch_entries() != baseline["files"]:
+        return "files left on disk"
+    return ""
+
+
+def execute_forked(payload: dict, close_fds, memory_mb: int = 0, relay=None) -> dict:
+    """Run execute() in a forked child so nothing it does survives into the next run.
+
+    The child reports over a pipe in the same frame format as the protocol; output
+    frames of a streaming run are passed to `relay` as they arrive.
+    """
+    timeout = _clamp_timeout(payload.get("timeout", DEFAULT_TIMEOUT))
+    read_fd, write_fd = os.pipe()
+    start = time.monotonic()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(read_fd)
+            for fd in close_fds:
+                os.close(fd)
+            # Own process group, so the parent can kill anything the snippet spawns
+            os.setpgid(0, 0)
+            _apply_child_limits(timeout, memory_mb)
+            emit = (lambda frame: _write_fd(write_fd, encode_frame(frame))) if relay is not None else None
+            _write_fd(write_fd, encode_frame(execute(payload, emit)))
+        finally:
+            os._exit(0)
+
+    os.close(write_fd)
+    buffer = bytearray()
+    result = None
+    killed = False
+    # execute() enforces the timeout itself; the grace period covers code that blocks SIGALRM.
+    # Keep it below the server's SANDBOX_TIMEOUT_MARGIN so the result frame always arrives first.
+    deadline = start + timeout + 1.0
+    with os.fdopen(read_fd, "rb", buffering=0) as reader:
+        while result is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                killed = True
+                break
+            ready, _, _ = select.select([reader], [], [], remaining)
+            if not ready:
+                continue
+            chunk = reader.read(65536)
+            if not chunk:
+                break
+            buffer += chunk
+            while len(buffer) >= FRAME_HEADER.size:
+                (length,) = FRAME_HEADER.unpack_from(buffer)
+                if len(buffer) < FRAME_HEADER.size + length:
+                    break
+                body = bytes(buffer[FRAME_HEADER.size : FRAME_HEADER.size + length])
+                del buffer[: FRAME_HEADER.size + length]
+                frame = json.loads(body)
+                if frame.get("type") == "output" and relay is not None:
+                    relay(frame)
+                else:
+                    result = frame
+                    break
+    with contextlib.suppress(ProcessLookupError, PermissionError):
+        os.killpg(pid, signal.SIGKILL)
+    # wait4 reports the reaped child's own peak RSS; RUSAGE_SELF would only ever see the fork server
+    _, status, usage = os.wait4(pid, 0)
+    duration = time.monotonic() - start
+    _reap_orphans()
+    if killed:
+        result = {"status": "timeout", "stdout": "", "stderr": "", "timedOut": True, "duration": duration, "exitCode": None}
+    elif result is None:
+        # The child died before reporting (os._exit, a fatal signal or the memory limit)
+        result = _child_failure(status, duration)
+    if relay is not None:
+        result.setdefault("streamed", True)
+    result["maxRss"] = usage.ru_maxrss
+    return result
+
+
+def serve(fork: bool = True, preload=(), memory_mb: int = 0) -> int:
+    # Keep private handles on the protocol pipes, then point fd 0/1 away from them so
+    # snippets (input(), os.write(1, ...), subprocesses) cannot read or corrupt frames.
+    proto_in = os.fdopen(os.dup(0), "rb")
+    proto_out = os.fdopen(os.dup(1), "wb")
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+    os.dup2(2, 1)
+
+    loaded = _preload(preload) if fork else []
+    baseline = _snapshot()
+    write_frame(proto_out, {"ready": True, "pid": os.getpid(), "fork": fork, "preloaded": loaded})
+    while True:
+        try:
+            body = read_frame(proto_in)
+        except ValueError as exc:
+            # The stream cannot be resynchronised after a bad header
+            write_frame(proto_out, {"status": "error", "stderr": str(exc), "tainted": "protocol error"})
+            return 1
+        if body is None:
+            return 0
+        payload = _parse_payload(body.decode("utf-8", errors="replace"))
+        relay = (lambda frame: write_frame(proto_out, frame)) if payload.get("stream") else None
+        try:
+            if fork:
+                result = execute_forked(payload, (proto_in.fileno(), proto_out.fileno()), memory_mb, relay)
+            else:
+                result = execute(payload, relay)
+        except BaseException as exc:  # noqa: BLE001 - the loop must always answer
+            result = {
+                "status": "error",
+                "stdout": "",
+                "stderr": f"runner failure: {exc!r}",
+                "timedOut": False,
+                "duration": 0.0,
+                "exitCode": None,
+            }
+            reason = "runner failure"
+        else:
+            # A forked run cannot touch this process, and a timed-out child is already gone;
+            # only the filesystem and escaped processes can carry over.
+            if fork:
+                reason = _tainted_after_fork(baseline)
+            else:
+                reason = "timeout" if result["timedOut"] else _tainted(baseline)
+        result["tainted"] = reason or None
+        # Forked runs already carry their child's peak; in-process runs grow this process itself
+        result.setdefault("maxRss", resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+        write_frame(proto_out, result)
+        if reason:
+            # The server replaces this container; stop before it can serve another run
+            return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Execute Python snippets inside the sandbox container.")
+    parser.add_argument("--serve", action="store_true", help="serve length-prefixed JSON frames on stdin/stdout")
+    parser.add_argument("--no-fork", action="store_true", help="serve mode: run snippets in-process instead of forking")
+    parser.add_argument("--preload", default=None, help="serve mode: comma-separated modules to import before forking")
+    parser.add_argument("--memory-limit-mb", type=int, default=0, help="serve mode: RLIMIT_AS for each forked run")
+    args = parser.parse_args()
+    if args.serve:
+        preload = DEFAULT_PRELOAD if args.preload is None else [n.strip() for n in args.preload.split(",") if n.strip()]
+        return serve(fork=not args.no_fork, preload=preload, memory_mb=args.memory_limit_mb)
+    raw = sys.stdin.read()
+    payload = _parse_payload(raw)
+    if payload.get("stream"):
+        # One JSON line per output chunk, then the result line; fd 1 is moved out of
+        # the snippet's reach as in serve mode
+        out = os.fdopen(os.dup(1), "w", encoding="utf-8")
+        os.dup2(2, 1)
+
+        def _emit_line(frame: dict) -> None:
+            out.write(json.dumps(frame) + "\n")
+            out.flush()
+
+        result = execute(payload, _emit_line)
+        _emit_line(result)
+    else:
+        result = execute(payload)
+        print(json.dumps(result))
+    return 0 if result["status"] == "success" else 1
 
 
 if __name__ == "__main__":
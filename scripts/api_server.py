@@ -14,25 +14,41 @@ FastAPI 后端：为 Platform IDE 暴露大纲与章节生成流水线的 HTTP 
 
 from __future__ import annotations
 
+import ast
 import asyncio
+import gzip
+import hashlib
+import heapq
+import hmac
+import itertools
 import json
 import logging
+import mmap
 import os
 import re
+import signal
+import sqlite3
+import struct
+import subprocess
 import sys
-from contextlib import suppress
+import threading
+import zlib
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, suppress
 from dataclasses import dataclass, field
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
 import time
-from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Iterable, List, NamedTuple, Optional, Tuple
 from uuid import uuid4
 
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 
+from scripts.common.progress import PROGRESS_ENV, PROGRESS_PREFIX
 from scripts.common.utils import repo_root, slugify
+from scripts.pipelines.pipeline_worker import READY_MARKER as PIPELINE_WORKER_READY
 
 # ----------------------------
 # 基础配置
@@ -51,6 +67,8 @@ OUTLINE_SCRIPT = REPO_ROOT / "scripts" / "pipelines" / "langgraph" / "integrated
 CHAPTER_SCRIPT = (
     REPO_ROOT / "scripts" / "pipelines" / "generation" / "generate_chapters_from_integrated_standalone.py"
 )
+# 大纲任务的日志文件目录：启动时即确定路径，重启后据此重新跟踪遗留的子进程
+OUTLINE_LOG_DIR = REPO_ROOT / "output" / "integrated_pipeline"
 EXECUTION_OUTPUT_LIMIT = 10_000
 DEFAULT_EXECUTION_TIMEOUT = 10.0
 MAX_EXECUTION_TIMEOUT = 30.0
@@ -59,19 +77,87 @@ CHINA_TZ = timezone(timedelta(hours=8))
 
 JOBS_STATE_DIR = REPO_ROOT / "output" / "pipeline_jobs"
 JOBS_STATE_FILE = JOBS_STATE_DIR / "jobs.json"
+JOBS_JOURNAL_FILE = JOBS_STATE_DIR / "jobs.journal.jsonl"
+JOBS_INDEX_FILE = JOBS_STATE_DIR / "jobs.index.json"
+JOBS_SQLITE_FILE = JOBS_STATE_DIR / "jobs.sqlite3"
+JOBS_ARCHIVE_DIR = JOBS_STATE_DIR / "archive"
+# 任务存储后端：journal（默认，jobs.json + 追加日志）或 sqlite
+JOBS_STORE = (os.environ.get("JOBS_STORE") or "journal").strip().lower()
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name) or default)
+    except (TypeError, ValueError):
+        return default
+
+
+def _try_parse_int(value: Any) -> Optional[int]:
+    try:
+        if value is None:
+            return None
+        return int(value)
+    except Exception:
+        return None
+
+
+# 追加日志累计多少条记录后压缩回 jobs.json 快照
+JOBS_JOURNAL_COMPACT_EVERY = max(1, _env_int("JOBS_JOURNAL_COMPACT_EVERY", 500))
+# 任务状态落盘的合并窗口：窗口内的多次变更只写一次，且在线程池中执行
+JOBS_PERSIST_DEBOUNCE = max(0, _env_int("JOBS_PERSIST_DEBOUNCE_MS", 250)) / 1000.0
+# 落盘失败后的重试间隔（秒）；未写出的任务保留在待落盘集合中
+JOBS_PERSIST_RETRY = 5.0
+# 热数据保留策略（默认关闭）：超过条数上限或早于天数上限的已结束任务归档到 archive/，
+# 归档后不再出现在任务列表与 latest 中，但仍可按 id 查询（0 表示不限制）
+JOBS_RETENTION_MAX = max(0, _env_int("JOBS_RETENTION_MAX", 0))
+JOBS_RETENTION_DAYS = max(0, _env_int("JOBS_RETENTION_DAYS", 0))
+# 每个任务在内存中保留的最近事件条数，供 SSE 断线重连（Last-Event-ID）补发
+JOB_EVENT_BUFFER = max(0, _env_int("JOB_EVENT_BUFFER", 1000))
+# 任务结束后事件缓冲再保留的秒数，供刚断线的客户端续传，之后释放（0 表示一直保留）
+JOB_EVENT_RETAIN_S = max(0, _env_int("JOB_EVENT_RETAIN_S", 300))
+# 日志突发时合并推送的窗口：窗口内的多条日志事件拼成一次写出（0 表示逐条推送）
+SSE_LOG_BATCH = max(0, _env_int("SSE_LOG_BATCH_MS", 5)) / 1000.0
+# 每个 SSE 订阅者的待发送队列长度；队列满时丢弃新事件并在恢复后补发 gap 事件
+SSE_QUEUE_SIZE = max(2, _env_int("SSE_QUEUE_SIZE", 512))
+# 队列持续处于满载超过该秒数的订阅者被断开（0 表示从不断开），客户端可凭 Last-Event-ID 重连
+SSE_EVICT_AFTER = max(0, _env_int("SSE_EVICT_AFTER_S", 30))
+# 连接空闲时发送心跳注释的间隔（秒）
+SSE_HEARTBEAT = max(1, _env_int("SSE_HEARTBEAT_S", 20))
+
+# 日志事件的详细程度：订阅者通过 ?logs= 选择，只接收不高于所选级别的日志；非日志事件总是推送
+LOG_LEVELS = {"progress": 0, "info": 1, "all": 2}
+LOG_PROGRESS, LOG_INFO, LOG_ALL = 0, 1, 2
 
 
 # ----------------------------
 # Job & Stage 数据结构
 # ----------------------------
 
-@dataclass
+# 尚未结束的任务状态：queued 表示在调度队列中等待启动
+_ACTIVE_STATUSES = frozenset({"queued", "running"})
+
+# 全局单调递增的版本号：任何可序列化字段变化都会换一个新版本，缓存的序列化结果据此失效
+_VERSIONS = itertools.count(1)
+# 不参与序列化的字段，修改时不需要让缓存失效
+_UNVERSIONED_FIELDS = frozenset({"process", "subscribers", "events", "event_seq", "_version", "_cache"})
+# SSE 事件 id 的前缀：事件序号只在本进程内有效，服务重启后旧 id 不能用于续传
+_EVENT_EPOCH = uuid4().hex[:8]
+
+
+@dataclass(slots=True)
 class StageState:
     id: str
     label: str
     status: str = "pending"
     progress: Optional[float] = None
     detail: Optional[str] = None
+    _version: int = field(default_factory=lambda: next(_VERSIONS), init=False, repr=False, compare=False)
+    _cache: Optional[Tuple[int, Dict[str, Any]]] = field(default=None, init=False, repr=False, compare=False)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        object.__setattr__(self, name, value)
+        if name not in _UNVERSIONED_FIELDS:
+            object.__setattr__(self, "_version", next(_VERSIONS))
 
     def apply(self, patch: Dict[str, Any]) -> None:
         if "label" in patch and patch["label"]:
@@ -92,6 +178,10 @@ class StageState:
             self.detail = None if detail is None else str(detail)
 
     def to_dict(self) -> Dict[str, Any]:
+        """返回缓存的序列化结果；调用方不得修改返回的字典。"""
+        cache = self._cache
+        if cache is not None and cache[0] == self._version:
+            return cache[1]
         data: Dict[str, Any] = {
             "id": self.id,
             "label": self.label,
@@ -101,6 +191,7 @@ class StageState:
             data["progress"] = self.progress
         if self.detail is not None:
             data["detail"] = self.detail
+        self._cache = (self._version, data)
         return data
 
 
@@ -112,7 +203,7 @@ def _default_stages() -> Dict[str, StageState]:
     }
 
 
-@dataclass
+@dataclass(slots=True)
 class JobRecord:
     id: str
     type: str  # outline | content
@@ -124,16 +215,50 @@ class JobRecord:
     expected_content: Optional[str] = None
     output_path: Optional[str] = None
     log_path: Optional[str] = None
+    # 启动时日志文件的大小：章节日志跨任务追加，本任务的内容从这里开始
+    log_offset: Optional[int] = None
     total_to_fetch: Optional[int] = None
     processed: Optional[int] = None
     pid: Optional[int] = None
+    # 子进程的启动时间（/proc/<pid>/stat 的 starttime），重启后据此确认 pid 仍是同一个进程
+    pid_start: Optional[int] = None
     stages: Dict[str, StageState] = field(default_factory=_default_stages)
     consumed: bool = False
     process: Optional[asyncio.subprocess.Process] = None
-    subscribers: Dict[str, "asyncio.Queue[Dict[str, Any]]"] = field(default_factory=dict)
+    subscribers: Dict[str, "_Subscriber"] = field(default_factory=dict)
+    # 最近的 (序号, 事件名, 已编码的 SSE 帧, 日志级别)，环形缓冲
+    events: Deque[Tuple[int, str, bytes, int]] = field(
+        default_factory=lambda: deque(maxlen=JOB_EVENT_BUFFER), repr=False, compare=False
+    )
+    event_seq: int = field(default=0, repr=False, compare=False)
+    _version: int = field(default_factory=lambda: next(_VERSIONS), init=False, repr=False, compare=False)
+    # kind -> (版本键, 序列化结果)
+    _cache: Dict[str, Tuple[Any, Dict[str, Any]]] = field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        object.__setattr__(self, name, value)
+        if name not in _UNVERSIONED_FIELDS:
+            object.__setattr__(self, "_version", next(_VERSIONS))
+
+    def _version_key(self) -> Tuple[int, Tuple[int, ...]]:
+        # stages 字典可能被原地增删，阶段自身也有独立版本，三者一起决定缓存是否有效
+        return self._version, tuple(stage._version for stage in self.stages.values())
+
+    def _cached(self, kind: str) -> Tuple[Any, Optional[Dict[str, Any]]]:
+        key = self._version_key()
+        hit = self._cache.get(kind)
+        if hit is not None and hit[0] == key:
+            return key, hit[1]
+        return key, None
 
     def snapshot(self) -> Dict[str, Any]:
-        return {
+        """返回缓存的快照；调用方不得修改返回的字典。"""
+        key, data = self._cached("snapshot")
+        if data is not None:
+            return data
+        data = {
             "id": self.id,
             "type": self.type,
             "status": self.status,
@@ -144,21 +269,629 @@ class JobRecord:
             "expectedContent": self.expected_content,
             "outputPath": self.output_path,
             "logPath": self.log_path,
+            "logOffset": self.log_offset,
             "stages": {key: stage.to_dict() for key, stage in self.stages.items()},
             "consumed": self.consumed,
         }
+        self._cache["snapshot"] = (key, data)
+        return data
+
+    def payload(self) -> Dict[str, Any]:
+        """对外接口使用的任务信息（快照 + 进程与进度计数）。"""
+        key, data = self._cached("payload")
+        if data is not None:
+            return data
+        data = dict(self.snapshot())
+        data["pid"] = self.pid
+        data["totalToFetch"] = self.total_to_fetch
+        data["processed"] = self.processed
+        self._cache["payload"] = (key, data)
+        return data
+
+    def record(self) -> Dict[str, Any]:
+        """持久化使用的任务记录（payload + ISO 时间）。"""
+        key, data = self._cached("record")
+        if data is not None:
+            return data
+        data = dict(self.payload())
+        # 直接从北京时间戳转换为北京时间
+        start_dt = datetime.fromtimestamp(self.start_ts, tz=CHINA_TZ)
+        data["startTimeIso"] = start_dt.isoformat()
+        data["pidStart"] = self.pid_start
+        if self.end_ts is not None:
+            end_dt = datetime.fromtimestamp(self.end_ts, tz=CHINA_TZ)
+            data["endTimeIso"] = end_dt.isoformat()
+        self._cache["record"] = (key, data)
+        return data
 
 
 def _make_job_id(prefix: str) -> str:
     return f"{prefix}-{int(datetime.now(CHINA_TZ).timestamp() * 1000)}-{uuid4().hex[:6]}"
 
 
+class _JobSummary(NamedTuple):
+    """启动时只加载的任务索引项，完整记录按需从快照中读取。"""
+
+    id: str
+    type: str
+    status: str
+    start_ts: float
+    consumed: bool
+
+
+def _summary_from_dict(item: Dict[str, Any]) -> _JobSummary:
+    try:
+        start_ts = float(item.get("startTs") or 0)
+    except (TypeError, ValueError):
+        start_ts = 0.0
+    return _JobSummary(
+        id=str(item["id"]),
+        type=str(item.get("type") or "outline"),
+        status=str(item.get("status") or "running"),
+        start_ts=start_ts,
+        consumed=bool(item.get("consumed")),
+    )
+
+
+class _JobJournal:
+    """jobs.json 快照 + jobs.journal.jsonl 追加日志。
+
+    每次变更只向日志追加一行该任务的最新记录；累计条数超过阈值后整体压缩为快照并清空日志。
+    快照每行一个任务，压缩时同时写出 jobs.index.json（摘要 + 字节偏移），启动时只读索引，
+    完整记录在首次访问时按偏移读取；索引缺失或与快照不一致时退回整体解析。
+    恢复时先读快照，再按顺序重放日志（同一任务以最后一条为准）。
+    """
+
+    indexed = False
+    _INDEX_VERSION = 1
+
+    def __init__(self, snapshot_path: Path, journal_path: Path, compact_every: int) -> None:
+        self._snapshot_path = snapshot_path
+        self._journal_path = journal_path
+        self._index_path = snapshot_path.with_name(JOBS_INDEX_FILE.name)
+        self._compact_every = compact_every
+        self._entries = 0
+        # 快照中各任务的 (offset, length)；压缩后整体替换
+        self._offsets: Dict[str, Tuple[int, int]] = {}
+        # 旧格式快照没有索引，需要尽快压缩一次补齐
+        self._stale = False
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger("JobJournal")
+
+    @property
+    def needs_compaction(self) -> bool:
+        return self._stale or self._entries >= self._compact_every
+
+    def load(self) -> Tuple[List[Dict[str, Any]], List[_JobSummary]]:
+        """返回 (需要立即加载的完整记录, 仅索引的任务摘要)。"""
+        records: Dict[str, Dict[str, Any]] = {}
+        summaries: Dict[str, _JobSummary] = {}
+        if self._snapshot_path.exists():
+            loaded = self._load_index()
+            if loaded is not None:
+                summaries = loaded
+            else:
+                self._stale = True
+                records = self._load_snapshot()
+
+        self._entries = 0
+        if self._journal_path.exists():
+            try:
+                with self._journal_path.open("r", encoding="utf-8") as fh:
+                    for lineno, line in enumerate(fh, start=1):
+                        if not line.strip():
+                            continue
+                        self._entries += 1
+                        try:
+                            entry = json.loads(line)
+                        except json.JSONDecodeError:
+                            # 进程崩溃可能留下半行，忽略即可
+                            self._logger.warning("Skipping corrupt journal line %d", lineno)
+                            continue
+                        self._replay(records, summaries, entry)
+            except Exception as exc:
+                self._logger.warning("Failed to replay jobs journal: %s", exc)
+        return list(records.values()), list(summaries.values())
+
+    def _load_index(self) -> Optional[Dict[str, _JobSummary]]:
+        try:
+            index = json.loads(self._index_path.read_text(encoding="utf-8"))
+            stat = self._snapshot_path.stat()
+        except (OSError, ValueError):
+            return None
+        if (
+            not isinstance(index, dict)
+            or index.get("version") != self._INDEX_VERSION
+            or index.get("size") != stat.st_size
+            or index.get("mtimeNs") != stat.st_mtime_ns
+        ):
+            return None
+        summaries: Dict[str, _JobSummary] = {}
+        offsets: Dict[str, Tuple[int, int]] = {}
+        try:
+            for job_id, job_type, status, start_ts, consumed, offset, length in index.get("jobs") or []:
+                summaries[job_id] = _JobSummary(job_id, job_type, status, float(start_ts), bool(consumed))
+                offsets[job_id] = (int(offset), int(length))
+        except (TypeError, ValueError):
+            return None
+        self._offsets = offsets
+        return summaries
+
+    def _load_snapshot(self) -> Dict[str, Dict[str, Any]]:
+        records: Dict[str, Dict[str, Any]] = {}
+        try:
+            items = json.loads(self._snapshot_path.read_text(encoding="utf-8"))
+        except Exception as exc:
+            self._logger.warning("Failed to load jobs snapshot: %s", exc)
+            return records
+        if isinstance(items, list):
+            for item in items:
+                if isinstance(item, dict) and item.get("id"):
+                    records[str(item["id"])] = item
+        return records
+
+    @staticmethod
+    def _replay(
+        records: Dict[str, Dict[str, Any]],
+        summaries: Dict[str, _JobSummary],
+        entry: Any,
+    ) -> None:
+        if not isinstance(entry, dict):
+            return
+        op = entry.get("op")
+        if op == "put":
+            job = entry.get("job")
+            if isinstance(job, dict) and job.get("id"):
+                records[str(job["id"])] = job
+                summaries.pop(str(job["id"]), None)
+        elif op == "del":
+            records.pop(str(entry.get("id")), None)
+            summaries.pop(str(entry.get("id")), None)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            span = self._offsets.get(job_id)
+            if span is None:
+                return None
+            try:
+                with self._snapshot_path.open("rb") as fh:
+                    fh.seek(span[0])
+                    raw = fh.read(span[1])
+            except OSError as exc:
+                self._logger.warning("Failed to read job %s from snapshot: %s", job_id, exc)
+                return None
+        try:
+            item = json.loads(raw)
+        except ValueError:
+            return None
+        return item if isinstance(item, dict) else None
+
+    def append(self, items: List[Dict[str, Any]]) -> None:
+        if not items:
+            return
+        lines = "".join(
+            json.dumps({"op": "put", "job": item}, ensure_ascii=False) + "\n" for item in items
+        )
+        self._journal_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._journal_path.open("a", encoding="utf-8") as fh:
+            fh.write(lines)
+        self._entries += len(items)
+
+    def remove(self, job_ids: List[str]) -> None:
+        if not job_ids:
+            return
+        lines = "".join(json.dumps({"op": "del", "id": job_id}) + "\n" for job_id in job_ids)
+        self._journal_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._journal_path.open("a", encoding="utf-8") as fh:
+            fh.write(lines)
+        self._entries += len(job_ids)
+
+    def compact(self, items: List[Dict[str, Any]], carry: Iterable[_JobSummary] = ()) -> None:
+        """写出新快照与索引；carry 中尚未加载的任务直接从旧快照按偏移拷贝原始字节。"""
+        self._snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self._snapshot_path.with_suffix(".json.tmp")
+        with self._lock:
+            rows: List[List[Any]] = []
+            offsets: Dict[str, Tuple[int, int]] = {}
+            old = self._snapshot_path.open("rb") if self._offsets and self._snapshot_path.exists() else None
+            try:
+                with tmp_path.open("wb") as out:
+                    out.write(b"[\n")
+                    first = True
+
+                    def write_row(summary: _JobSummary, raw: bytes) -> None:
+                        nonlocal first
+                        if not first:
+                            out.write(b",\n")
+                        first = False
+                        offset = out.tell()
+                        out.write(raw)
+                        offsets[summary.id] = (offset, len(raw))
+                        rows.append(
+                            [summary.id, summary.type, summary.status, summary.start_ts,
+                             summary.consumed, offset, len(raw)]
+                        )
+
+                    for summary in carry:
+                        span = self._offsets.get(summary.id)
+                        if old is None or span is None:
+                            continue
+                        old.seek(span[0])
+                        write_row(summary, old.read(span[1]))
+                    for item in items:
+                        write_row(_summary_from_dict(item), json.dumps(item, ensure_ascii=False).encode("utf-8"))
+                    out.write(b"\n]\n")
+            finally:
+                if old is not None:
+                    old.close()
+            os.replace(tmp_path, self._snapshot_path)
+            stat = self._snapshot_path.stat()
+            index = {
+                "version": self._INDEX_VERSION,
+                "size": stat.st_size,
+                "mtimeNs": stat.st_mtime_ns,
+                "jobs": rows,
+            }
+            index_tmp = self._index_path.with_suffix(".json.tmp")
+            index_tmp.write_text(json.dumps(index, ensure_ascii=False), encoding="utf-8")
+            os.replace(index_tmp, self._index_path)
+            self._offsets = offsets
+            self._stale = False
+        # 快照落盘后再清空日志；两步之间崩溃时重放日志也是幂等的
+        with suppress(FileNotFoundError):
+            self._journal_path.unlink()
+        self._entries = 0
+
+
+def _job_cursor(start_ts: float, job_id: str) -> str:
+    return f"{start_ts!r}:{job_id}"
+
+
+def _parse_job_cursor(cursor: Optional[str]) -> Optional[Tuple[float, str]]:
+    if not cursor:
+        return None
+    ts_text, sep, job_id = cursor.partition(":")
+    if not sep:
+        return None
+    try:
+        return float(ts_text), job_id
+    except ValueError:
+        return None
+
+
+class _SqliteJobStore:
+    """基于标准库 sqlite3（WAL 模式）的任务存储。
+
+    启动时只加载运行中的任务，历史任务按需读取；列表与 latest 查询走 (type, consumed, start_ts) 索引。
+    """
+
+    indexed = True
+    needs_compaction = False
+
+    def __init__(self, db_path: Path) -> None:
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger("SqliteJobStore")
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                type TEXT NOT NULL,
+                status TEXT NOT NULL,
+                consumed INTEGER NOT NULL DEFAULT 0,
+                start_ts REAL NOT NULL,
+                payload TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_type_consumed_start ON jobs (type, consumed, start_ts, id);
+            CREATE INDEX IF NOT EXISTS idx_jobs_type_start ON jobs (type, start_ts, id);
+            CREATE INDEX IF NOT EXISTS idx_jobs_start ON jobs (start_ts, id);
+            CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status);
+            """
+        )
+        self._import_legacy()
+
+    def _import_legacy(self) -> None:
+        """首次启用时把 jobs.json / 追加日志中的历史任务导入数据库。"""
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM jobs LIMIT 1").fetchone()
+        if row is not None:
+            return
+        journal = _JobJournal(JOBS_STATE_FILE, JOBS_JOURNAL_FILE, JOBS_JOURNAL_COMPACT_EVERY)
+        records, summaries = journal.load()
+        legacy = records + [item for item in map(journal.get, (summary.id for summary in summaries)) if item]
+        if legacy:
+            self.append(legacy)
+            self._logger.info("Imported %d jobs from %s", len(legacy), JOBS_STATE_FILE)
+
+    @staticmethod
+    def _row(item: Dict[str, Any]) -> Tuple[Any, ...]:
+        start_ts = item.get("startTs")
+        try:
+            start_ts_val = float(start_ts)
+        except (TypeError, ValueError):
+            start_ts_val = 0.0
+        return (
+            str(item.get("id")),
+            str(item.get("type") or "outline"),
+            str(item.get("status") or "running"),
+            1 if item.get("consumed") else 0,
+            start_ts_val,
+            json.dumps(item, ensure_ascii=False),
+        )
+
+    def load(self) -> Tuple[List[Dict[str, Any]], List[_JobSummary]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT payload FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+        return [json.loads(row[0]) for row in rows], []
+
+    def append(self, items: List[Dict[str, Any]]) -> None:
+        if not items:
+            return
+        rows = [self._row(item) for item in items if item.get("id")]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO jobs (id, type, status, consumed, start_ts, payload) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def compact(self, items: List[Dict[str, Any]], carry: Iterable[_JobSummary] = ()) -> None:
+        self.append(items)
+
+    def remove(self, job_ids: List[str]) -> None:
+        if not job_ids:
+            return
+        with self._lock:
+            self._conn.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in job_ids])
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT payload FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def expired(self, max_jobs: int, cutoff: Optional[float]) -> List[Dict[str, Any]]:
+        """超出保留策略的已结束任务：总数超过 max_jobs 时最旧的若干条，以及早于 cutoff 的全部。"""
+        finished = "status NOT IN ('queued', 'running')"
+        rows: List[Tuple[str]] = []
+        with self._lock:
+            if max_jobs:
+                (total,) = self._conn.execute("SELECT COUNT(*) FROM jobs").fetchone()
+                if total > max_jobs:
+                    rows.extend(
+                        self._conn.execute(
+                            f"SELECT payload FROM jobs WHERE {finished} ORDER BY start_ts ASC, id ASC LIMIT ?",
+                            (total - max_jobs,),
+                        ).fetchall()
+                    )
+            if cutoff is not None:
+                rows.extend(
+                    self._conn.execute(
+                        f"SELECT payload FROM jobs WHERE {finished} AND start_ts < ?", (cutoff,)
+                    ).fetchall()
+                )
+        items = (json.loads(row[0]) for row in rows)
+        return list({str(item["id"]): item for item in items if isinstance(item, dict) and item.get("id")}.values())
+
+    def query(
+        self,
+        *,
+        job_type: Optional[str] = None,
+        include_consumed: bool = True,
+        limit: Optional[int] = None,
+        cursor: Optional[Tuple[float, str]] = None,
+    ) -> List[Dict[str, Any]]:
+        clauses: List[str] = []
+        params: List[Any] = []
+        if job_type:
+            clauses.append("type = ?")
+            params.append(job_type)
+        if not include_consumed:
+            clauses.append("consumed = 0")
+        if cursor is not None:
+            clauses.append("(start_ts < ? OR (start_ts = ? AND id < ?))")
+            params.extend([cursor[0], cursor[0], cursor[1]])
+        sql = "SELECT payload FROM jobs"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY start_ts DESC, id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+
+class _JobArchive:
+    """按月归档已淘汰的任务：archive/jobs-YYYY-MM.jsonl.gz，按需读取。"""
+
+    _CACHE_SIZE = 4
+
+    def __init__(self, archive_dir: Path) -> None:
+        self._dir = archive_dir
+        self._logger = logging.getLogger("JobArchive")
+        # path -> (mtime, {job_id: record})，避免重复解压同一个月份文件
+        self._cache: Dict[Path, Tuple[float, Dict[str, Dict[str, Any]]]] = {}
+
+    def _path_for_ts(self, ts: float) -> Path:
+        month = datetime.fromtimestamp(ts, tz=CHINA_TZ).strftime("%Y-%m")
+        return self._dir / f"jobs-{month}.jsonl.gz"
+
+    def write(self, items: List[Dict[str, Any]]) -> None:
+        grouped: Dict[Path, List[Dict[str, Any]]] = {}
+        for item in items:
+            try:
+                ts = float(item.get("startTs") or 0)
+            except (TypeError, ValueError):
+                ts = 0.0
+            grouped.setdefault(self._path_for_ts(ts), []).append(item)
+        self._dir.mkdir(parents=True, exist_ok=True)
+        for path, group in grouped.items():
+            lines = "".join(json.dumps(item, ensure_ascii=False) + "\n" for item in group)
+            # gzip 追加写入会产生多成员文件，gzip.open 读取时会自动拼接
+            with gzip.open(path, "at", encoding="utf-8") as fh:
+                fh.write(lines)
+            self._cache.pop(path, None)
+
+    def _read(self, path: Path) -> Dict[str, Dict[str, Any]]:
+        try:
+            mtime = path.stat().st_mtime
+        except FileNotFoundError:
+            return {}
+        cached = self._cache.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        records: Dict[str, Dict[str, Any]] = {}
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as fh:
+                for line in fh:
+                    with suppress(json.JSONDecodeError):
+                        item = json.loads(line)
+                        if isinstance(item, dict) and item.get("id"):
+                            records[str(item["id"])] = item
+        except (OSError, EOFError) as exc:
+            self._logger.warning("Failed to read job archive %s: %s", path, exc)
+        if len(self._cache) >= self._CACHE_SIZE:
+            self._cache.pop(next(iter(self._cache)))
+        self._cache[path] = (mtime, records)
+        return records
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        # 任务 ID 形如 outline-<毫秒时间戳>-<hex>，可直接定位月份文件
+        parts = job_id.split("-")
+        if len(parts) >= 3 and parts[-2].isdigit():
+            return self._read(self._path_for_ts(int(parts[-2]) / 1000)).get(job_id)
+        if not self._dir.exists():
+            return None
+        for path in sorted(self._dir.glob("jobs-*.jsonl.gz"), reverse=True):
+            item = self._read(path).get(job_id)
+            if item:
+                return item
+        return None
+
+
+def _make_job_store() -> Any:
+    if JOBS_STORE == "sqlite":
+        return _SqliteJobStore(JOBS_SQLITE_FILE)
+    return _JobJournal(JOBS_STATE_FILE, JOBS_JOURNAL_FILE, JOBS_JOURNAL_COMPACT_EVERY)
+
+
+@dataclass(slots=True)
+class _LogBatch:
+    job: JobRecord
+    # (日志级别, 帧)
+    frames: List[Tuple[int, bytes]] = field(default_factory=list)
+    first_seq: int = 0
+    last_seq: int = 0
+    handle: Optional[asyncio.TimerHandle] = None
+
+
+# 订阅者队列中的一项：(首个序号, 最后序号, 事件名, 已编码的 SSE 帧)，同一帧在所有订阅者间共享
+_QueuedFrame = Tuple[int, int, str, bytes]
+# 会转发到多任务复用流的任务事件（日志不转发）
+_MULTIPLEXED_EVENTS = frozenset({"stage", "queue", "file", "end"})
+# 心跳与断开通知也走同一个队列，流循环只需等待 queue.get()
+_PING_FRAME: _QueuedFrame = (0, 0, "ping", b": ping\n\n")
+_CLOSE_FRAME: _QueuedFrame = (0, 0, "close", b"")
+
+
+@dataclass(slots=True)
+class _Subscriber:
+    id: str
+    job_id: str
+    queue: "asyncio.Queue[_QueuedFrame]"
+    verbosity: int = LOG_INFO
+    connected_at: float = field(default_factory=time.monotonic)
+    delivered: int = 0
+    last_seq: int = 0
+    max_lag: int = 0
+    dropped_total: int = 0
+    # 尚未通知客户端的丢弃区间
+    gap_from: Optional[int] = None
+    gap_to: int = 0
+    saturated_since: Optional[float] = None
+    evicted: bool = False
+    # 仅用于多任务复用流（/api/pipeline/events）：关注的任务 id 与类型，None 表示不限
+    job_ids: Optional[frozenset] = None
+    job_type: Optional[str] = None
+
+    def wants(self, job_id: str, job_type: str) -> bool:
+        if self.job_ids is not None and job_id not in self.job_ids:
+            return False
+        return self.job_type is None or self.job_type == job_type
+
+    def ping(self) -> None:
+        # 队列里还有待发送的数据时连接本身就不空闲，不必再插心跳
+        if self.queue.empty():
+            self.queue.put_nowait(_PING_FRAME)
+
+    def close(self) -> None:
+        """客户端已断开：积压的数据不再有意义，必要时挤掉一条以放入关闭通知。"""
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(_CLOSE_FRAME)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "jobId": self.job_id,
+            "logs": next(name for name, level in LOG_LEVELS.items() if level == self.verbosity),
+            "connectedSeconds": round(time.monotonic() - self.connected_at, 3),
+            "lag": self.queue.qsize(),
+            "maxLag": self.max_lag,
+            "delivered": self.delivered,
+            "lastEventId": _event_id(self.last_seq) if self.last_seq else None,
+            "dropped": self.dropped_total,
+            "pendingGap": (self.gap_to - self.gap_from + 1) if self.gap_from is not None else 0,
+            "saturatedSeconds": (
+                round(time.monotonic() - self.saturated_since, 3) if self.saturated_since is not None else 0
+            ),
+        }
+
+
 class JobManager:
     def __init__(self) -> None:
         self._jobs: Dict[str, JobRecord] = {}
+        # 只加载了索引、尚未解析完整记录的任务，首次访问时再读取
+        self._index: Dict[str, _JobSummary] = {}
         self._logger = logging.getLogger("JobManager")
+        self._store = _make_job_store()
+        self._archive = _JobArchive(JOBS_ARCHIVE_DIR)
+        # 待落盘的任务：由后台任务在合并窗口结束后统一写出
+        self._dirty: Dict[str, JobRecord] = {}
+        # 已从热数据中淘汰、等待写入归档的任务记录
+        self._evicted: Dict[str, Dict[str, Any]] = {}
+        self._flush_task: Optional[asyncio.Task[None]] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        # 线程池写盘与同步写盘（无事件循环 / 关闭时）之间的互斥
+        self._io_lock = threading.Lock()
+        # 尚未推送的日志帧：job id -> 批次，合并窗口结束或有非日志事件时一次推送
+        self._log_batches: Dict[str, _LogBatch] = {}
+        # 多任务复用流的订阅者，以及它们共享的全局事件序号与补发缓冲
+        self._watchers: Dict[str, _Subscriber] = {}
+        self._watch_seq = 0
+        self._watch_events: Deque[Tuple[int, str, bytes, str, str]] = deque(maxlen=JOB_EVENT_BUFFER)
+        # 待推送的任务列表增量：job id -> (类型, 任务；None 表示已移出列表)，同一轮事件循环内合并
+        self._job_deltas: Dict[str, Tuple[str, Optional[JobRecord]]] = {}
+        self._job_delta_handle: Optional[asyncio.Handle] = None
+        # 每个任务最近一次推送的 payload（缓存对象），未变化时不重复推送
+        self._job_delta_sent: Dict[str, Dict[str, Any]] = {}
+        # 已断开的订阅者累计数据，供 metrics 接口
+        self._stream_totals = {"evicted": 0, "dropped": 0, "delivered": 0, "closed": 0}
+        # 启动时只读索引、不重写文件；保留策略在应用启动后（start）再执行
         self._load_jobs_from_disk()
-        self._persist_jobs()
+
+    def start(self) -> None:
+        self._enforce_retention()
 
     def create_job(
         self,
@@ -167,53 +900,436 @@ class JobManager:
         subject: Optional[str] = None,
         learning_style: Optional[str] = None,
         expected_content: Optional[str] = None,
+        status: str = "running",
     ) -> JobRecord:
         job_id = _make_job_id(job_type)
         job = JobRecord(
             id=job_id,
             type=job_type,
+            status=status,
             subject=subject,
             learning_style=learning_style,
             expected_content=expected_content,
         )
         self._jobs[job_id] = job
-        self._persist_jobs()
+        self._persist_job(job)
         return job
 
     def get(self, job_id: str) -> Optional[JobRecord]:
-        return self._jobs.get(job_id)
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        if job_id in self._index:
+            return self._hydrate(job_id)
+        item, _ = self._load_cold(job_id)
+        return _job_from_dict(item) if item else None
+
+    def _load_cold(self, job_id: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """读取不在内存中的任务记录，返回 (记录, 是否已归档或等待归档)。"""
+        item = self._evicted.get(job_id)
+        if item is not None:
+            return item, True
+        try:
+            if self._store.indexed:
+                item = self._store.get(job_id)
+                if item is not None:
+                    return item, False
+            return self._archive.get(job_id), True
+        except Exception as exc:
+            self._logger.warning("Failed to load job %s: %s", job_id, exc)
+            return None, False
+
+    def active_jobs(self) -> List[JobRecord]:
+        for summary in [item for item in self._index.values() if item.status in _ACTIVE_STATUSES]:
+            self._hydrate(summary.id)
+        return [job for job in self._jobs.values() if job.status in _ACTIVE_STATUSES]
+
+    def _hydrate(self, job_id: str) -> Optional[JobRecord]:
+        summary = self._index.pop(job_id)
+        try:
+            item = self._store.get(job_id)
+            job = _job_from_dict(item) if item else None
+        except Exception as exc:
+            self._logger.warning("Failed to load job %s: %s", job_id, exc)
+            job = None
+        if job is None:
+            self._index[job_id] = summary
+            return None
+        self._jobs[job_id] = job
+        return job
 
     def finish(self, job: JobRecord, status: str) -> None:
         job.status = status
         job.end_ts = datetime.now(CHINA_TZ).timestamp()
-        self._persist_jobs()
+        # 子进程句柄在结束后即释放；订阅者在广播 end 事件后释放
+        job.process = None
+        self._release_events_later(job)
+        self._persist_job(job, immediate=True)
+        self._enforce_retention()
+
+    def _release_events_later(self, job: JobRecord) -> None:
+        """已结束任务的事件缓冲只在宽限期内保留；释放后重连的客户端退回完整快照。"""
+        if not JOB_EVENT_RETAIN_S:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        loop.call_later(JOB_EVENT_RETAIN_S, job.events.clear)
+
+    def _enforce_retention(self) -> None:
+        """把超出保留策略的已结束任务移出热数据，交给后台写入归档。"""
+        if not JOBS_RETENTION_MAX and not JOBS_RETENTION_DAYS:
+            return
+        if self._store.indexed:
+            self._enforce_store_retention()
+            return
+        finished: List[Any] = [job for job in self._jobs.values() if job.status not in _ACTIVE_STATUSES]
+        finished.extend(summary for summary in self._index.values() if summary.status not in _ACTIVE_STATUSES)
+        if not finished:
+            return
+        finished.sort(key=lambda job: job.start_ts, reverse=True)
+        victims: Dict[str, Any] = {}
+        if JOBS_RETENTION_DAYS:
+            cutoff = datetime.now(CHINA_TZ).timestamp() - JOBS_RETENTION_DAYS * 86400
+            victims.update((job.id, job) for job in finished if job.start_ts < cutoff)
+        total = len(self._jobs) + len(self._index)
+        if JOBS_RETENTION_MAX and total > JOBS_RETENTION_MAX:
+            overflow = total - JOBS_RETENTION_MAX
+            victims.update((job.id, job) for job in finished[-overflow:])
+        if not victims:
+            return
+        for victim in victims.values():
+            if self._watchers:
+                self._queue_job_delta(victim.id, victim.type, None)
+            if isinstance(victim, _JobSummary):
+                # 读不到完整记录时留在索引中，下次再处理，不能从快照里丢掉
+                item = self._store.get(victim.id)
+                if item:
+                    self._index.pop(victim.id, None)
+                    self._evicted[victim.id] = item
+                continue
+            self._evict_job(victim)
+        self._logger.info("Archiving %d jobs beyond retention", len(victims))
+        self._flush_soon()
+
+    def _enforce_store_retention(self) -> None:
+        """SQLite 存储只在内存中保留运行中的任务，保留策略按库中的全部任务计算。"""
+        cutoff = (
+            datetime.now(CHINA_TZ).timestamp() - JOBS_RETENTION_DAYS * 86400 if JOBS_RETENTION_DAYS else None
+        )
+        try:
+            items = self._store.expired(JOBS_RETENTION_MAX, cutoff)
+        except Exception as exc:
+            self._logger.warning("Failed to query expired jobs: %s", exc)
+            return
+        archived = 0
+        for item in items:
+            job_id = str(item["id"])
+            if job_id in self._evicted:
+                continue
+            job = self._jobs.get(job_id)
+            if job is not None:
+                # 内存中的状态可能比库中新（例如刚结束尚未落盘的任务仍显示为 running）
+                if job.status in _ACTIVE_STATUSES:
+                    continue
+                self._evict_job(job)
+            else:
+                self._evicted[job_id] = item
+            if self._watchers:
+                self._queue_job_delta(job_id, str(item.get("type") or "outline"), None)
+            archived += 1
+        if archived:
+            self._logger.info("Archiving %d jobs beyond retention", archived)
+            self._flush_soon()
+
+    def _evict_job(self, job: JobRecord) -> None:
+        self._jobs.pop(job.id, None)
+        self._dirty.pop(job.id, None)
+        job.subscribers.clear()
+        self._evicted[job.id] = self._serialize_job(job)
+
+    def _flush_soon(self) -> None:
+        try:
+            asyncio.get_running_loop().create_task(self.flush())
+        except RuntimeError:
+            self._flush_sync()
+
+    def attach(self, job: JobRecord, verbosity: int = LOG_INFO) -> _Subscriber:
+        # 先推送积压的日志，保证新订阅者之后收到的都是补发快照之后的事件
+        self._flush_log_batch(job.id)
+        subscriber = _Subscriber(
+            id=uuid4().hex,
+            job_id=job.id,
+            queue=asyncio.Queue(maxsize=SSE_QUEUE_SIZE),
+            verbosity=verbosity,
+            last_seq=job.event_seq,
+        )
+        job.subscribers[subscriber.id] = subscriber
+        return subscriber
+
+    def detach(self, job: JobRecord, subscriber: _Subscriber) -> None:
+        job.subscribers.pop(subscriber.id, None)
+        self._count_closed(subscriber)
+
+    def _count_closed(self, subscriber: _Subscriber) -> None:
+        totals = self._stream_totals
+        totals["closed"] += 1
+        totals["dropped"] += subscriber.dropped_total
+        totals["delivered"] += subscriber.delivered
+
+    def broadcast(self, job: JobRecord, event: str, data: Any, level: Optional[int] = None) -> None:
+        if level is None:
+            level = _log_level(data.get("line", "")) if event == "log" and isinstance(data, dict) else LOG_PROGRESS
+        if self._watchers and event in _MULTIPLEXED_EVENTS:
+            self._publish(event, {"jobId": job.id, "type": job.type, "data": data}, job.id, job.type)
+        job.event_seq += 1
+        seq = job.event_seq
+        # 每个事件只编码一次，缓冲与所有订阅者共享同一份 bytes
+        frame = _format_sse(event, data, seq)
+        if JOB_EVENT_BUFFER:
+            job.events.append((seq, event, frame, level))
+        if event == "log" and SSE_LOG_BATCH > 0 and job.subscribers:
+            if self._queue_log_frame(job, seq, frame, level):
+                return
+        self._flush_log_batch(job.id)
+        self._fan_out(job, (seq, seq, event, frame), level)
+
+    def _queue_log_frame(self, job: JobRecord, seq: int, frame: bytes, level: int) -> bool:
+        batch = self._log_batches.get(job.id)
+        if batch is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                return False
+            batch = _LogBatch(job=job, first_seq=seq)
+            batch.handle = loop.call_later(SSE_LOG_BATCH, self._flush_log_batch, job.id)
+            self._log_batches[job.id] = batch
+        batch.frames.append((level, frame))
+        batch.last_seq = seq
+        return True
 
-    def attach(self, job: JobRecord) -> Tuple[str, "asyncio.Queue[Dict[str, Any]]"]:
-        client_id = uuid4().hex
-        queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize=512)
-        job.subscribers[client_id] = queue
-        return client_id, queue
+    def _flush_log_batch(self, job_id: str) -> None:
+        batch = self._log_batches.pop(job_id, None)
+        if batch is None:
+            return
+        if batch.handle is not None:
+            batch.handle.cancel()
+        # 每种订阅级别最多拼接一次
+        for verbosity in sorted({subscriber.verbosity for subscriber in batch.job.subscribers.values()}):
+            frames = [frame for level, frame in batch.frames if level <= verbosity]
+            if not frames:
+                continue
+            frame = frames[0] if len(frames) == 1 else b"".join(frames)
+            self._fan_out(batch.job, (batch.first_seq, batch.last_seq, "log", frame), LOG_PROGRESS, verbosity)
 
-    def detach(self, job: JobRecord, client_id: str) -> None:
-        job.subscribers.pop(client_id, None)
+    def _fan_out(
+        self,
+        job: JobRecord,
+        payload: _QueuedFrame,
+        level: int,
+        verbosity: Optional[int] = None,
+    ) -> None:
+        event = payload[2]
+        now = time.monotonic()
+        to_evict: List[_Subscriber] = []
+        for subscriber in job.subscribers.values():
+            if subscriber.verbosity < level or (verbosity is not None and subscriber.verbosity != verbosity):
+                continue
+            if event == "end":
+                self._offer_end(subscriber, payload)
+            elif not self._offer(subscriber, payload, now):
+                to_evict.append(subscriber)
+        for subscriber in to_evict:
+            self._evict(job.subscribers, subscriber, job.event_seq)
+        if event == "end":
+            # 结束事件已入队，订阅者各自消费完后退出，这里不再持有它们
+            job.subscribers.clear()
+
+    def _offer(self, subscriber: _Subscriber, payload: _QueuedFrame, now: float) -> bool:
+        """把一帧放入订阅者队列；队列满时记入 gap。返回 False 表示该订阅者应被断开。"""
+        first_seq, last_seq = payload[0], payload[1]
+        queue = subscriber.queue
+        # 有未通知的丢弃时，需要同时放得下 gap 事件和当前事件
+        needed = 2 if subscriber.gap_from is not None else 1
+        if queue.maxsize - queue.qsize() < needed:
+            if subscriber.gap_from is None:
+                subscriber.gap_from = first_seq
+            subscriber.gap_to = last_seq
+            subscriber.dropped_total += last_seq - first_seq + 1
+            if subscriber.saturated_since is None:
+                subscriber.saturated_since = now
+            elif SSE_EVICT_AFTER and now - subscriber.saturated_since >= SSE_EVICT_AFTER:
+                return False
+            return True
+        subscriber.saturated_since = None
+        if subscriber.gap_from is not None:
+            queue.put_nowait(self._gap_frame(subscriber))
+        queue.put_nowait(payload)
+        subscriber.max_lag = max(subscriber.max_lag, queue.qsize())
+        return True
 
-    def broadcast(self, job: JobRecord, event: str, data: Any) -> None:
-        payload = {"event": event, "data": data}
-        to_remove: List[str] = []
-        for client_id, queue in job.subscribers.items():
-            try:
-                queue.put_nowait(payload)
-            except asyncio.QueueFull:
-                try:
-                    queue.get_nowait()
-                except asyncio.QueueEmpty:
-                    pass
-                try:
-                    queue.put_nowait(payload)
-                except asyncio.QueueFull:
-                    to_remove.append(client_id)
-        for client_id in to_remove:
-            job.subscribers.pop(client_id, None)
+    def _offer_end(self, subscriber: _Subscriber, payload: _QueuedFrame) -> None:
+        """结束事件之后不再有机会补发，必须入队：放不下时丢弃积压，由一条 gap 覆盖所有未送达的事件。"""
+        queue = subscriber.queue
+        needed = 2 if subscriber.gap_from is not None else 1
+        if queue.maxsize - queue.qsize() < needed:
+            while not queue.empty():
+                first_seq, last_seq, event, _ = queue.get_nowait()
+                if event not in ("ping", "close", "gap"):
+                    subscriber.dropped_total += last_seq - first_seq + 1
+            subscriber.gap_from = subscriber.last_seq + 1
+            subscriber.gap_to = payload[0] - 1
+            if subscriber.gap_from > subscriber.gap_to:
+                subscriber.gap_from = None
+        subscriber.saturated_since = None
+        if subscriber.gap_from is not None:
+            queue.put_nowait(self._gap_frame(subscriber))
+        queue.put_nowait(payload)
+        subscriber.max_lag = max(subscriber.max_lag, queue.qsize())
+
+    def _gap_frame(self, subscriber: _Subscriber) -> _QueuedFrame:
+        assert subscriber.gap_from is not None
+        gap_from, gap_to = subscriber.gap_from, subscriber.gap_to
+        subscriber.gap_from = None
+        # gap 不带 id：客户端的 Last-Event-ID 停在丢弃之前，重连即可从缓冲补齐
+        frame = _format_sse(
+            "gap",
+            {
+                "dropped": gap_to - gap_from + 1,
+                "from": _event_id(gap_from),
+                "to": _event_id(gap_to),
+            },
+        )
+        return (gap_from, gap_to, "gap", frame)
+
+    def _evict(self, registry: Dict[str, _Subscriber], subscriber: _Subscriber, current_seq: int) -> None:
+        """断开持续满载的订阅者：清空积压并放入收尾帧，流随即结束。"""
+        registry.pop(subscriber.id, None)
+        subscriber.evicted = True
+        self._stream_totals["evicted"] += 1
+        queue = subscriber.queue
+        while not queue.empty():
+            queue.get_nowait()
+        # 积压的事件一并作废，gap 覆盖从最后送达之后到当前的全部事件
+        subscriber.gap_from = subscriber.last_seq + 1
+        subscriber.gap_to = current_seq
+        gap_from, gap_to, _, frame = self._gap_frame(subscriber)
+        queue.put_nowait((gap_from, gap_to, "evicted", frame))
+        self._logger.info("Evicted slow SSE subscriber %s of job %s", subscriber.id, subscriber.job_id)
+
+    def watch(self, job_ids: Optional[Iterable[str]] = None, job_type: Optional[str] = None) -> _Subscriber:
+        """订阅多任务复用流：所有（或指定）任务的阶段/结束事件以及任务列表增量。"""
+        subscriber = _Subscriber(
+            id=uuid4().hex,
+            job_id="*",
+            queue=asyncio.Queue(maxsize=SSE_QUEUE_SIZE),
+            last_seq=self._watch_seq,
+            job_ids=frozenset(job_ids) if job_ids is not None else None,
+            job_type=job_type,
+        )
+        self._watchers[subscriber.id] = subscriber
+        return subscriber
+
+    def unwatch(self, subscriber: _Subscriber) -> None:
+        self._watchers.pop(subscriber.id, None)
+        self._count_closed(subscriber)
+        if not self._watchers:
+            self._job_delta_sent.clear()
+
+    def watch_events_since(
+        self, subscriber: _Subscriber, last_event_id: Optional[str]
+    ) -> Optional[List[Tuple[int, str, bytes, str, str]]]:
+        last_seq = _parse_event_id(last_event_id, self._watch_seq)
+        if last_seq is None:
+            return None
+        if last_seq == self._watch_seq:
+            return []
+        if not self._watch_events or self._watch_events[0][0] > last_seq + 1:
+            return None
+        return [
+            item
+            for item in self._watch_events
+            if item[0] > last_seq and subscriber.wants(item[3], item[4])
+        ]
+
+    def _publish(self, event: str, data: Any, job_id: str, job_type: str) -> None:
+        self._watch_seq += 1
+        seq = self._watch_seq
+        frame = _format_sse(event, data, seq)
+        if JOB_EVENT_BUFFER:
+            self._watch_events.append((seq, event, frame, job_id, job_type))
+        payload = (seq, seq, event, frame)
+        now = time.monotonic()
+        to_evict = [
+            subscriber
+            for subscriber in self._watchers.values()
+            if subscriber.wants(job_id, job_type) and not self._offer(subscriber, payload, now)
+        ]
+        for subscriber in to_evict:
+            self._evict(self._watchers, subscriber, seq)
+
+    def _queue_job_delta(self, job_id: str, job_type: str, job: Optional[JobRecord]) -> None:
+        self._job_deltas[job_id] = (job_type, job)
+        if self._job_delta_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._flush_job_deltas()
+            return
+        self._job_delta_handle = loop.call_soon(self._flush_job_deltas)
+
+    def _flush_job_deltas(self) -> None:
+        self._job_delta_handle = None
+        deltas, self._job_deltas = self._job_deltas, {}
+        if not self._watchers:
+            return
+        for job_id, (job_type, job) in deltas.items():
+            if job is None:
+                self._job_delta_sent.pop(job_id, None)
+                self._publish("job", {"op": "remove", "jobId": job_id, "type": job_type}, job_id, job_type)
+                continue
+            payload = job.payload()
+            if self._job_delta_sent.get(job_id) is payload:
+                continue
+            self._job_delta_sent[job_id] = payload
+            self._publish("job", {"op": "upsert", "job": payload}, job_id, job_type)
+
+    def stream_metrics(self) -> Dict[str, Any]:
+        subscribers = [
+            subscriber.metrics()
+            for job in self._jobs.values()
+            for subscriber in job.subscribers.values()
+        ]
+        subscribers.extend(subscriber.metrics() for subscriber in self._watchers.values())
+        return {
+            "subscribers": subscribers,
+            "active": len(subscribers),
+            "queueSize": SSE_QUEUE_SIZE,
+            "evictAfterSeconds": SSE_EVICT_AFTER,
+            "totals": {
+                **self._stream_totals,
+                "dropped": self._stream_totals["dropped"] + sum(item["dropped"] for item in subscribers),
+                "delivered": self._stream_totals["delivered"] + sum(item["delivered"] for item in subscribers),
+            },
+        }
+
+    def events_since(
+        self,
+        job: JobRecord,
+        last_event_id: Optional[str],
+        verbosity: int = LOG_ALL,
+    ) -> Optional[List[Tuple[int, str, bytes, int]]]:
+        """返回 Last-Event-ID 之后的事件；无法续传（id 无效、来自旧进程或已被挤出缓冲）时返回 None。"""
+        last_seq = _parse_event_id(last_event_id, job.event_seq)
+        if last_seq is None:
+            return None
+        if last_seq == job.event_seq:
+            return []
+        if not job.events or job.events[0][0] > last_seq + 1:
+            return None
+        return [item for item in job.events if item[0] > last_seq and item[3] <= verbosity]
 
     def update_stage(self, job: JobRecord, stage_id: str, patch: Dict[str, Any]) -> StageState:
         stage = job.stages.get(stage_id)
@@ -222,122 +1338,305 @@ class JobManager:
             job.stages[stage_id] = stage
         stage.apply(patch)
         self.broadcast(job, "stage", stage.to_dict())
-        self._persist_jobs()
+        self._persist_job(job)
         return stage
 
     def touch(self, job: JobRecord) -> None:
         if job.id not in self._jobs:
             self._jobs[job.id] = job
-        self._persist_jobs()
+        self._persist_job(job)
 
-    def list_jobs(self) -> List[JobRecord]:
-        return list(self._jobs.values())
+    def list_jobs(
+        self,
+        *,
+        job_type: Optional[str] = None,
+        include_consumed: bool = True,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[JobRecord], Optional[str]]:
+        """按 start_ts 倒序分页列出任务，返回 (任务列表, 下一页游标)。"""
+        after = _parse_job_cursor(cursor)
+
+        def matches(job: Any) -> bool:
+            if job_type and job.type != job_type:
+                return False
+            if not include_consumed and job.consumed:
+                return False
+            return after is None or (job.start_ts, job.id) < after
+
+        # 内存中的任务总是最新状态（可能尚未落盘），优先于存储中的记录；
+        # 仅有索引的任务先按摘要筛选排序，只解析最终落在本页的记录
+        candidates: Dict[str, Any] = {job.id: job for job in self._jobs.values() if matches(job)}
+        candidates.update((summary.id, summary) for summary in self._index.values() if matches(summary))
+        store_full = False
+        last_stored: Optional[Tuple[float, str]] = None
+        if self._store.indexed:
+            try:
+                items = self._store.query(
+                    job_type=job_type, include_consumed=include_consumed, limit=limit, cursor=after
+                )
+            except Exception as exc:
+                self._logger.warning("Failed to query jobs: %s", exc)
+                items = []
+            store_full = limit is not None and len(items) >= limit
+            for item in items:
+                job = _job_from_dict(item)
+                if job is None:
+                    continue
+                last_stored = (job.start_ts, job.id)
+                if job.id in self._jobs or job.id in candidates:
+                    continue
+                candidates[job.id] = job
+
+        ordered = sorted(candidates.values(), key=lambda job: (job.start_ts, job.id), reverse=True)
+        page = ordered if limit is None else ordered[:limit]
+        next_cursor: Optional[str] = None
+        if limit is not None:
+            if len(page) >= limit and (len(ordered) > limit or store_full):
+                next_cursor = _job_cursor(page[-1].start_ts, page[-1].id)
+            elif store_full and last_stored is not None:
+                # 存储返回的记录被内存中的新状态过滤掉时，从最后一条存储记录之后继续
+                next_cursor = _job_cursor(*last_stored)
+        jobs: List[JobRecord] = []
+        for job in page:
+            if isinstance(job, _JobSummary):
+                job = self._hydrate(job.id)
+            if job is not None:
+                jobs.append(job)
+        return jobs, next_cursor
 
     def latest_job(self, job_type: str, *, include_consumed: bool = False) -> Optional[JobRecord]:
-        candidates = [job for job in self._jobs.values() if job.type == job_type]
-        if not include_consumed:
-            candidates = [job for job in candidates if not job.consumed]
-        if not candidates:
-            return None
-        return max(candidates, key=lambda job: job.start_ts)
+        cursor: Optional[str] = None
+        while True:
+            jobs, cursor = self.list_jobs(
+                job_type=job_type, include_consumed=include_consumed, limit=1, cursor=cursor
+            )
+            if jobs:
+                return jobs[0]
+            if cursor is None:
+                return None
 
     def mark_consumed(self, job_id: str) -> bool:
         job = self._jobs.get(job_id)
+        if job is None and job_id in self._index:
+            job = self._hydrate(job_id)
+        archived = False
+        if job is None:
+            item, archived = self._load_cold(job_id)
+            job = _job_from_dict(item) if item else None
         if not job:
             return False
-        if not job.consumed:
-            job.consumed = True
-            self._persist_jobs()
+        if job.consumed:
+            return True
+        job.consumed = True
+        if archived:
+            # 已归档的任务只追加一条新记录到归档，不回写热数据
+            self._evicted[job_id] = self._serialize_job(job)
+            self._flush_soon()
+        else:
+            self.touch(job)
         return True
 
     def _serialize_job(self, job: JobRecord) -> Dict[str, Any]:
-        data = job.snapshot()
-        data["pid"] = job.pid
-        data["totalToFetch"] = job.total_to_fetch
-        data["processed"] = job.processed
-        # 直接从北京时间戳转换为北京时间
-        start_dt = datetime.fromtimestamp(job.start_ts, tz=CHINA_TZ)
-        data["startTimeIso"] = start_dt.isoformat()
-        if job.end_ts is not None:
-            end_dt = datetime.fromtimestamp(job.end_ts, tz=CHINA_TZ)
-            data["endTimeIso"] = end_dt.isoformat()
-        return data
+        return job.record()
+
+    def _persist_job(self, job: JobRecord, *, immediate: bool = False) -> None:
+        """标记任务待落盘；有事件循环时由后台任务合并写出，否则同步写出。"""
+        self._dirty[job.id] = job
+        if self._watchers:
+            self._queue_job_delta(job.id, job.type, job)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._flush_sync()
+            return
+        if immediate:
+            loop.create_task(self.flush())
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.create_task(self._flush_later())
+
+    async def _flush_later(self, delay: float = JOBS_PERSIST_DEBOUNCE) -> None:
+        await asyncio.sleep(delay)
+        await self.flush()
+
+    def _restore_dirty(self, dirty: Dict[str, JobRecord]) -> None:
+        """写盘失败时把未写出的任务放回待落盘集合；期间已被淘汰的任务不再放回。"""
+        for job_id, job in dirty.items():
+            if self._jobs.get(job_id) is job:
+                self._dirty.setdefault(job_id, job)
+
+    def _retry_flush(self) -> None:
+        task = self._flush_task
+        if task is None or task.done() or task is asyncio.current_task():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_later(JOBS_PERSIST_RETRY))
+
+    async def flush(self) -> None:
+        """把待落盘任务写入追加日志（在线程池中执行），必要时压缩快照。"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        loop = asyncio.get_running_loop()
+        # 串行化多次 flush，保证同一任务的新记录总是写在旧记录之后
+        async with self._flush_lock:
+            if not self._dirty and not self._evicted:
+                return
+            # 先取出再写：写盘期间产生的新变更重新进入 _dirty，失败时再把这一批放回
+            dirty, self._dirty = self._dirty, {}
+            records = [self._serialize_job(job) for job in dirty.values()]
+            try:
+                await loop.run_in_executor(None, self._append_records, records)
+            except Exception as exc:
+                self._logger.warning("Failed to append job journal: %s", exc)
+                self._restore_dirty(dirty)
+                self._retry_flush()
+                return
+            evicted = list(self._evicted.values())
+            if evicted:
+                try:
+                    await loop.run_in_executor(None, self._archive_records, evicted)
+                except Exception as exc:
+                    # 留在 _evicted 中：仍可按 id 读取，压缩时写回快照，稍后重试归档
+                    self._logger.warning("Failed to archive jobs: %s", exc)
+                    self._retry_flush()
+                    return
+                self._drop_evicted(evicted)
+            if self._store.needs_compaction:
+                payload = self._compaction_payload()
+                carry = list(self._index.values())
+                try:
+                    await loop.run_in_executor(None, self._compact_records, payload, carry)
+                except Exception as exc:
+                    self._logger.warning("Failed to persist jobs: %s", exc)
+
+    def close(self) -> None:
+        """关闭时同步写出所有未落盘的变更。"""
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        self._flush_task = None
+        self._flush_sync()
+
+    def _flush_sync(self) -> None:
+        if not self._dirty and not self._evicted:
+            return
+        dirty, self._dirty = self._dirty, {}
+        records = [self._serialize_job(job) for job in dirty.values()]
+        try:
+            self._append_records(records)
+        except Exception as exc:
+            self._logger.warning("Failed to append job journal: %s", exc)
+            self._restore_dirty(dirty)
+            return
+        evicted = list(self._evicted.values())
+        if evicted:
+            try:
+                self._archive_records(evicted)
+            except Exception as exc:
+                self._logger.warning("Failed to archive jobs: %s", exc)
+                return
+            self._drop_evicted(evicted)
+        if self._store.needs_compaction:
+            self._persist_jobs()
+
+    def _drop_evicted(self, archived: List[Dict[str, Any]]) -> None:
+        # 归档期间同一任务可能又有新记录（如被标记为已消费），那一条留到下一轮
+        for item in archived:
+            job_id = str(item["id"])
+            if self._evicted.get(job_id) is item:
+                del self._evicted[job_id]
+
+    def _compaction_payload(self) -> List[Dict[str, Any]]:
+        # 尚未成功归档的任务一并写入快照，压缩不会让它们丢失
+        payload = [self._serialize_job(job) for job in self._jobs.values()]
+        payload.extend(item for job_id, item in self._evicted.items() if job_id not in self._jobs)
+        return payload
+
+    def _append_records(self, records: List[Dict[str, Any]]) -> None:
+        with self._io_lock:
+            self._store.append(records)
+
+    def _archive_records(self, records: List[Dict[str, Any]]) -> None:
+        # 先写归档再从存储中删除，崩溃时最多在两处各留一份
+        with self._io_lock:
+            self._archive.write(records)
+            self._store.remove([str(item["id"]) for item in records])
+
+    def _compact_records(self, records: List[Dict[str, Any]], carry: List[_JobSummary]) -> None:
+        with self._io_lock:
+            self._store.compact(records, carry)
 
     def _persist_jobs(self) -> None:
         try:
-            JOBS_STATE_DIR.mkdir(parents=True, exist_ok=True)
-            payload = [self._serialize_job(job) for job in self._jobs.values()]
-            JOBS_STATE_FILE.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+            self._compact_records(self._compaction_payload(), list(self._index.values()))
         except Exception as exc:
             self._logger.warning("Failed to persist jobs: %s", exc)
 
     def _load_jobs_from_disk(self) -> None:
-        if not JOBS_STATE_FILE.exists():
-            return
-        try:
-            text = JOBS_STATE_FILE.read_text(encoding="utf-8")
-            items = json.loads(text)
-        except Exception as exc:
-            self._logger.warning("Failed to load jobs from disk: %s", exc)
-            return
-        if not isinstance(items, list):
-            return
-        for item in items:
+        records, summaries = self._store.load()
+        self._index = {summary.id: summary for summary in summaries}
+        for item in records:
             try:
-                job_id = str(item.get("id") or "").strip()
-                job_type = str(item.get("type") or "outline")
-                if not job_id:
-                    continue
-                start_ts = item.get("startTs")
-                try:
-                    start_ts_val = float(start_ts) if start_ts is not None else datetime.now(CHINA_TZ).timestamp()
-                except (TypeError, ValueError):
-                    start_ts_val = datetime.now(CHINA_TZ).timestamp()
-                if isinstance(start_ts, str):
-                    with suppress(Exception):
-                        start_ts_val = datetime.fromisoformat(start_ts.replace("Z", "+00:00")).timestamp()
-                start_time_iso = item.get("startTimeIso")
-                if isinstance(start_time_iso, str):
-                    with suppress(Exception):
-                        start_ts_val = datetime.fromisoformat(start_time_iso.replace("Z", "+00:00")).timestamp()
-                job = JobRecord(
-                    id=job_id,
-                    type=job_type,
-                    status=str(item.get("status") or "running"),
-                    start_ts=start_ts_val,
-                    end_ts=item.get("endTs"),
-                    subject=item.get("subject"),
-                    learning_style=item.get("learningStyle"),
-                    expected_content=item.get("expectedContent"),
-                    output_path=item.get("outputPath"),
-                    log_path=item.get("logPath"),
-                    total_to_fetch=item.get("totalToFetch"),
-                    processed=item.get("processed"),
-                    pid=item.get("pid"),
-                    consumed=bool(item.get("consumed")),
-                )
-                if isinstance(item.get("endTimeIso"), str):
-                    with suppress(Exception):
-                        job.end_ts = datetime.fromisoformat(item["endTimeIso"].replace("Z", "+00:00")).timestamp()
-                stages_data = item.get("stages") or {}
-                if isinstance(stages_data, dict):
-                    job.stages = {}
-                    for stage_id, stage_payload in stages_data.items():
-                        if not isinstance(stage_payload, dict):
-                            continue
-                        stage = StageState(
-                            id=str(stage_id),
-                            label=str(stage_payload.get("label") or stage_id),
-                            status=str(stage_payload.get("status") or "pending"),
-                            progress=stage_payload.get("progress"),
-                            detail=stage_payload.get("detail"),
-                        )
-                        job.stages[str(stage_id)] = stage
-                if not job.stages:
-                    job.stages = _default_stages()
-                self._jobs[job_id] = job
+                job = _job_from_dict(item)
             except Exception as exc:
                 self._logger.warning("Skipping persisted job due to error: %s", exc)
+                continue
+            if job is not None:
+                self._jobs[job.id] = job
+
+
+def _job_from_dict(item: Dict[str, Any]) -> Optional[JobRecord]:
+    job_id = str(item.get("id") or "").strip()
+    job_type = str(item.get("type") or "outline")
+    if not job_id:
+        return None
+    start_ts = item.get("startTs")
+    try:
+        start_ts_val = float(start_ts) if start_ts is not None else datetime.now(CHINA_TZ).timestamp()
+    except (TypeError, ValueError):
+        start_ts_val = datetime.now(CHINA_TZ).timestamp()
+    if isinstance(start_ts, str):
+        with suppress(Exception):
+            start_ts_val = datetime.fromisoformat(start_ts.replace("Z", "+00:00")).timestamp()
+    start_time_iso = item.get("startTimeIso")
+    if isinstance(start_time_iso, str):
+        with suppress(Exception):
+            start_ts_val = datetime.fromisoformat(start_time_iso.replace("Z", "+00:00")).timestamp()
+    job = JobRecord(
+        id=job_id,
+        type=job_type,
+        status=str(item.get("status") or "running"),
+        start_ts=start_ts_val,
+        end_ts=item.get("endTs"),
+        subject=item.get("subject"),
+        learning_style=item.get("learningStyle"),
+        expected_content=item.get("expectedContent"),
+        output_path=item.get("outputPath"),
+        log_path=item.get("logPath"),
+        log_offset=_try_parse_int(item.get("logOffset")),
+        total_to_fetch=item.get("totalToFetch"),
+        processed=item.get("processed"),
+        pid=item.get("pid"),
+        pid_start=_try_parse_int(item.get("pidStart")),
+        consumed=bool(item.get("consumed")),
+    )
+    if isinstance(item.get("endTimeIso"), str):
+        with suppress(Exception):
+            job.end_ts = datetime.fromisoformat(item["endTimeIso"].replace("Z", "+00:00")).timestamp()
+    stages_data = item.get("stages") or {}
+    if isinstance(stages_data, dict):
+        job.stages = {}
+        for stage_id, stage_payload in stages_data.items():
+            if not isinstance(stage_payload, dict):
+                continue
+            stage = StageState(
+                id=str(stage_id),
+                label=str(stage_payload.get("label") or stage_id),
+                status=str(stage_payload.get("status") or "pending"),
+                progress=stage_payload.get("progress"),
+                detail=stage_payload.get("detail"),
+            )
+            job.stages[str(stage_id)] = stage
+    if not job.stages:
+        job.stages = _default_stages()
+    return job
 
 
 job_manager = JobManager()
@@ -436,15 +1735,54 @@ def _schedule_learn_data_refresh(slug: str) -> None:
 
 
 def _job_payload(job: JobRecord) -> Dict[str, Any]:
-    data = job.snapshot()
-    data["pid"] = job.pid
-    data["totalToFetch"] = job.total_to_fetch
-    data["processed"] = job.processed
-    return data
+    return job.payload()
+
+
+def _event_id(seq: int) -> str:
+    return f"{_EVENT_EPOCH}:{seq}"
+
+
+def _parse_event_id(event_id: Optional[str], current_seq: int) -> Optional[int]:
+    """解析 Last-Event-ID；不是本进程签发或超出当前序号时返回 None。"""
+    if not event_id:
+        return None
+    epoch, _, raw_seq = event_id.strip().partition(":")
+    if epoch != _EVENT_EPOCH:
+        return None
+    try:
+        seq = int(raw_seq)
+    except ValueError:
+        return None
+    if seq < 0 or seq > current_seq:
+        return None
+    return seq
+
 
-def _format_sse(event: str, data: Any) -> bytes:
+def _format_sse(event: str, data: Any, event_id: Optional[int] = None) -> bytes:
     payload = json.dumps(data, ensure_ascii=False)
-    return f"event: {event}\ndata: {payload}\n\n".encode("utf-8")
+    if event_id is None:
+        return f"event: {event}\ndata: {payload}\n\n".encode("utf-8")
+    return f"id: {_event_id(event_id)}\nevent: {event}\ndata: {payload}\n\n".encode("utf-8")
+
+
+# 章节脚本的 "LLM Prompt [name] BEGIN"，以及大纲流水线的 "DEBUG: [Recommend|Kimi System|...] Prompt Begin"
+_PROMPT_BEGIN_RE = re.compile(
+    r"^=+\s*(?:LLM Prompt \[(?P<name>[^\]]+)\] BEGIN|DEBUG: (?:(?P<label>[\w ]+) )?Prompt Begin)\s*=+$"
+)
+_PROMPT_END_RE = re.compile(r"^=+\s*(?:LLM Prompt \[[^\]]+\] END|DEBUG: (?:[\w ]+ )?Prompt End)\s*=+$")
+# 未闭合的 Prompt 块最多折叠的行数：结束标记丢失（脚本中途崩溃等）时不至于吞掉之后的全部日志
+PROMPT_BLOCK_MAX_LINES = 2000
+_PROGRESS_LOG_MARKERS = ("[orchestrator]", "ERROR", "WARNING", "[错误]", "[警告]", "Traceback", "✅")
+_DEBUG_LOG_MARKERS = (" - DEBUG - ", "[DEBUG]")
+
+
+def _log_level(line: str) -> int:
+    """粗略判断一行日志的详细程度：编排/告警/错误为 progress，调试输出为 all，其余为 info。"""
+    if any(marker in line for marker in _PROGRESS_LOG_MARKERS):
+        return LOG_PROGRESS
+    if any(marker in line for marker in _DEBUG_LOG_MARKERS):
+        return LOG_ALL
+    return LOG_INFO
 
 
 def _normalize_path(path_str: str) -> str:
@@ -458,15 +1796,6 @@ def _ensure_exists(path: Path) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
 
 
-def _try_parse_int(value: Any) -> Optional[int]:
-    try:
-        if value is None:
-            return None
-        return int(value)
-    except Exception:
-        return None
-
-
 _EXECUTION_SENSITIVE_ENV_PREFIXES = (
     "OPENAI_",
     "DEEPSEEK_",
@@ -504,11 +1833,78 @@ def _trim_output(text: str) -> str:
 # Outline 阶段日志解析
 # ----------------------------
 
+# 流水线脚本通过 scripts.common.progress 输出的结构化进度事件会被直接分发；
+# 下面的正则仅用于兼容未输出结构化事件的脚本以及重启后从日志文件回放的任务。
 _COLLECT_START_PATTERNS = [
     re.compile(r"\[1/2\]\s*调用.*推荐教材"),
     re.compile(r"启动教材目录生成流水线"),
     re.compile(r"运行\s*TOC\s*流水线"),
 ]
+_FETCH_START_RE = re.compile(r"并行检索教材目录 .*待检索=(\d+)\s*本")
+_FETCH_ITEM_RE = re.compile(r"完成\s*[:：]\s*《|完成但有错误\s*[:：]|任务异常\s*[:：]")
+_COLLECT_DONE_RE = re.compile(r"目录获取成功:\s*(\d+)\/(\d+)")
+_RECONSTRUCT_OK_RE = re.compile(r"大纲重构\s*[:：]\s*成功")
+_RECONSTRUCT_FAIL_RE = re.compile(r"大纲重构\s*[:：]\s*失败")
+_RECONSTRUCT_RE = re.compile(r"大纲重构\s*[:：]")
+_CLASSIFY_RE = re.compile(r"主题分类\s*[:：]")
+_OUTLINE_OUTPUT_RE = re.compile(r"输出文件:\s*(.+\.json)\s*$")
+
+
+def _outline_collect_start(job: JobRecord) -> None:
+    job_manager.update_stage(job, "collect", {"status": "running", "detail": "调用推荐教材 LLM"})
+
+
+def _outline_fetch_start(job: JobRecord, total: int) -> None:
+    job.total_to_fetch = total
+    job.processed = 0
+    detail = f"已完成 0/{total or '?'}"
+    job_manager.update_stage(
+        job,
+        "collect",
+        {
+            "status": "running",
+            "progress": 0 if total else None,
+            "detail": detail,
+        },
+    )
+
+
+def _outline_fetch_item(job: JobRecord) -> None:
+    if job.processed is None:
+        job.processed = 0
+    job.processed += 1
+    total = job.total_to_fetch or 0
+    progress = (job.processed / total) if total else None
+    detail = f"已完成 {job.processed}/{total or '?'} "
+    job_manager.update_stage(
+        job,
+        "collect",
+        {
+            "status": "running",
+            "progress": progress,
+            "detail": detail,
+        },
+    )
+
+
+def _outline_collect_done(job: JobRecord, ok: int, all_cnt: int) -> None:
+    job_manager.update_stage(
+        job,
+        "collect",
+        {"status": "completed", "progress": 1, "detail": f"成功 {ok}/{all_cnt}"},
+    )
+
+
+def _outline_output(job: JobRecord, path_str: str) -> None:
+    job.output_path = _normalize_path(path_str)
+    if not job.log_path:
+        # 启动时未指定日志文件（旧任务）：脚本的日志与输出同名
+        try:
+            job.log_path = str(Path(job.output_path).with_suffix(".log"))
+        except Exception:
+            job.log_path = None
+    job_manager.touch(job)
+    job_manager.broadcast(job, "file", {"outPath": job.output_path, "logPath": job.log_path})
 
 
 def _parse_outline_line(job: JobRecord, line: str) -> None:
@@ -517,81 +1913,72 @@ def _parse_outline_line(job: JobRecord, line: str) -> None:
         return
 
     if any(pat.search(text) for pat in _COLLECT_START_PATTERNS):
-        job_manager.update_stage(job, "collect", {"status": "running", "detail": "调用推荐教材 LLM"})
+        _outline_collect_start(job)
 
-    m_parallel = re.search(r"并行检索教材目录 .*待检索=(\d+)\s*本", text)
+    m_parallel = _FETCH_START_RE.search(text)
     if m_parallel:
-        total = _try_parse_int(m_parallel.group(1)) or 0
-        job.total_to_fetch = total
-        job.processed = 0
-        detail = f"已完成 0/{total or '?'}"
-        job_manager.update_stage(
-            job,
-            "collect",
-            {
-                "status": "running",
-                "progress": 0 if total else None,
-                "detail": detail,
-            },
-        )
+        _outline_fetch_start(job, _try_parse_int(m_parallel.group(1)) or 0)
         return
 
-    if re.search(r"完成\s*[:：]\s*《", text) or re.search(r"完成但有错误\s*[:：]", text) or re.search(r"任务异常\s*[:：]", text):
-        if job.processed is None:
-            job.processed = 0
-        job.processed += 1
-        total = job.total_to_fetch or 0
-        progress = (job.processed / total) if total else None
-        detail = f"已完成 {job.processed}/{total or '?'} "
-        job_manager.update_stage(
-            job,
-            "collect",
-            {
-                "status": "running",
-                "progress": progress,
-                "detail": detail,
-            },
-        )
+    if _FETCH_ITEM_RE.search(text):
+        _outline_fetch_item(job)
         return
 
-    m_ok = re.search(r"目录获取成功:\s*(\d+)\/(\d+)", text)
+    m_ok = _COLLECT_DONE_RE.search(text)
     if m_ok:
-        ok = _try_parse_int(m_ok.group(1)) or 0
-        all_cnt = _try_parse_int(m_ok.group(2)) or 0
-        job_manager.update_stage(
-            job,
-            "collect",
-            {"status": "completed", "progress": 1, "detail": f"成功 {ok}/{all_cnt}"},
-        )
+        _outline_collect_done(job, _try_parse_int(m_ok.group(1)) or 0, _try_parse_int(m_ok.group(2)) or 0)
         return
 
-    if re.search(r"大纲重构\s*[:：]\s*成功", text):
+    if _RECONSTRUCT_OK_RE.search(text):
         job_manager.update_stage(job, "outline", {"status": "completed", "progress": 1, "detail": "完成"})
         return
-    if re.search(r"大纲重构\s*[:：]\s*失败", text):
+    if _RECONSTRUCT_FAIL_RE.search(text):
         job_manager.update_stage(job, "outline", {"status": "error", "detail": "失败"})
         return
-    if re.search(r"大纲重构\s*[:：]", text):
+    if _RECONSTRUCT_RE.search(text):
         job_manager.update_stage(job, "outline", {"status": "running", "detail": "整合大纲中…"})
         return
-    if re.search(r"主题分类\s*[:：]", text):
+    if _CLASSIFY_RE.search(text):
         job_manager.update_stage(job, "outline", {"status": "running", "detail": "开始整合生成大纲"})
         return
-    if re.search(r"正在以流式方式接收模型输出", text):
+    if "正在以流式方式接收模型输出" in text:
         job_manager.update_stage(job, "outline", {"status": "running", "detail": "模型输出中…"})
         return
 
-    m_out = re.search(r"输出文件:\s*(.+\.json)\s*$", text)
+    m_out = _OUTLINE_OUTPUT_RE.search(text)
     if m_out:
-        path_str = m_out.group(1).strip()
-        job.output_path = _normalize_path(path_str)
-        try:
-            base = Path(job.output_path)
-            job.log_path = str(base.with_suffix(".log"))
-        except Exception:
-            job.log_path = None
-        job_manager.touch(job)
-        job_manager.broadcast(job, "file", {"outPath": job.output_path, "logPath": job.log_path})
+        _outline_output(job, m_out.group(1).strip())
+
+
+def _outline_done(job: JobRecord, ok: bool) -> None:
+    if ok:
+        job_manager.update_stage(job, "outline", {"status": "completed", "progress": 1, "detail": "完成"})
+    else:
+        job_manager.update_stage(job, "outline", {"status": "error", "detail": "结果为空"})
+
+
+_OUTLINE_PROGRESS_HANDLERS: Dict[str, Callable[[JobRecord, Dict[str, Any]], None]] = {
+    "collect.start": lambda job, data: _outline_collect_start(job),
+    "collect.fetch": lambda job, data: _outline_fetch_start(job, _try_parse_int(data.get("total")) or 0),
+    "collect.item": lambda job, data: _outline_fetch_item(job),
+    "collect.done": lambda job, data: _outline_collect_done(
+        job, _try_parse_int(data.get("ok")) or 0, _try_parse_int(data.get("total")) or 0
+    ),
+    "outline.start": lambda job, data: job_manager.update_stage(
+        job, "outline", {"status": "running", "detail": "开始整合生成大纲"}
+    ),
+    "outline.stream": lambda job, data: job_manager.update_stage(
+        job, "outline", {"status": "running", "detail": "模型输出中…"}
+    ),
+    "outline.done": lambda job, data: _outline_done(job, bool(data.get("ok"))),
+    "outline.output": lambda job, data: _outline_output(job, str(data.get("path") or "")),
+}
+
+
+def _handle_outline_progress(job: JobRecord, data: Dict[str, Any]) -> None:
+    handler = _OUTLINE_PROGRESS_HANDLERS.get(str(data.get("event")))
+    if handler is not None:
+        handler(job, data)
 
 
 # ----------------------------
@@ -661,6 +2048,114 @@ def _compute_section_totals(integrated_path: Path) -> Tuple[int, List[int]]:
     return total, per_chapter
 
 
+_CONTENT_SELECTED_RE = re.compile(r"选择章节\s*:\s*\[([^\]]*)\]")
+_CONTENT_PUBLISHED_RE = re.compile(r"大纲已保存\s*:\s*")
+_CONTENT_REPORT_RE = re.compile(r"报告已写出\s*:\s*(.+)$")
+_CONTENT_REPORT_NAME_RE = re.compile(r"^pipeline_report_(.+)\.md$")
+
+
+def _content_selected(job: JobRecord, counters: Dict[str, Any], tokens: List[str]) -> None:
+    per_chapter: List[int] = counters.get("perChapter") or []
+    selected_total = 0
+    for tok in tokens:
+        if tok.isdigit():
+            idx = int(tok)
+            if 1 <= idx <= len(per_chapter):
+                selected_total += per_chapter[idx - 1]
+    if selected_total > 0:
+        counters["total"] = selected_total
+    progress = None
+    total_val = counters.get("total") or 0
+    draft = counters.get("draft") or 0
+    if total_val > 0:
+        progress = min(0.9, (draft / total_val) * 0.9)
+    job_manager.update_stage(
+        job,
+        "content",
+        {
+            "status": "running",
+            "detail": f"选择章节: {len(tokens)} 个（目标 {total_val or '?'} 个知识点）",
+            "progress": progress,
+        },
+    )
+
+
+def _content_draft(job: JobRecord, counters: Dict[str, Any]) -> None:
+    counters["draft"] = (counters.get("draft") or 0) + 1
+    draft = counters["draft"]
+    total_val = counters.get("total") or 0
+    detail = f"初稿 {draft}/{total_val}" if total_val else f"初稿 {draft}"
+    progress = None
+    if total_val > 0:
+        progress = min(0.9, (draft / total_val) * 0.9)
+    job_manager.update_stage(job, "content", {"status": "running", "detail": detail, "progress": progress})
+
+
+def _content_review(job: JobRecord, counters: Dict[str, Any]) -> None:
+    if counters.get("reviewStarted"):
+        return
+    counters["reviewStarted"] = True
+    draft = counters.get("draft") or 0
+    total_val = counters.get("total") or 0
+    detail = (
+        f"初稿 {draft}/{total_val} · 审核阶段"
+        if total_val > 0
+        else "审核阶段：模型输出质检中…"
+    )
+    progress = None
+    if total_val > 0:
+        progress = max(0.9, min(0.98, draft / total_val))
+    job_manager.update_stage(
+        job,
+        "content",
+        {"status": "running", "detail": detail, "progress": progress},
+    )
+
+
+def _content_published(job: JobRecord, counters: Dict[str, Any]) -> None:
+    counters["finalized"] = True
+    draft = counters.get("draft") or 0
+    total_val = counters.get("total") or 0
+    detail = f"初稿 {draft}/{total_val} · 已发布" if total_val > 0 else "已发布"
+    job_manager.update_stage(
+        job,
+        "content",
+        {"status": "running", "detail": detail, "progress": 1},
+    )
+
+
+def _content_report(job: JobRecord, report_path_str: str) -> None:
+    report_path = _normalize_path(report_path_str)
+    job.output_path = report_path
+    try:
+        base = Path(report_path)
+        slug_match = _CONTENT_REPORT_NAME_RE.match(base.name)
+        if slug_match:
+            slug = slug_match.group(1)
+            publish_dir = REPO_ROOT / "web-learner" / "public" / "content" / slug
+            log_path = REPO_ROOT / "output" / slug / "log.txt"
+            job.log_path = str(log_path)
+            job_manager.broadcast(
+                job,
+                "file",
+                {
+                    "reportPath": report_path,
+                    "publishDir": str(publish_dir),
+                    "logPath": str(log_path),
+                },
+            )
+            _schedule_learn_data_refresh(slug)
+        else:
+            job_manager.broadcast(job, "file", {"reportPath": report_path})
+    except Exception:
+        job_manager.broadcast(job, "file", {"reportPath": report_path})
+    job_manager.touch(job)
+
+
+def _content_done(job: JobRecord) -> None:
+    job_manager.update_stage(job, "content", {"status": "completed", "progress": 1, "detail": "完成"})
+
+
 def _parse_content_line(
     job: JobRecord,
     line: str,
@@ -670,163 +2165,848 @@ def _parse_content_line(
     if not text:
         return
 
-    m_sel = re.search(r"选择章节\s*:\s*\[([^\]]*)\]", text)
+    m_sel = _CONTENT_SELECTED_RE.search(text)
     if m_sel:
         tokens = [tok.strip() for tok in m_sel.group(1).split(",") if tok.strip()]
-        total = counters.get("total") or 0
-        per_chapter: List[int] = counters.get("perChapter") or []
-        selected_total = 0
-        for tok in tokens:
-            if tok.isdigit():
-                idx = int(tok)
-                if 1 <= idx <= len(per_chapter):
-                    selected_total += per_chapter[idx - 1]
-        if selected_total > 0:
-            counters["total"] = selected_total
-        progress = None
-        total_val = counters.get("total") or 0
-        draft = counters.get("draft") or 0
-        if total_val > 0:
-            progress = min(0.9, (draft / total_val) * 0.9)
-        job_manager.update_stage(
-            job,
-            "content",
-            {
-                "status": "running",
-                "detail": f"选择章节: {len(tokens)} 个（目标 {total_val or '?'} 个知识点）",
-                "progress": progress,
-            },
-        )
+        _content_selected(job, counters, tokens)
         return
 
     if "[已保存初稿]" in text:
-        counters["draft"] = (counters.get("draft") or 0) + 1
-        draft = counters["draft"]
-        total_val = counters.get("total") or 0
-        detail = f"初稿 {draft}/{total_val}" if total_val else f"初稿 {draft}"
-        progress = None
-        if total_val > 0:
-            progress = min(0.9, (draft / total_val) * 0.9)
-        job_manager.update_stage(job, "content", {"status": "running", "detail": detail, "progress": progress})
+        _content_draft(job, counters)
         return
 
     if not counters.get("reviewStarted") and "==== LLM Prompt [propose_fix] BEGIN ====" in text:
-        counters["reviewStarted"] = True
-        draft = counters.get("draft") or 0
-        total_val = counters.get("total") or 0
-        detail = (
-            f"初稿 {draft}/{total_val} · 审核阶段"
-            if total_val > 0
-            else "审核阶段：模型输出质检中…"
-        )
-        progress = None
-        if total_val > 0:
-            progress = max(0.9, min(0.98, draft / total_val))
-        job_manager.update_stage(
-            job,
-            "content",
-            {"status": "running", "detail": detail, "progress": progress},
-        )
+        _content_review(job, counters)
         return
 
-    if "[大纲已保存]" in text or re.search(r"大纲已保存\s*:\s*", text):
-        counters["finalized"] = True
-        draft = counters.get("draft") or 0
-        total_val = counters.get("total") or 0
-        detail = f"初稿 {draft}/{total_val} · 已发布" if total_val > 0 else "已发布"
-        job_manager.update_stage(
-            job,
-            "content",
-            {"status": "running", "detail": detail, "progress": 1},
-        )
+    if "[大纲已保存]" in text or _CONTENT_PUBLISHED_RE.search(text):
+        _content_published(job, counters)
         return
 
-    m_report = re.search(r"报告已写出\s*:\s*(.+)$", text)
+    m_report = _CONTENT_REPORT_RE.search(text)
     if m_report:
-        report_path = _normalize_path(m_report.group(1))
-        job.output_path = report_path
-        try:
-            base = Path(report_path)
-            slug_match = re.match(r"^pipeline_report_(.+)\.md$", base.name)
-            if slug_match:
-                slug = slug_match.group(1)
-                publish_dir = REPO_ROOT / "web-learner" / "public" / "content" / slug
-                log_path = REPO_ROOT / "output" / slug / "log.txt"
-                job.log_path = str(log_path)
-                job_manager.broadcast(
-                    job,
-                    "file",
-                    {
-                        "reportPath": report_path,
-                        "publishDir": str(publish_dir),
-                        "logPath": str(log_path),
-                    },
-                )
-                _schedule_learn_data_refresh(slug)
-            else:
-                job_manager.broadcast(job, "file", {"reportPath": report_path})
-        except Exception:
-            job_manager.broadcast(job, "file", {"reportPath": report_path})
-        job_manager.touch(job)
+        _content_report(job, m_report.group(1))
         return
 
     if "✅" in text and "完成" in text or "完成。无报告可显示。" in text:
-        job_manager.update_stage(job, "content", {"status": "completed", "progress": 1, "detail": "完成"})
+        _content_done(job)
+
+
+_CONTENT_PROGRESS_HANDLERS: Dict[str, Callable[[JobRecord, Dict[str, Any], Dict[str, Any]], None]] = {
+    "content.selected": lambda job, data, counters: _content_selected(
+        job, counters, [str(idx) for idx in data.get("chapters") or []]
+    ),
+    "content.draft": lambda job, data, counters: _content_draft(job, counters),
+    "content.review": lambda job, data, counters: _content_review(job, counters),
+    "content.published": lambda job, data, counters: _content_published(job, counters),
+    "content.report": lambda job, data, counters: _content_report(job, str(data.get("path") or "")),
+    "content.done": lambda job, data, counters: _content_done(job),
+}
+
+
+def _handle_content_progress(job: JobRecord, data: Dict[str, Any], counters: Dict[str, Any]) -> None:
+    handler = _CONTENT_PROGRESS_HANDLERS.get(str(data.get("event")))
+    if handler is not None:
+        handler(job, data, counters)
 
 
 # ----------------------------
-# 临时代码执行（后续可替换为 Docker 沙箱）
+# 临时代码执行（Docker 沙箱）
 # ----------------------------
 
-async def _execute_python_snippet(code: str, *, timeout: float = DEFAULT_EXECUTION_TIMEOUT) -> Dict[str, Any]:
-    safe_timeout = max(1.0, min(float(timeout), MAX_EXECUTION_TIMEOUT))
-    started_at = time.monotonic()
-    timed_out = False
-    exec_stdout = ""
-    exec_stderr = ""
-    exit_code: Optional[int] = None
-    status = "success"
+SANDBOX_IMAGE = os.environ.get("SANDBOX_IMAGE", "platform-ide-python-sandbox")
+# runner 只保留每个输出流的前 EXECUTION_OUTPUT_LIMIT 个字符；累计写入超过该上限的多少倍时中止执行（0 表示只截断不中止）
+EXECUTION_OUTPUT_ABORT_FACTOR = max(0, _env_int("EXECUTION_OUTPUT_ABORT_FACTOR", 10))
+_SANDBOX_LIMIT_ARGS = ("--network=none", "--pids-limit=64", "--memory=512m", "--cpus=1.0")
+# 预热的沙箱容器数量（0 表示关闭，每次执行都 docker run 一个新容器）
+SANDBOX_POOL_SIZE = max(0, _env_int("SANDBOX_POOL_SIZE", 0))
+# 每个预热容器最多执行多少次代码后回收
+SANDBOX_POOL_MAX_RUNS = max(1, _env_int("SANDBOX_POOL_MAX_RUNS", 50))
+# 单次执行的峰值内存（MB，fork 模式下为执行代码的子进程）超过该值即回收容器；应低于 --memory 上限，避免下一次执行被 OOM
+SANDBOX_POOL_RSS_LIMIT_MB = max(1, _env_int("SANDBOX_POOL_RSS_LIMIT_MB", 384))
+# 常驻 runner 在 fork 执行前预先导入的模块（逗号分隔；未设置时使用 runner.py 的默认列表，空字符串表示不预加载）
+SANDBOX_PRELOAD = os.environ.get("SANDBOX_PRELOAD")
+# 常驻 runner 为每次 fork 出的执行设置的地址空间上限（MB，RLIMIT_AS；0 表示不限制，仅受容器 --memory 约束）
+SANDBOX_CHILD_MEMORY_MB = max(0, _env_int("SANDBOX_CHILD_MEMORY_MB", 0))
+# 容器启动并完成 runner 预热（含预加载模块）的最长等待时间（秒）
+SANDBOX_WARMUP_TIMEOUT = 60.0
+# 服务端等待结果的额外时长（秒）。runner 自身在 timeout 后还有 1 秒宽限才强杀子进程并回报结果，
+# 这里必须严格大于该宽限，否则两边同时到期时服务端会先放弃，把一个正常回收的执行当作容器超时
+SANDBOX_TIMEOUT_MARGIN = 3.0
+
+# 常驻 runner 的帧格式：4 字节大端长度 + UTF-8 JSON（见 docker/sandbox/runner.py 的 serve 模式）
+_SANDBOX_FRAME_HEADER = struct.Struct(">I")
+_SANDBOX_FRAME_LIMIT = 16 * 1024 * 1024
+# (runner 输出, 容器 stderr, 退出码, 是否超时)
+_SandboxOutput = Tuple[bytes, bytes, Optional[int], bool]
+
+
+async def _read_sandbox_frame(stream: asyncio.StreamReader) -> Optional[bytes]:
+    """读取一帧；对端在帧边界或帧中途关闭时返回 None。"""
+    try:
+        header = await stream.readexactly(_SANDBOX_FRAME_HEADER.size)
+        (length,) = _SANDBOX_FRAME_HEADER.unpack(header)
+        if length > _SANDBOX_FRAME_LIMIT:
+            raise ValueError(f"沙箱返回的帧过大: {length} 字节")
+        return await stream.readexactly(length)
+    except asyncio.IncompleteReadError:
+        return None
 
-    payload = json.dumps({"code": code, "timeout": safe_timeout})
-    docker_image = os.environ.get("SANDBOX_IMAGE", "platform-ide-python-sandbox")
-    docker_cmd = [
-        "docker",
-        "run",
-        "--rm",
-        "--network=none",
-        "--pids-limit=64",
-        "--memory=512m",
-        "--cpus=1.0",
-        "-i",
-        docker_image,
-    ]
 
-    try:
-        process = await asyncio.create_subprocess_exec(
-            *docker_cmd,
-            stdin=asyncio.subprocess.PIPE,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-            env=_build_execution_env(),
-        )
-        assert process.stdin is not None
+async def _read_sandbox_result(
+    stream: asyncio.StreamReader, on_output: Optional[Callable[[Dict[str, Any]], None]]
+) -> Optional[bytes]:
+    """读取帧直到最终结果帧，其间的输出帧交给 on_output。"""
+    while True:
+        frame = await _read_sandbox_frame(stream)
+        if frame is None or on_output is None:
+            return frame
+        message = json.loads(frame)
+        if not (isinstance(message, dict) and message.get("type") == "output"):
+            return frame
+        on_output(message)
+
+
+@dataclass(slots=True, eq=False)
+class _SandboxContainer:
+    name: str
+    process: asyncio.subprocess.Process
+    runs: int = 0
+    stderr_tail: Deque[str] = field(default_factory=lambda: deque(maxlen=20))
+    drain: Optional[asyncio.Task[None]] = None
+
+
+class SandboxContainerPool:
+    """维护若干空闲的沙箱容器，每个容器内运行 `runner.py --serve` 常驻循环。
+
+    runner 预先导入常用的重型模块，每次执行 fork 出一个带资源限制的子进程，
+    因此执行之间互不影响，也省去了每次冷导入 numpy/pandas 的时间。
+
+    执行请求领取一个空闲容器，通过 stdin/stdout 上带长度前缀的 JSON 帧交换代码与结果；
+    达到执行次数上限、超时、内存超限或 runner 报告环境被篡改（tainted）时销毁容器，
+    池子在后台补充新的容器。没有空闲容器时调用方退回一次性 docker run。
+    """
+
+    def __init__(self, size: int, max_runs: int) -> None:
+        self._size = size
+        self._max_runs = max_runs
+        self._idle: List[_SandboxContainer] = []
+        self._busy: set[_SandboxContainer] = set()
+        self._warming: set[asyncio.Task[None]] = set()
+        self._disposing: set[asyncio.Task[None]] = set()
+        self._closed = False
+        self._logger = logging.getLogger("sandbox-pool")
+
+    @property
+    def enabled(self) -> bool:
+        return self._size > 0
+
+    def _command(self, name: str) -> List[str]:
+        command = ["docker", "run", "--rm", "-i", f"--name={name}", *_SANDBOX_LIMIT_ARGS, SANDBOX_IMAGE, "--serve"]
+        if SANDBOX_PRELOAD is not None:
+            command.append(f"--preload={SANDBOX_PRELOAD}")
+        if SANDBOX_CHILD_MEMORY_MB:
+            command.append(f"--memory-limit-mb={SANDBOX_CHILD_MEMORY_MB}")
+        return command
+
+    def fill(self) -> None:
+        if self._closed:
+            return
+        while len(self._idle) + len(self._busy) + len(self._warming) < self._size:
+            task = asyncio.create_task(self._warm())
+            self._warming.add(task)
+            task.add_done_callback(self._warming.discard)
+
+    async def _warm(self) -> None:
+        container = await self._spawn()
+        if container is None:
+            return
+        if self._closed:
+            await self._dispose(container)
+            return
+        self._idle.append(container)
+
+    async def _spawn(self) -> Optional[_SandboxContainer]:
+        name = f"platform-sandbox-{uuid4().hex[:12]}"
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *self._command(name),
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                env=_build_execution_env(),
+            )
+        except OSError as exc:
+            self._logger.warning("启动沙箱容器失败: %s", exc)
+            return None
+        container = _SandboxContainer(name=name, process=process)
+        container.drain = asyncio.create_task(self._drain_stderr(container))
         assert process.stdout is not None
-        assert process.stderr is not None
+        try:
+            frame = await asyncio.wait_for(_read_sandbox_frame(process.stdout), timeout=SANDBOX_WARMUP_TIMEOUT)
+            hello = json.loads(frame or b"{}")
+            ready = bool(hello.get("ready"))
+        except (asyncio.TimeoutError, ValueError, AttributeError):
+            ready = False
+        except asyncio.CancelledError:
+            # 服务关闭时取消预热，容器不能留在后台
+            await self._dispose(container)
+            raise
+        if not ready:
+            self._logger.warning("沙箱容器 %s 预热失败: %s", name, " | ".join(container.stderr_tail))
+            await self._dispose(container)
+            return None
+        self._logger.debug("沙箱容器 %s 就绪，预加载模块: %s", name, hello.get("preloaded"))
+        return container
+
+    async def _drain_stderr(self, container: _SandboxContainer) -> None:
+        # 用户代码绕过重定向写到 fd 1/2 的内容都落到这里；必须持续读取，否则管道写满会卡住容器
+        stream = container.process.stderr
+        assert stream is not None
+        pending = b""
+        while True:
+            chunk = await stream.read(4096)
+            if not chunk:
+                return
+            *lines, pending = (pending + chunk).split(b"\n")
+            pending = pending[-4096:]
+            for line in lines:
+                container.stderr_tail.append(line.decode("utf-8", errors="replace")[:500])
+
+    async def _dispose(self, container: _SandboxContainer) -> None:
+        process = container.process
+        if process.returncode is None:
+            with suppress(ProcessLookupError):
+                process.kill()
+        with suppress(Exception):
+            await process.wait()
+        if container.drain is not None:
+            container.drain.cancel()
+        # 只杀掉 docker 客户端不一定会停止容器，按名称强制删除
+        with suppress(Exception):
+            remover = await asyncio.create_subprocess_exec(
+                "docker",
+                "rm",
+                "-f",
+                container.name,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+            await remover.wait()
+
+    def _retire(self, container: _SandboxContainer, reason: str) -> None:
+        self._logger.info("回收沙箱容器 %s（%s，已执行 %s 次）", container.name, reason, container.runs)
+        task = asyncio.create_task(self._dispose(container))
+        self._disposing.add(task)
+        task.add_done_callback(self._disposing.discard)
+        self.fill()
+
+    def _acquire(self) -> Optional[_SandboxContainer]:
+        container: Optional[_SandboxContainer] = None
+        while self._idle:
+            candidate = self._idle.pop(0)
+            if candidate.process.returncode is None:
+                container = candidate
+                break
+            self._retire(candidate, "容器已退出")
+        if container is not None:
+            self._busy.add(container)
+        self.fill()
+        return container
+
+    def _recycle_reason(self, container: _SandboxContainer, result: Dict[str, Any]) -> Optional[str]:
+        # 超时的 fork 子进程已被 runner 杀掉，只有 runner 报告 tainted 时才需要换容器
+        if result.get("tainted"):
+            return f"tainted: {result['tainted']}"
+        if container.runs >= self._max_runs:
+            return "达到执行次数上限"
+        max_rss = _try_parse_int(result.get("maxRss")) or 0
+        if max_rss > SANDBOX_POOL_RSS_LIMIT_MB * 1024:  # ru_maxrss 单位为 KB
+            return f"内存峰值 {max_rss // 1024}MB"
+        if container.process.returncode is not None:
+            return "容器已退出"
+        return None
+
+    async def run(
+        self, payload: bytes, timeout: float, on_output: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> Optional[_SandboxOutput]:
+        """在预热容器中执行一次；没有空闲容器时返回 None。
 
+        流式请求的输出帧（type=output）逐个交给 on_output，返回值只包含最终结果帧。
+        """
+        container = self._acquire()
+        if container is None:
+            return None
+        process = container.process
+        assert process.stdin is not None
+        assert process.stdout is not None
+        container.runs += 1
+        frame: Optional[bytes] = None
+        failure: Optional[str] = "请求被取消"
         try:
-            stdout_bytes, stderr_bytes = await asyncio.wait_for(
-                process.communicate(input=payload.encode("utf-8")),
-                timeout=safe_timeout + 1.0,
+            process.stdin.write(_SANDBOX_FRAME_HEADER.pack(len(payload)) + payload)
+            await process.stdin.drain()
+            frame = await asyncio.wait_for(
+                _read_sandbox_result(process.stdout, on_output), timeout=timeout + SANDBOX_TIMEOUT_MARGIN
             )
+            failure = None
         except asyncio.TimeoutError:
-            timed_out = True
-            status = "timeout"
-            process.kill()
+            failure = "timeout"
+            return b"", b"[server] sandbox container timeout", None, True
+        except Exception as exc:
+            failure = f"通信失败: {exc}"
+            return b"", f"[server] 沙箱容器通信失败: {exc}".encode("utf-8"), None, False
+        finally:
+            self._busy.discard(container)
+            if failure is not None:
+                # 无法确认容器状态（超时、管道异常或请求中途取消），直接换一个
+                self._retire(container, failure)
+        if frame is None:
+            # 容器在执行中退出，常见原因是超出 --memory 被 OOM kill（退出码 137）
             with suppress(Exception):
-                await process.communicate()
-            stdout_bytes, stderr_bytes = b"", b"[server] docker run timeout"
+                await asyncio.wait_for(process.wait(), timeout=1.0)
+            self._retire(container, f"容器退出，退出码 {process.returncode}")
+            detail = "\n".join(container.stderr_tail)
+            hint = "（可能超出内存限制）" if process.returncode == 137 else ""
+            message = f"[server] 沙箱容器异常退出{hint}\n{detail}".rstrip()
+            return b"", message.encode("utf-8"), process.returncode, False
+        try:
+            result = json.loads(frame)
+        except ValueError:
+            result = {"tainted": "invalid response"}
+        reason = self._recycle_reason(container, result if isinstance(result, dict) else {"tainted": "invalid response"})
+        if reason is not None:
+            self._retire(container, reason)
+        elif not self._closed:
+            self._idle.append(container)
+        else:
+            self._retire(container, "服务关闭")
+        return frame, b"", 0, False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": self._size,
+            "idle": len(self._idle),
+            "busy": len(self._busy),
+            "warming": len(self._warming),
+            "maxRuns": self._max_runs,
+        }
+
+    async def close(self) -> None:
+        self._closed = True
+        for task in list(self._warming):
+            task.cancel()
+        containers = [*self._idle, *self._busy]
+        self._idle = []
+        self._busy.clear()
+        await asyncio.gather(*(self._dispose(container) for container in containers), return_exceptions=True)
+        if self._disposing:
+            await asyncio.gather(*list(self._disposing), return_exceptions=True)
+
+
+sandbox_pool = SandboxContainerPool(SANDBOX_POOL_SIZE, SANDBOX_POOL_MAX_RUNS)
+
+
+async def _run_sandbox_container(
+    payload: bytes, timeout: float, on_output: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> _SandboxOutput:
+    """一次性 docker run：容器执行一段代码后随即删除。
+
+    流式请求时 runner 每个输出块输出一行 JSON，最后一行是结果，逐行读取并转交 on_output。
+    """
+    docker_cmd = ["docker", "run", "--rm", *_SANDBOX_LIMIT_ARGS, "-i", SANDBOX_IMAGE]
+    process = await asyncio.create_subprocess_exec(
+        *docker_cmd,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        env=_build_execution_env(),
+        limit=_SANDBOX_FRAME_LIMIT,
+    )
+    try:
+        if on_output is None:
+            stdout_bytes, stderr_bytes = await asyncio.wait_for(
+                process.communicate(input=payload),
+                timeout=timeout + SANDBOX_TIMEOUT_MARGIN,
+            )
+        else:
+            stdout_bytes, stderr_bytes = await asyncio.wait_for(
+                _communicate_streaming(process, payload, on_output),
+                timeout=timeout + SANDBOX_TIMEOUT_MARGIN,
+            )
+    except asyncio.TimeoutError:
+        process.kill()
+        with suppress(Exception):
+            await process.communicate()
+        return b"", b"[server] docker run timeout", process.returncode, True
+    return stdout_bytes, stderr_bytes, process.returncode, False
+
+
+async def _communicate_streaming(
+    process: asyncio.subprocess.Process, payload: bytes, on_output: Callable[[Dict[str, Any]], None]
+) -> Tuple[bytes, bytes]:
+    assert process.stdin is not None
+    assert process.stdout is not None
+    assert process.stderr is not None
+    process.stdin.write(payload)
+    await process.stdin.drain()
+    process.stdin.close()
+    stderr_task = asyncio.create_task(process.stderr.read())
+    result = b""
+    try:
+        while True:
+            line = await process.stdout.readline()
+            if not line:
+                break
+            try:
+                message = json.loads(line)
+            except ValueError:
+                message = None
+            if isinstance(message, dict) and message.get("type") == "output":
+                on_output(message)
+            else:
+                result = line
+        await process.wait()
+        return result, await stderr_task
+    finally:
+        stderr_task.cancel()
+
+
+# ----------------------------
+# 代码执行准入控制
+# ----------------------------
+
+
+def _default_execution_capacity() -> int:
+    # 每次执行最多占用 --cpus=1.0 与 --memory=512m，按宿主机核数与内存（预留 1GB 给服务自身）取较小值
+    cores = os.cpu_count() or 1
+    try:
+        memory_mb = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // (1024 * 1024)
+    except (ValueError, OSError, AttributeError):
+        return cores
+    return max(1, min(cores, (memory_mb - 1024) // 512))
+
+
+# 同时执行的代码段上限（默认按宿主机资源计算）
+EXECUTION_CAPACITY = max(1, _env_int("EXECUTION_MAX_CONCURRENCY", _default_execution_capacity()))
+# 等待执行的请求上限，超出直接返回 429；等待超过 EXECUTION_QUEUE_TIMEOUT_S 秒同样返回 429
+EXECUTION_QUEUE_MAX = max(0, _env_int("EXECUTION_QUEUE_MAX", EXECUTION_CAPACITY * 4))
+EXECUTION_QUEUE_TIMEOUT = max(1, _env_int("EXECUTION_QUEUE_TIMEOUT_S", 30))
+# 令牌桶：每个来源 IP / 每个会话（clientId 或 X-Client-Id）每分钟可执行次数与突发上限（0 表示不限制）
+EXECUTION_RATE_PER_IP = max(0, _env_int("EXECUTION_RATE_PER_IP", 60))
+EXECUTION_BURST_PER_IP = max(1, _env_int("EXECUTION_BURST_PER_IP", 20))
+EXECUTION_RATE_PER_SESSION = max(0, _env_int("EXECUTION_RATE_PER_SESSION", 30))
+EXECUTION_BURST_PER_SESSION = max(1, _env_int("EXECUTION_BURST_PER_SESSION", 10))
+# 部署在反向代理（nginx/docker.conf）之后时设为 1，按 X-Real-IP / X-Forwarded-For 识别来源 IP
+TRUST_PROXY_HEADERS = os.environ.get("TRUST_PROXY_HEADERS") == "1"
+
+
+class ExecutionRejected(Exception):
+    def __init__(self, reason: str, retry_after: float) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass(slots=True)
+class _TokenBucket:
+    tokens: float
+    updated: float
+
+
+class ExecutionAdmission:
+    """代码执行的准入控制：全局并发上限 + 有界等待队列 + 按 IP / 会话的令牌桶。"""
+
+    def __init__(self, capacity: int, queue_max: int, queue_timeout: float) -> None:
+        self._capacity = capacity
+        self._queue_max = queue_max
+        self._queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(capacity)
+        self._running = 0
+        self._waiting = 0
+        self._peak_waiting = 0
+        self._waits: Deque[float] = deque(maxlen=500)
+        self._buckets: Dict[str, _TokenBucket] = {}
+        self._buckets_pruned = time.monotonic()
+        self._counters = {"admitted": 0, "rejectedQueueFull": 0, "rejectedQueueTimeout": 0, "rejectedRate": 0}
+
+    def _refill(self, key: str, per_minute: int, burst: int, now: float) -> _TokenBucket:
+        """按流逝的时间补充令牌并返回桶。"""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _TokenBucket(float(burst), now)
+        bucket.tokens = min(float(burst), bucket.tokens + (now - bucket.updated) * per_minute / 60.0)
+        bucket.updated = now
+        return bucket
+
+    def _prune_buckets(self, now: float) -> None:
+        # 已回满的桶与新建的桶等价，定期丢弃，避免按 IP 无限增长
+        if now - self._buckets_pruned < 60.0:
+            return
+        self._buckets_pruned = now
+        for key, bucket in list(self._buckets.items()):
+            if now - bucket.updated > 600.0:
+                del self._buckets[key]
+
+    def _take_tokens(self, ip: str, session: Optional[str]) -> Optional[float]:
+        """IP 与会话的桶都有令牌时各取一个并返回 None；否则一个都不取，返回需要等待的秒数。"""
+        now = time.monotonic()
+        self._prune_buckets(now)
+        limits = []
+        if EXECUTION_RATE_PER_IP:
+            limits.append((f"ip:{ip}", EXECUTION_RATE_PER_IP, EXECUTION_BURST_PER_IP))
+        if session and EXECUTION_RATE_PER_SESSION:
+            limits.append((f"session:{session}", EXECUTION_RATE_PER_SESSION, EXECUTION_BURST_PER_SESSION))
+        buckets = [(self._refill(key, per_minute, burst, now), per_minute) for key, per_minute, burst in limits]
+        waits = [(1.0 - bucket.tokens) * 60.0 / per_minute for bucket, per_minute in buckets if bucket.tokens < 1.0]
+        if waits:
+            return max(waits)
+        for bucket, _ in buckets:
+            bucket.tokens -= 1.0
+        return None
+
+    def check_rate(self, ip: str, session: Optional[str]) -> None:
+        retry_after = self._take_tokens(ip, session)
+        if retry_after is not None:
+            self._counters["rejectedRate"] += 1
+            raise ExecutionRejected("执行过于频繁，请稍后再试", retry_after)
+
+    async def pace_rate(self, ip: str, session: Optional[str]) -> None:
+        """批量执行逐段取令牌：令牌不足时等待补充，累计等待将超过排队超时时才拒绝（只计一次拒绝）。"""
+        waited = 0.0
+        while True:
+            retry_after = self._take_tokens(ip, session)
+            if retry_after is None:
+                return
+            if waited + retry_after > self._queue_timeout:
+                self._counters["rejectedRate"] += 1
+                raise ExecutionRejected("执行过于频繁，请稍后再试", retry_after)
+            await asyncio.sleep(retry_after)
+            waited += retry_after
+
+    def check_queue(self) -> None:
+        """排队已满时立即拒绝（流式执行在开始推送前调用）。"""
+        if self._running + self._waiting >= self._capacity + self._queue_max:
+            self._counters["rejectedQueueFull"] += 1
+            raise ExecutionRejected("执行队列已满，请稍后再试", self._queue_timeout / 2)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[float]:
+        """占用一个执行名额，产出排队等待的秒数。"""
+        self.check_queue()
+        started = time.monotonic()
+        # 计数在任何 await 之前完成，同一时刻涌入的请求也能看到彼此
+        self._waiting += 1
+        self._peak_waiting = max(self._peak_waiting, self._waiting)
+        try:
+            if self._semaphore.locked():
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self._queue_timeout)
+            else:
+                await self._semaphore.acquire()
+        except asyncio.TimeoutError:
+            self._counters["rejectedQueueTimeout"] += 1
+            raise ExecutionRejected("等待执行超时，请稍后再试", self._queue_timeout / 2) from None
+        finally:
+            self._waiting -= 1
+        self._running += 1
+        waited = time.monotonic() - started
+        self._waits.append(waited)
+        self._counters["admitted"] += 1
+        try:
+            yield waited
+        finally:
+            self._running -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self._waits)
+
+        def _percentile(q: float) -> float:
+            return waits[min(len(waits) - 1, int(q * len(waits)))] if waits else 0.0
+
+        return {
+            "capacity": self._capacity,
+            "running": self._running,
+            "waiting": self._waiting,
+            "peakWaiting": self._peak_waiting,
+            "queueMax": self._queue_max,
+            "queueTimeout": self._queue_timeout,
+            "wait": {
+                "samples": len(waits),
+                "avg": sum(waits) / len(waits) if waits else 0.0,
+                "p50": _percentile(0.5),
+                "p95": _percentile(0.95),
+                "max": waits[-1] if waits else 0.0,
+            },
+            "rateLimits": {
+                "perIp": {"perMinute": EXECUTION_RATE_PER_IP, "burst": EXECUTION_BURST_PER_IP},
+                "perSession": {"perMinute": EXECUTION_RATE_PER_SESSION, "burst": EXECUTION_BURST_PER_SESSION},
+                "trackedBuckets": len(self._buckets),
+            },
+            **self._counters,
+        }
 
-        exit_code = process.returncode
+
+execution_admission = ExecutionAdmission(EXECUTION_CAPACITY, EXECUTION_QUEUE_MAX, EXECUTION_QUEUE_TIMEOUT)
+
+
+# ----------------------------
+# 代码执行结果缓存
+# ----------------------------
+
+# 设为 1 开启结果缓存；只缓存请求中标记 deterministic=true 的代码
+EXECUTION_CACHE_ENABLED = os.environ.get("EXECUTION_CACHE") == "1"
+# 内存 LRU 条目上限与结果有效期（秒）；磁盘层共享同一有效期
+EXECUTION_CACHE_ENTRIES = max(1, _env_int("EXECUTION_CACHE_ENTRIES", 512))
+EXECUTION_CACHE_TTL = max(1, _env_int("EXECUTION_CACHE_TTL_S", 24 * 3600))
+EXECUTION_CACHE_DIR = REPO_ROOT / "output" / "execution_cache"
+# 沙箱镜像 ID 的复用时间：镜像重建后最多这么久旧结果不再命中
+_IMAGE_DIGEST_TTL = 60.0
+# 即使调用方标记了 deterministic，导入了随机数、时间类模块的代码也不缓存（stdin 已计入缓存键）；
+# 按模块前缀匹配，numpy.random.default_rng 与 from numpy import random 都会命中
+_NONDETERMINISTIC_MODULES = frozenset({"random", "secrets", "uuid", "time", "datetime", "numpy.random"})
+# 无需导入专门模块即可拿到的进程相关值（os.urandom / os.getpid）
+_NONDETERMINISTIC_ATTRS = frozenset({"urandom", "getpid"})
+
+
+def _is_nondeterministic(code: str) -> bool:
+    """按 import 语句判断代码的输出是否依赖随机数、时间或进程信息。
+
+    只看语法树而不是文本，注释、字符串或变量名里出现 time 之类的单词不会误判；
+    无法解析的代码每次都得到同样的 SyntaxError，可以缓存。
+    """
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return False
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            if node.level or not node.module:
+                continue
+            names = [node.module, *(f"{node.module}.{alias.name}" for alias in node.names)]
+        elif isinstance(node, ast.Attribute):
+            if node.attr in _NONDETERMINISTIC_ATTRS:
+                return True
+            continue
+        else:
+            continue
+        for name in names:
+            parts = name.split(".")
+            if any(".".join(parts[:depth]) in _NONDETERMINISTIC_MODULES for depth in range(1, len(parts) + 1)):
+                return True
+    return False
+
+
+class ExecutionResultCache:
+    """按 (镜像 ID, 代码哈希, 超时, stdin) 缓存执行结果：内存 LRU + 磁盘 JSON 文件，两层共享 TTL。"""
+
+    def __init__(self, enabled: bool, root: Path, max_entries: int, ttl: float) -> None:
+        self._enabled = enabled
+        self._root = root
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._memory: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._digest: Optional[str] = None
+        self._digest_checked = 0.0
+        # 进行中的镜像 ID 查询：并发请求共享同一次查询，而不是各自拿到 None
+        self._digest_task: Optional[asyncio.Task[Optional[str]]] = None
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    async def _image_digest(self) -> Optional[str]:
+        if self._digest_task is None:
+            if time.monotonic() - self._digest_checked < _IMAGE_DIGEST_TTL:
+                return self._digest
+            self._digest_task = asyncio.get_running_loop().create_task(self._lookup_digest())
+            self._digest_task.add_done_callback(self._lookup_done)
+        # shield：某个调用方被取消时不影响其他仍在等待同一次查询的请求
+        return await asyncio.shield(self._digest_task)
+
+    def _lookup_done(self, task: "asyncio.Task[Optional[str]]") -> None:
+        if self._digest_task is task:
+            self._digest_task = None
+
+    async def _lookup_digest(self) -> Optional[str]:
+        digest: Optional[str] = None
+        with suppress(Exception):
+            process = await asyncio.create_subprocess_exec(
+                "docker",
+                "image",
+                "inspect",
+                "--format={{.Id}}",
+                SANDBOX_IMAGE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+            stdout, _ = await asyncio.wait_for(process.communicate(), timeout=5.0)
+            if process.returncode == 0:
+                digest = stdout.decode("utf-8", errors="replace").strip() or None
+        if digest != self._digest and self._digest is not None:
+            # 镜像已更新，内存中的旧结果不会再命中，直接清掉
+            self._memory.clear()
+        self._digest = digest
+        self._digest_checked = time.monotonic()
+        return digest
+
+    async def key(self, code: str, timeout: float, stdin: Optional[str]) -> Optional[str]:
+        """返回缓存键；代码看起来不确定或拿不到镜像 ID 时返回 None（不缓存）。"""
+        if not self._enabled or _is_nondeterministic(code):
+            return None
+        digest = await self._image_digest()
+        if digest is None:
+            return None
+        material = json.dumps([digest, hashlib.sha256(code.encode("utf-8")).hexdigest(), timeout, stdin])
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self._root / key[:2] / f"{key}.json"
+
+    def _read_disk(self, key: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+        path = self._path(key)
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+            stored_at = float(entry["storedAt"])
+            result = entry["result"]
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError):
+            with suppress(OSError):
+                path.unlink()
+            return None
+        if time.time() - stored_at > self._ttl:
+            with suppress(OSError):
+                path.unlink()
+            return None
+        return stored_at, result
+
+    def _write_disk(self, key: str, stored_at: float, result: Dict[str, Any]) -> None:
+        path = self._path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(".tmp")
+            tmp.write_text(json.dumps({"storedAt": stored_at, "result": result}, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, path)
+        except OSError as exc:
+            logger.debug("写入执行缓存失败: %s", exc)
+
+    def _remember(self, key: str, stored_at: float, result: Dict[str, Any]) -> None:
+        self._memory[key] = (stored_at, result)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._max_entries:
+            self._memory.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._memory.get(key)
+        if entry is not None and time.time() - entry[0] > self._ttl:
+            self._memory.pop(key, None)
+            entry = None
+        if entry is not None:
+            self._memory.move_to_end(key)
+        else:
+            loop = asyncio.get_running_loop()
+            entry = await loop.run_in_executor(None, self._read_disk, key)
+            if entry is not None:
+                self._remember(key, *entry)
+        if entry is None:
+            self._misses += 1
+            return None
+        self._hits += 1
+        return dict(entry[1])
+
+    async def put(self, key: str, result: Dict[str, Any]) -> None:
+        stored_at = time.time()
+        self._remember(key, stored_at, result)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._write_disk, key, stored_at, result)
+
+    def prune(self) -> int:
+        """删除磁盘上已过期的结果（启动时在线程池中执行）。"""
+        removed = 0
+        cutoff = time.time() - self._ttl
+        for path in self._root.glob("*/*.json"):
+            with suppress(OSError):
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self._enabled,
+            "entries": len(self._memory),
+            "hits": self._hits,
+            "misses": self._misses,
+            "imageDigest": self._digest,
+        }
+
+
+execution_cache = ExecutionResultCache(
+    EXECUTION_CACHE_ENABLED, EXECUTION_CACHE_DIR, EXECUTION_CACHE_ENTRIES, EXECUTION_CACHE_TTL
+)
+
+
+async def _execute_python_snippet(
+    code: str,
+    *,
+    timeout: float = DEFAULT_EXECUTION_TIMEOUT,
+    stdin: Optional[str] = None,
+    deterministic: bool = False,
+    on_output: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """执行一段代码。传入 on_output 时为流式执行：输出块在产生时回调，结果中的 stdout/stderr 为空。
+
+    缓存未命中时需先取得执行名额（见 ExecutionAdmission.slot），排队已满或等待超时抛出 ExecutionRejected。
+    """
+    safe_timeout = max(1.0, min(float(timeout), MAX_EXECUTION_TIMEOUT))
+    # 流式执行的输出已经推给了调用方，不参与结果缓存
+    cacheable = deterministic and on_output is None
+    cache_key = await execution_cache.key(code, safe_timeout, stdin) if cacheable else None
+    if cache_key is not None:
+        cached = await execution_cache.get(cache_key)
+        if cached is not None:
+            return {**cached, "cached": True}
+
+    request: Dict[str, Any] = {"code": code, "timeout": safe_timeout}
+    if stdin is not None:
+        request["stdin"] = stdin
+    if on_output is not None:
+        request["stream"] = True
+    elif EXECUTION_OUTPUT_ABORT_FACTOR:
+        request["outputAbortFactor"] = EXECUTION_OUTPUT_ABORT_FACTOR
+    payload = json.dumps(request).encode("utf-8")
+
+    async with execution_admission.slot():
+        result, reported = await _run_python_snippet(payload, safe_timeout, on_output)
+    if cache_key is not None and reported and not result["timedOut"]:
+        await execution_cache.put(cache_key, result)
+    return result
+
+
+async def _run_python_snippet(
+    payload: bytes, safe_timeout: float, on_output: Optional[Callable[[Dict[str, Any]], None]]
+) -> Tuple[Dict[str, Any], bool]:
+    """在沙箱中执行一次，返回 (结果, 是否为 runner 正常给出的结果)。"""
+    started_at = time.monotonic()
+    timed_out = False
+    exec_stdout = ""
+    exec_stderr = ""
+    exit_code: Optional[int] = None
+    status = "success"
+    truncated = False
+    # 只有 runner 正常给出的结果才可缓存；超时、容器异常等服务端错误不缓存
+    reported = False
+
+    try:
+        output = await sandbox_pool.run(payload, safe_timeout, on_output) if sandbox_pool.enabled else None
+        if output is None:
+            output = await _run_sandbox_container(payload, safe_timeout, on_output)
+        stdout_bytes, stderr_bytes, exit_code, timed_out = output
         try:
             parsed = json.loads(stdout_bytes.decode("utf-8", errors="replace"))
         except json.JSONDecodeError:
@@ -834,12 +3014,18 @@ async def _execute_python_snippet(code: str, *, timeout: float = DEFAULT_EXECUTI
 
         if isinstance(parsed, dict) and "status" in parsed:
             status = parsed.get("status", "error")
-            exec_stdout = _trim_output(str(parsed.get("stdout", "")))
-            exec_stderr = _trim_output(str(parsed.get("stderr", "")))
+            exec_stdout = str(parsed.get("stdout", ""))
+            exec_stderr = str(parsed.get("stderr", ""))
+            if "dropped" not in parsed:
+                # 旧版 runner 镜像不做有界截断，由服务端兜底
+                exec_stdout = _trim_output(exec_stdout)
+                exec_stderr = _trim_output(exec_stderr)
             timed_out = bool(parsed.get("timedOut", False))
             exit_code = parsed.get("exitCode")
+            truncated = bool(parsed.get("truncated", False))
+            reported = True
         else:
-            status = "error"
+            status = "timeout" if timed_out else "error"
             exec_stdout = _trim_output(stdout_bytes.decode("utf-8", errors="replace"))
             exec_stderr = _trim_output(stderr_bytes.decode("utf-8", errors="replace"))
     except Exception as exc:
@@ -849,21 +3035,190 @@ async def _execute_python_snippet(code: str, *, timeout: float = DEFAULT_EXECUTI
         exit_code = None
 
     duration = time.monotonic() - started_at
-    return {
+    result = {
         "status": status,
         "stdout": exec_stdout,
         "stderr": exec_stderr,
         "exitCode": exit_code,
         "timedOut": timed_out,
         "duration": duration,
+        "truncated": truncated,
     }
+    return result, reported
+
+
+# ----------------------------
+# 流水线工作进程池
+# ----------------------------
+
+# 预热的工作进程数量（0 表示关闭，每个任务直接启动脚本）
+PIPELINE_WORKER_POOL_SIZE = max(0, _env_int("PIPELINE_WORKER_POOL", 0))
+PIPELINE_WORKER_MODULE = "scripts.pipelines.pipeline_worker"
+# 工作进程完成预加载的最长等待时间（秒）
+PIPELINE_WORKER_WARMUP_TIMEOUT = 120.0
+
+
+def _pipeline_env() -> Dict[str, str]:
+    env = os.environ.copy()
+    # 让流水线脚本输出结构化进度事件（见 scripts/common/progress.py）
+    env[PROGRESS_ENV] = "1"
+    return env
+
+
+class PipelineWorkerPool:
+    """维护若干已完成重型依赖导入的工作进程，任务启动时直接领取一个。
+
+    每个工作进程只执行一个任务，用完即退出，池子在后台补充新的进程；
+    领取到的进程与直接启动脚本得到的子进程接口一致，日志解析、取消与对账逻辑无需区分。
+    """
+
+    def __init__(self, size: int) -> None:
+        self._size = size
+        self._idle: List[asyncio.subprocess.Process] = []
+        self._warming: set[asyncio.Task[None]] = set()
+        self._closed = False
+        self._logger = logging.getLogger("pipeline-workers")
+
+    @property
+    def enabled(self) -> bool:
+        return self._size > 0
+
+    def fill(self) -> None:
+        if self._closed:
+            return
+        while len(self._idle) + len(self._warming) < self._size:
+            task = asyncio.create_task(self._warm())
+            self._warming.add(task)
+            task.add_done_callback(self._warming.discard)
+
+    async def _warm(self) -> None:
+        process = await self._spawn()
+        if process is None:
+            return
+        if self._closed:
+            await self._dispose(process)
+            return
+        self._idle.append(process)
+
+    async def _spawn(self) -> Optional[asyncio.subprocess.Process]:
+        try:
+            process = await asyncio.create_subprocess_exec(
+                PYTHON_BIN,
+                "-u",
+                "-m",
+                PIPELINE_WORKER_MODULE,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=str(REPO_ROOT),
+                env=_pipeline_env(),
+            )
+        except OSError as exc:
+            self._logger.warning("启动流水线工作进程失败: %s", exc)
+            return None
+        assert process.stdout is not None
+        if not await self._wait_ready(process.stdout):
+            self._logger.warning("流水线工作进程 %s 预热失败", process.pid)
+            await self._dispose(process)
+            return None
+        return process
+
+    async def _wait_ready(self, stdout: asyncio.StreamReader) -> bool:
+        # 预加载期间脚本可能打印提示信息，跳过直到就绪标记
+        deadline = time.monotonic() + PIPELINE_WORKER_WARMUP_TIMEOUT
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            try:
+                line = await asyncio.wait_for(stdout.readline(), timeout=remaining)
+            except asyncio.TimeoutError:
+                return False
+            if not line:
+                return False
+            if line.decode("utf-8", errors="replace").strip() == PIPELINE_WORKER_READY:
+                return True
+
+    async def _dispose(self, process: asyncio.subprocess.Process) -> None:
+        if process.returncode is None:
+            with suppress(ProcessLookupError):
+                process.kill()
+        with suppress(Exception):
+            await process.wait()
+
+    async def acquire(self) -> asyncio.subprocess.Process:
+        process: Optional[asyncio.subprocess.Process] = None
+        while self._idle:
+            candidate = self._idle.pop(0)
+            if candidate.returncode is None:
+                process = candidate
+                break
+        if process is None:
+            # 池子暂时空了：现场启动一个，与关闭池子时的冷启动耗时相当
+            process = await self._spawn()
+        self.fill()
+        if process is None:
+            raise RuntimeError("流水线工作进程启动失败")
+        return process
+
+    async def start(self, script: str, argv: List[str]) -> asyncio.subprocess.Process:
+        process = await self.acquire()
+        assert process.stdin is not None
+        spec = json.dumps({"script": script, "argv": argv}, ensure_ascii=False)
+        process.stdin.write(spec.encode("utf-8") + b"\n")
+        await process.stdin.drain()
+        process.stdin.close()
+        return process
+
+    async def close(self) -> None:
+        self._closed = True
+        for task in list(self._warming):
+            task.cancel()
+        idle, self._idle = self._idle, []
+        for process in idle:
+            await self._dispose(process)
+
+
+pipeline_worker_pool = PipelineWorkerPool(PIPELINE_WORKER_POOL_SIZE)
+
+
+async def _spawn_pipeline(script: str, script_path: Path, argv: List[str]) -> Tuple[asyncio.subprocess.Process, str]:
+    """启动一次流水线脚本，返回子进程与用于日志展示的命令行。"""
+    if pipeline_worker_pool.enabled:
+        process = await pipeline_worker_pool.start(script, argv)
+        return process, f"{PIPELINE_WORKER_MODULE}[{process.pid}] {script_path} {' '.join(argv)}"
+    args = [PYTHON_BIN, "-u", str(script_path), *argv]
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=str(REPO_ROOT),
+        env=_pipeline_env(),
+    )
+    return process, " ".join(args)
+
+
+async def _discard_spawned(process: asyncio.subprocess.Process) -> None:
+    """任务在启动期间已被取消：结束刚启动的子进程，不再接管它。"""
+    if process.returncode is None:
+        with suppress(ProcessLookupError):
+            process.kill()
+    with suppress(Exception):
+        await process.wait()
 
 
 # ----------------------------
 # 任务执行器
 # ----------------------------
 
-async def _stream_process_output(job: JobRecord, stream: asyncio.StreamReader, parser) -> None:
+async def _stream_process_output(
+    job: JobRecord,
+    stream: asyncio.StreamReader,
+    parser,
+    progress,
+    state: Dict[str, bool],
+) -> None:
+    prompt: Optional[Dict[str, Any]] = None
     while True:
         line = await stream.readline()
         if not line:
@@ -871,13 +3226,127 @@ async def _stream_process_output(job: JobRecord, stream: asyncio.StreamReader, p
         text = line.decode("utf-8", errors="replace").rstrip("\n")
         if not text:
             continue
-        job_manager.broadcast(job, "log", {"line": text})
+        if text.startswith(PROGRESS_PREFIX):
+            try:
+                data = json.loads(text[len(PROGRESS_PREFIX):])
+            except json.JSONDecodeError:
+                data = None
+            if isinstance(data, dict):
+                if prompt is not None:
+                    # 进度事件说明脚本已经离开 Prompt 输出，结束标记丢失
+                    _broadcast_prompt_summary(job, prompt, unterminated=True)
+                    prompt = None
+                # 脚本已提供结构化进度，后续普通日志不再做正则匹配
+                state["structured"] = True
+                try:
+                    progress(job, data)
+                except Exception as exc:  # 容忍解析失败
+                    logger.debug("处理进度事件失败: %s (%s)", text, exc)
+                continue
+        if prompt is not None:
+            # Prompt 全文只推给 ?logs=all 的订阅者，其余订阅者在块结束时收到一条摘要
+            job_manager.broadcast(job, "log", {"line": text}, LOG_ALL)
+            if _PROMPT_END_RE.match(text):
+                _broadcast_prompt_summary(job, prompt)
+                prompt = None
+            else:
+                prompt["lines"] += 1
+                prompt["chars"] += len(text)
+                if prompt["lines"] >= PROMPT_BLOCK_MAX_LINES:
+                    _broadcast_prompt_summary(job, prompt, unterminated=True)
+                    prompt = None
+        else:
+            m_prompt = _PROMPT_BEGIN_RE.match(text)
+            if m_prompt:
+                name = m_prompt.group("name") or m_prompt.group("label") or "prompt"
+                prompt = {"name": name, "lines": 0, "chars": 0}
+                job_manager.broadcast(job, "log", {"line": text}, LOG_ALL)
+            else:
+                job_manager.broadcast(job, "log", {"line": text})
+        if state.get("structured"):
+            continue
         try:
             parser(job, text)
         except Exception as exc:  # 容忍解析失败
             logger.debug("解析日志失败: %s (%s)", text, exc)
 
 
+def _broadcast_prompt_summary(job: JobRecord, prompt: Dict[str, Any], *, unterminated: bool = False) -> None:
+    where = job.log_path or "日志文件"
+    note = "，未找到结束标记" if unterminated else ""
+    if unterminated:
+        prompt["unterminated"] = True
+    job_manager.broadcast(
+        job,
+        "log",
+        {
+            "line": f"[prompt] {prompt['name']}: {prompt['lines']} 行 / {prompt['chars']} 字符（全文见 {where}{note}）",
+            "prompt": prompt,
+            "logPath": job.log_path,
+        },
+        LOG_INFO,
+    )
+
+
+async def _monitor_process(
+    job: JobRecord,
+    process: asyncio.subprocess.Process,
+    parser,
+    progress,
+    stage_id: str,
+) -> None:
+    """消费子进程输出直至退出，并根据退出码收尾任务。"""
+    stdout = process.stdout
+    stderr = process.stderr
+    if stdout is None or stderr is None:
+        job_manager.finish(job, "error")
+        job_manager.broadcast(job, "end", {"status": "error", "message": "子进程未提供输出流"})
+        return
+
+    state = {"structured": False}
+    tasks = [
+        asyncio.create_task(_stream_process_output(job, stdout, parser, progress, state)),
+        asyncio.create_task(_stream_process_output(job, stderr, parser, progress, state)),
+    ]
+
+    try:
+        return_code = await process.wait()
+    except Exception as exc:  # pragma: no cover - 容错
+        logger.exception("%s 子进程执行异常: %s", job.type, exc)
+        job_manager.finish(job, "error")
+        job_manager.broadcast(job, "end", {"status": "error", "message": str(exc)})
+        return
+    finally:
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            with suppress(asyncio.CancelledError):
+                await task
+
+    if job.status != "running":
+        # 已被取消接口收尾，不再覆盖最终状态
+        return
+    if return_code == 0:
+        job_manager.finish(job, "success")
+        job_manager.broadcast(
+            job,
+            "end",
+            {
+                "status": "success",
+                "outputPath": job.output_path,
+                "logPath": job.log_path,
+            },
+        )
+    else:
+        job_manager.finish(job, "error")
+        job_manager.update_stage(job, stage_id, {"status": "error", "detail": f"进程退出码 {return_code}"})
+        job_manager.broadcast(
+            job,
+            "end",
+            {"status": "error", "message": f"进程退出码 {return_code}"},
+        )
+
+
 async def _run_outline_job(
     subject: str,
     learning_style: str,
@@ -887,18 +3356,19 @@ async def _run_outline_job(
     debug: bool,
     gemini_key: Optional[str],
     kimi_key: Optional[str],
+    *,
+    client: str,
+    priority: int = 0,
 ) -> JobRecord:
     job = job_manager.create_job(
         "outline",
         subject=subject,
         learning_style=learning_style,
         expected_content=expected_content,
+        status="queued",
     )
 
     args: List[str] = [
-        PYTHON_BIN,
-        "-u",
-        str(OUTLINE_SCRIPT),
         "--subject",
         subject,
         "--learning-style",
@@ -912,78 +3382,35 @@ async def _run_outline_job(
         args.append("--print-prompt")
     if debug:
         args.append("--debug")
-    elif os.environ.get("PIPELINE_LOG") == "1":
-        args.append("--log")
+    # 日志文件路径在启动前确定并落盘，服务重启后可据此回放进度、追读遗留子进程的输出
+    job.log_path = str(OUTLINE_LOG_DIR / f"{job.id}.log")
+    args.extend(["--log-file", job.log_path])
     if gemini_key:
         args.extend(["--gemini-llm-key", gemini_key])
     if kimi_key:
         args.extend(["--kimi-llm-key", kimi_key])
 
-    env = os.environ.copy()
-    process = await asyncio.create_subprocess_exec(
-        *args,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-        cwd=str(REPO_ROOT),
-        env=env,
-    )
-
-    job.process = process
-    job.pid = process.pid
-    job_manager.touch(job)
-
-    job_manager.update_stage(job, "collect", {"status": "running", "detail": "启动脚本中…"})
-    job_manager.broadcast(job, "log", {"line": f"[orchestrator] spawn: {' '.join(args)}"})
-    job_manager.broadcast(job, "log", {"line": f"[orchestrator] cwd: {REPO_ROOT}"})
-
-    async def monitor() -> None:
-        stdout = process.stdout
-        stderr = process.stderr
-        if stdout is None or stderr is None:
-            job_manager.finish(job, "error")
-            job_manager.broadcast(job, "end", {"status": "error", "message": "子进程未提供输出流"})
+    async def launch() -> None:
+        job.log_offset = _log_size(job.log_path)
+        process, command = await _spawn_pipeline("outline", OUTLINE_SCRIPT, args)
+        if job.status != "queued":
+            # 启动较慢时用户可能已经取消，此时不能把任务改回 running
+            await _discard_spawned(process)
             return
 
-        tasks = [
-            asyncio.create_task(_stream_process_output(job, stdout, _parse_outline_line)),
-            asyncio.create_task(_stream_process_output(job, stderr, _parse_outline_line)),
-        ]
+        job.status = "running"
+        job.process = process
+        job.pid = process.pid
+        job.pid_start = _process_start_time(process.pid)
+        job_manager.touch(job)
 
-        try:
-            return_code = await process.wait()
-        except Exception as exc:  # pragma: no cover - 容错
-            logger.exception("outline 子进程执行异常: %s", exc)
-            job_manager.finish(job, "error")
-            job_manager.broadcast(job, "end", {"status": "error", "message": str(exc)})
-            return
-        finally:
-            for task in tasks:
-                task.cancel()
-            for task in tasks:
-                with suppress(asyncio.CancelledError):
-                    await task
-
-        if return_code == 0:
-            job_manager.finish(job, "success")
-            job_manager.broadcast(
-                job,
-                "end",
-                {
-                    "status": "success",
-                    "outputPath": job.output_path,
-                    "logPath": job.log_path,
-                },
-            )
-        else:
-            job_manager.finish(job, "error")
-            job_manager.update_stage(job, "outline", {"status": "error", "detail": f"进程退出码 {return_code}"})
-            job_manager.broadcast(
-                job,
-                "end",
-                {"status": "error", "message": f"进程退出码 {return_code}"},
-            )
+        job_manager.update_stage(job, "collect", {"status": "running", "detail": "启动脚本中…"})
+        job_manager.broadcast(job, "log", {"line": f"[orchestrator] spawn: {command}"})
+        job_manager.broadcast(job, "log", {"line": f"[orchestrator] cwd: {REPO_ROOT}"})
+
+        await _monitor_process(job, process, _parse_outline_line, _handle_outline_progress, "outline")
 
-    asyncio.create_task(monitor())
+    job_scheduler.submit(job, launch, client=client, priority=priority)
     return job
 
 
@@ -991,16 +3418,16 @@ async def _run_content_job(
     input_path: Path,
     selected_chapters: Optional[str],
     debug: bool,
+    *,
+    client: str,
+    priority: int = 0,
 ) -> JobRecord:
     subject, topic_slug = _derive_topic_meta(input_path)
     total, per_chapter = _compute_section_totals(input_path)
 
-    job = job_manager.create_job("content", subject=subject)
+    job = job_manager.create_job("content", subject=subject, status="queued")
 
     args: List[str] = [
-        PYTHON_BIN,
-        "-u",
-        str(CHAPTER_SCRIPT),
         "--input",
         str(input_path),
         "--config",
@@ -1013,110 +3440,496 @@ async def _run_content_job(
     if debug or os.environ.get("PIPELINE_LOG") == "1":
         args.append("--debug")
 
-    log_dir = REPO_ROOT / "output" / topic_slug
-    _ensure_exists(log_dir)
-    job.log_path = str(log_dir / "log.txt")
-    job_manager.touch(job)
+    log_dir = REPO_ROOT / "output" / topic_slug
+    _ensure_exists(log_dir)
+    job.log_path = str(log_dir / "log.txt")
+    job_manager.touch(job)
+
+    counters = {
+        "draft": 0,
+        "total": total,
+        "perChapter": per_chapter,
+        "reviewStarted": False,
+        "finalized": False,
+    }
+
+    async def launch() -> None:
+        job.log_offset = _log_size(job.log_path)
+        process, command = await _spawn_pipeline("content", CHAPTER_SCRIPT, args)
+        if job.status != "queued":
+            # 启动较慢时用户可能已经取消，此时不能把任务改回 running
+            await _discard_spawned(process)
+            return
+
+        job.status = "running"
+        job.process = process
+        job.pid = process.pid
+        job.pid_start = _process_start_time(process.pid)
+        job_manager.touch(job)
+
+        initial_detail = f"初稿 0/{total}" if total > 0 else "启动脚本中…"
+        job_manager.update_stage(
+            job,
+            "content",
+            {
+                "status": "running",
+                "detail": initial_detail,
+                "progress": 0 if total > 0 else None,
+            },
+        )
+        job_manager.broadcast(job, "log", {"line": f"[orchestrator] spawn: {command}"})
+        job_manager.broadcast(job, "log", {"line": f"[orchestrator] cwd: {REPO_ROOT}"})
+        if job.log_path:
+            job_manager.broadcast(job, "file", {"logPath": job.log_path})
+
+        await _monitor_process(
+            job,
+            process,
+            lambda j, line: _parse_content_line(j, line, counters),
+            lambda j, data: _handle_content_progress(j, data, counters),
+            "content",
+        )
+
+    job_scheduler.submit(job, launch, client=client, priority=priority)
+    return job
+
+
+# ----------------------------
+# 任务调度
+# ----------------------------
+
+# 每类任务同时运行的子进程上限与排队上限
+JOB_CONCURRENCY_LIMITS = {
+    "outline": max(1, _env_int("OUTLINE_MAX_CONCURRENCY", 2)),
+    "content": max(1, _env_int("CONTENT_MAX_CONCURRENCY", 2)),
+}
+JOB_QUEUE_LIMIT = max(1, _env_int("PIPELINE_MAX_QUEUE", 50))
+JOB_MAX_PRIORITY = 9
+# 请求中的 priority 只有带上匹配的 X-Priority-Token 头时才生效（未设置时一律按 0 处理），
+# 否则任何调用方都能插队到其他用户之前
+JOB_PRIORITY_TOKEN = os.environ.get("JOB_PRIORITY_TOKEN") or None
+
+
+@dataclass(slots=True)
+class _QueuedJob:
+    job: JobRecord
+    launch: Callable[[], Awaitable[None]]
+    client: str
+    priority: int
+    round: int
+    seq: int
+
+    @property
+    def sort_key(self) -> Tuple[int, int, int]:
+        return -self.priority, self.round, self.seq
+
+
+class JobScheduler:
+    """按任务类型限制并发的调度器。
+
+    排队顺序：优先级高者先出队；同一优先级内按“轮次”公平调度——每个客户端在该优先级的第 k 个排队任务
+    落在第 k 轮，因此单个用户连续提交不会饿死其他用户；同轮内按提交顺序（FIFO）。
+    轮次按 (任务类型, 优先级) 分别推进，高优先级任务的出队不会把低优先级队列的轮次带跑。
+    """
+
+    def __init__(self, manager: JobManager, limits: Dict[str, int], queue_limit: int) -> None:
+        self._manager = manager
+        self._limits = limits
+        self._queue_limit = queue_limit
+        self._queues: Dict[str, List[Tuple[Tuple[int, int, int], _QueuedJob]]] = {}
+        self._entries: Dict[str, _QueuedJob] = {}
+        self._running: Dict[str, int] = {}
+        # 每类任务当前调度到的轮次，以及各客户端最近一次排队所在的轮次
+        self._rounds: Dict[Tuple[str, int], int] = {}
+        self._client_rounds: Dict[Tuple[str, int, str], int] = {}
+        self._seq = itertools.count()
+        self._tasks: set = set()
+        self._logger = logging.getLogger("JobScheduler")
+
+    def is_full(self, job_type: str) -> bool:
+        return len(self._queues.get(job_type) or ()) >= self._queue_limit
+
+    def submit(
+        self,
+        job: JobRecord,
+        launch: Callable[[], Awaitable[None]],
+        *,
+        client: str,
+        priority: int = 0,
+    ) -> None:
+        priority = max(0, min(JOB_MAX_PRIORITY, priority))
+        current = self._rounds.get((job.type, priority), 0)
+        key = (job.type, priority, client)
+        round_no = max(current, self._client_rounds.get(key, current - 1) + 1)
+        self._client_rounds[key] = round_no
+        entry = _QueuedJob(
+            job=job,
+            launch=launch,
+            client=client,
+            priority=priority,
+            round=round_no,
+            seq=next(self._seq),
+        )
+        heapq.heappush(self._queues.setdefault(job.type, []), (entry.sort_key, entry))
+        self._entries[job.id] = entry
+        self._dispatch(job.type)
+        self._publish_positions(job.type)
+
+    def discard(self, job_id: str) -> bool:
+        """从队列中移除尚未启动的任务。"""
+        entry = self._entries.pop(job_id, None)
+        if entry is None:
+            return False
+        queue = self._queues.get(entry.job.type) or []
+        queue[:] = [item for item in queue if item[1] is not entry]
+        heapq.heapify(queue)
+        self._publish_positions(entry.job.type)
+        return True
+
+    def position(self, job_id: str) -> Optional[int]:
+        entry = self._entries.get(job_id)
+        if entry is None:
+            return None
+        ordered = sorted(self._queues.get(entry.job.type) or [])
+        for idx, (_, item) in enumerate(ordered, start=1):
+            if item is entry:
+                return idx
+        return None
+
+    def queue_event(self, job: JobRecord) -> Dict[str, Any]:
+        return {
+            "position": self.position(job.id),
+            "queued": len(self._queues.get(job.type) or ()),
+            "running": self._running.get(job.type, 0),
+            "limit": self._limits.get(job.type, 1),
+        }
+
+    def _dispatch(self, job_type: str) -> None:
+        queue = self._queues.get(job_type)
+        limit = self._limits.get(job_type, 1)
+        while queue and self._running.get(job_type, 0) < limit:
+            _, entry = heapq.heappop(queue)
+            self._entries.pop(entry.job.id, None)
+            level = (job_type, entry.priority)
+            self._rounds[level] = max(self._rounds.get(level, 0), entry.round)
+            self._running[job_type] = self._running.get(job_type, 0) + 1
+            task = asyncio.create_task(self._run(entry))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        # 轮次已落后于当前轮的客户端记录没有意义，顺手清理
+        stale = [
+            key
+            for key, rnd in self._client_rounds.items()
+            if key[0] == job_type and rnd < self._rounds.get((job_type, key[1]), 0)
+        ]
+        for key in stale:
+            self._client_rounds.pop(key, None)
+
+    async def _run(self, entry: _QueuedJob) -> None:
+        job = entry.job
+        try:
+            if job.status == "queued":
+                self._manager.broadcast(job, "queue", {**self.queue_event(job), "status": "running"})
+                await entry.launch()
+        except Exception as exc:
+            self._logger.exception("启动 %s 任务失败: %s", job.type, exc)
+            if job.status in _ACTIVE_STATUSES:
+                self._manager.finish(job, "error")
+                self._manager.broadcast(job, "end", {"status": "error", "message": f"启动失败: {exc}"})
+        finally:
+            self._running[job.type] = max(0, self._running.get(job.type, 0) - 1)
+            self._dispatch(job.type)
+            self._publish_positions(job.type)
+
+    def _publish_positions(self, job_type: str) -> None:
+        ordered = sorted(self._queues.get(job_type) or [])
+        base = {
+            "queued": len(ordered),
+            "running": self._running.get(job_type, 0),
+            "limit": self._limits.get(job_type, 1),
+        }
+        for idx, (_, entry) in enumerate(ordered, start=1):
+            self._manager.broadcast(entry.job, "queue", {**base, "position": idx})
+
+
+job_scheduler = JobScheduler(job_manager, JOB_CONCURRENCY_LIMITS, JOB_QUEUE_LIMIT)
+
+
+def _client_key(request: Request) -> str:
+    """公平调度使用的客户端标识：来源 IP（与执行限流相同）。
+
+    clientId / X-Client-Id 由调用方自报，每次换一个就能拿到新的轮次，因此不参与公平调度。
+    """
+    return f"ip:{_client_ip(request)}"
+
+
+# ----------------------------
+# 重启后的任务对账
+# ----------------------------
+
+ORPHAN_POLL_INTERVAL = 1.0
+# 回放遗留日志时每次从磁盘读取的块大小
+ORPHAN_REPLAY_CHUNK = 256 * 1024
+_orphan_tasks: Dict[str, asyncio.Task[None]] = {}
+
+
+def _process_start_time(pid: Optional[int]) -> Optional[int]:
+    """进程的启动时间（开机后的时钟滴答数）；没有 /proc 或进程已退出时返回 None。"""
+    if not pid:
+        return None
+    try:
+        stat = Path(f"/proc/{pid}/stat").read_text(encoding="utf-8", errors="replace")
+    except OSError:
+        return None
+    # 进程名（第 2 项）可能含空格与括号，从最后一个 ")" 之后切分；starttime 是第 22 项
+    fields = stat[stat.rfind(")") + 2 :].split()
+    return _try_parse_int(fields[19]) if len(fields) > 19 else None
+
 
-    env = os.environ.copy()
-    process = await asyncio.create_subprocess_exec(
-        *args,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-        cwd=str(REPO_ROOT),
-        env=env,
-    )
+def _pid_is_pipeline(pid: Optional[int], job_type: str, started: Optional[int] = None) -> bool:
+    """判断 pid 是否仍存活且确实是该任务启动的流水线进程（防止 pid 被复用）。
 
-    job.process = process
-    job.pid = process.pid
-    job_manager.touch(job)
+    启动时记录了进程启动时间的，以启动时间为准；否则按命令行中的脚本名判断。
+    worker pool 模式下命令行只有工作进程模块名，空闲进程与其他任务的进程都会命中，只能靠启动时间确认。
+    """
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except (ProcessLookupError, PermissionError):
+        return False
+    except OSError:
+        return False
+    current = _process_start_time(pid)
+    if started is not None and current is not None:
+        return current == started
+    script = OUTLINE_SCRIPT if job_type == "outline" else CHAPTER_SCRIPT
+    try:
+        cmdline = Path(f"/proc/{pid}/cmdline").read_bytes().replace(b"\0", b" ").decode("utf-8", "replace")
+    except OSError:
+        # 非 Linux（如本地 macOS 开发）没有 /proc，退回 ps
+        try:
+            cmdline = subprocess.run(
+                ["ps", "-o", "command=", "-p", str(pid)],
+                capture_output=True,
+                text=True,
+                timeout=2,
+            ).stdout
+        except Exception:
+            return False
+    return script.name in cmdline
 
-    initial_detail = f"初稿 0/{total}" if total > 0 else "启动脚本中…"
-    job_manager.update_stage(
-        job,
-        "content",
-        {
-            "status": "running",
-            "detail": initial_detail,
-            "progress": 0 if total > 0 else None,
-        },
-    )
-    job_manager.broadcast(job, "log", {"line": f"[orchestrator] spawn: {' '.join(args)}"})
-    job_manager.broadcast(job, "log", {"line": f"[orchestrator] cwd: {REPO_ROOT}"})
-    if job.log_path:
-        job_manager.broadcast(job, "file", {"logPath": job.log_path})
 
-    counters = {
+def _orphan_parser(job: JobRecord):
+    if job.type == "outline":
+        job.processed = 0
+        return _parse_outline_line
+    # 原始的章节统计无法恢复，只能从已持久化的阶段描述里取回目标总数
+    total = 0
+    stage = job.stages.get("content")
+    if stage and stage.detail:
+        m_total = re.search(r"初稿\s*\d+/(\d+)", stage.detail)
+        if m_total:
+            total = int(m_total.group(1))
+    counters: Dict[str, Any] = {
         "draft": 0,
         "total": total,
-        "perChapter": per_chapter,
+        "perChapter": [],
         "reviewStarted": False,
         "finalized": False,
     }
+    return lambda j, line: _parse_content_line(j, line, counters)
 
-    async def monitor() -> None:
-        stdout = process.stdout
-        stderr = process.stderr
-        if stdout is None or stderr is None:
-            job_manager.finish(job, "error")
-            job_manager.broadcast(job, "end", {"status": "error", "message": "子进程未提供输出流"})
-            return
 
-        tasks = [
-            asyncio.create_task(_stream_process_output(job, stdout, lambda j, line: _parse_content_line(j, line, counters))),
-            asyncio.create_task(_stream_process_output(job, stderr, lambda j, line: _parse_content_line(j, line, counters))),
-        ]
+async def _read_orphan_chunk(path: Path, offset: int, limit: int) -> Optional[Tuple[bytes, int, int]]:
+    """在线程池中读取一段日志；文件尚不存在或读取失败时返回 None。"""
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(None, _read_log_chunk, path, offset, limit)
+    except OSError:
+        return None
+
 
+async def _follow_orphan(job: JobRecord) -> None:
+    """重新跟踪重启前遗留的子进程：回放并追读 log_path，进程退出后收尾。
+
+    日志从启动时记录的 log_offset 开始按块在线程池中读取，每块之间让出事件循环；
+    重启时已存在的部分只静默回放以恢复进度，之后新写入的行才推送给客户端。
+    """
+    parser = _orphan_parser(job)
+    log_path = Path(job.log_path) if job.log_path else None
+    offset = max(0, job.log_offset or 0)
+    replay_end: Optional[int] = None
+    pending = b""
+    silent = False
+
+    def consume(raw: bytes, silent: bool) -> None:
+        text = raw.decode("utf-8", errors="replace").rstrip("\r")
+        if not text:
+            return
+        if silent:
+            with suppress(Exception):
+                parser(job, text)
+            return
+        job_manager.broadcast(job, "log", {"line": text})
         try:
-            return_code = await process.wait()
-        except Exception as exc:  # pragma: no cover - 容错
-            logger.exception("content 子进程执行异常: %s", exc)
-            job_manager.finish(job, "error")
-            job_manager.broadcast(job, "end", {"status": "error", "message": str(exc)})
+            parser(job, text)
+        except Exception as exc:  # 容忍解析失败
+            logger.debug("解析日志失败: %s (%s)", text, exc)
+
+    while True:
+        alive = _pid_is_pipeline(job.pid, job.type, job.pid_start)
+        while log_path is not None:
+            limit = ORPHAN_REPLAY_CHUNK
+            if replay_end is not None and offset < replay_end:
+                # 回放的块不跨过重启时的文件末尾，保证整块要么静默要么推送
+                limit = min(limit, replay_end - offset)
+            chunk = await _read_orphan_chunk(log_path, offset, limit)
+            if chunk is None:
+                if replay_end is None:
+                    replay_end = offset
+                break
+            data, offset, size = chunk
+            if replay_end is None:
+                replay_end = size
+            if not data:
+                break
+            silent = offset <= replay_end
+            lines = (pending + data).split(b"\n")
+            # 末尾不完整的行留到下一块（或下一轮）再处理
+            pending = lines.pop()
+            for raw in lines:
+                consume(raw, silent)
+            await asyncio.sleep(0)
+        if not alive:
+            if pending:
+                consume(pending, silent)
+                pending = b""
+            break
+        if job.status != "running":
             return
-        finally:
-            for task in tasks:
-                task.cancel()
-            for task in tasks:
-                with suppress(asyncio.CancelledError):
-                    await task
-
-        if return_code == 0:
-            job_manager.finish(job, "success")
-            job_manager.broadcast(
-                job,
-                "end",
-                {
-                    "status": "success",
-                    "outputPath": job.output_path,
-                    "logPath": job.log_path,
-                },
-            )
-        else:
-            job_manager.finish(job, "error")
-            job_manager.update_stage(job, "content", {"status": "error", "detail": f"进程退出码 {return_code}"})
-            job_manager.broadcast(
-                job,
-                "end",
-                {"status": "error", "message": f"进程退出码 {return_code}"},
-            )
+        await asyncio.sleep(ORPHAN_POLL_INTERVAL)
 
-    asyncio.create_task(monitor())
-    return job
+    if job.status != "running":
+        return
+    main_stage = job.stages.get("outline" if job.type == "outline" else "content")
+    if main_stage is not None and main_stage.status == "completed":
+        job_manager.finish(job, "success")
+        job_manager.broadcast(
+            job, "end", {"status": "success", "outputPath": job.output_path, "logPath": job.log_path}
+        )
+    else:
+        _fail_orphan(job, "服务重启后子进程已退出")
+
+
+def _fail_orphan(job: JobRecord, message: str) -> None:
+    job_manager.finish(job, "error")
+    job_manager.update_stage(job, "outline" if job.type == "outline" else "content", {"status": "error", "detail": message})
+    job_manager.broadcast(job, "end", {"status": "error", "message": message})
+
+
+def _reconcile_orphaned_jobs() -> None:
+    """启动时处理仍标记为 running 的持久化任务：进程仍在则重新跟踪，否则标记失败。"""
+    for job in job_manager.active_jobs():
+        if job.process is not None:
+            continue
+        if job.status == "queued":
+            # 排队任务的启动参数（含 API Key）不落盘，重启后无法恢复
+            _fail_orphan(job, "服务重启，排队中的任务已取消")
+            continue
+        if not _pid_is_pipeline(job.pid, job.type, job.pid_start):
+            logger.info("[reconcile] 任务 %s 的进程 %s 已不存在，标记为失败", job.id, job.pid)
+            _fail_orphan(job, "服务重启时子进程已不存在")
+            continue
+        logger.info("[reconcile] 重新跟踪任务 %s（pid=%s）", job.id, job.pid)
+        task = asyncio.create_task(_follow_orphan(job))
+        _orphan_tasks[job.id] = task
+        task.add_done_callback(lambda _done, key=job.id: _orphan_tasks.pop(key, None))
+
+
+def _terminate_job_process(job: JobRecord) -> None:
+    proc = job.process
+    if proc and proc.returncode is None:
+        try:
+            proc.terminate()
+        except ProcessLookupError:
+            pass
+        except Exception as exc:
+            raise HTTPException(status_code=500, detail=str(exc)) from exc
+    elif proc is None and job.status == "running" and _pid_is_pipeline(job.pid, job.type, job.pid_start):
+        # 重启后重新跟踪的任务没有进程句柄，直接按 pid 终止
+        try:
+            os.kill(job.pid, signal.SIGTERM)  # type: ignore[arg-type]
+        except ProcessLookupError:
+            pass
+        except Exception as exc:
+            raise HTTPException(status_code=500, detail=str(exc)) from exc
 
 
 # ----------------------------
 # SSE 输出
 # ----------------------------
 
-async def _event_stream(job: JobRecord, request: Request) -> AsyncIterator[bytes]:
-    client_id, queue = job_manager.attach(job)
+async def _watch_disconnect(request: Request, subscriber: _Subscriber) -> None:
+    """监听 ASGI receive 通道，客户端断开时唤醒流循环，避免逐条事件轮询 is_disconnected。"""
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            break
+    subscriber.close()
+
+
+class _Heartbeat:
+    """空闲心跳：距上次送出数据满 SSE_HEARTBEAT 秒时插入一条 ping。
+
+    定时器每次触发都会重新挂上，与队列状态无关；否则恰好在突发输出期间触发
+    （队列非空，ping 被跳过）后就再也没有心跳，代理会在长时间等待阶段断开连接。
+    """
+
+    def __init__(self, subscriber: _Subscriber) -> None:
+        self._subscriber = subscriber
+        self._loop = asyncio.get_running_loop()
+        self._last_sent = self._loop.time()
+        self._handle = self._loop.call_later(SSE_HEARTBEAT, self._fire)
+
+    def sent(self) -> None:
+        self._last_sent = self._loop.time()
+
+    def _fire(self) -> None:
+        remaining = SSE_HEARTBEAT - (self._loop.time() - self._last_sent)
+        if remaining <= 0:
+            self._subscriber.ping()
+            remaining = SSE_HEARTBEAT
+        self._handle = self._loop.call_later(remaining, self._fire)
+
+    def cancel(self) -> None:
+        self._handle.cancel()
+
+
+async def _event_stream(
+    job: JobRecord,
+    request: Request,
+    last_event_id: Optional[str] = None,
+    verbosity: int = LOG_INFO,
+) -> AsyncIterator[bytes]:
+    subscriber = job_manager.attach(job, verbosity)
+    # 与 attach 同步取出：此后的事件只会进入队列，补发与实时事件不重不漏
+    missed = job_manager.events_since(job, last_event_id, verbosity)
     try:
-        yield _format_sse("hello", {"jobId": job.id, "snapshot": job.snapshot()})
-        for stage in job.stages.values():
-            yield _format_sse("stage", stage.to_dict())
+        if missed is not None:
+            # 断线重连：只补发错过的事件
+            if missed:
+                yield b"".join(item[2] for item in missed)
+                if missed[-1][1] == "end":
+                    return
+        else:
+            yield _format_sse("hello", {"jobId": job.id, "snapshot": job.snapshot()}, job.event_seq)
+            for stage in job.stages.values():
+                yield _format_sse("stage", stage.to_dict())
+            if job.status == "queued":
+                yield _format_sse("queue", job_scheduler.queue_event(job))
 
-        if job.status != "running":
+        if job.status not in _ACTIVE_STATUSES:
             yield _format_sse(
                 "end",
                 {
@@ -1127,24 +3940,210 @@ async def _event_stream(job: JobRecord, request: Request) -> AsyncIterator[bytes
             )
             return
 
+        async for frame in _pump_subscriber(subscriber, request, stop_on_end=True):
+            yield frame
+    finally:
+        job_manager.detach(job, subscriber)
+
+
+async def _pump_subscriber(
+    subscriber: _Subscriber,
+    request: Request,
+    *,
+    stop_on_end: bool,
+) -> AsyncIterator[bytes]:
+    """实时阶段：逐帧转发订阅者队列，直到客户端断开、被判定为慢消费者或（可选）任务结束。"""
+    queue = subscriber.queue
+    watcher = asyncio.create_task(_watch_disconnect(request, subscriber))
+    heartbeat = _Heartbeat(subscriber)
+    try:
         while True:
-            if await request.is_disconnected():
+            first_seq, last_seq, event, frame = await queue.get()
+            if event == "close":
                 break
-            try:
-                event = await asyncio.wait_for(queue.get(), timeout=20.0)
-            except asyncio.TimeoutError:
-                yield b": ping\n\n"
+            yield frame
+            heartbeat.sent()
+            if event == "ping":
+                continue
+            if event == "gap":
                 continue
-            yield _format_sse(event["event"], event["data"])
+            if event == "evicted":
+                # 被判定为慢消费者：结束本次连接，由客户端重连续传
+                break
+            subscriber.delivered += last_seq - first_seq + 1
+            subscriber.last_seq = last_seq
+            if stop_on_end and event == "end":
+                break
     finally:
-        job_manager.detach(job, client_id)
+        heartbeat.cancel()
+        watcher.cancel()
+
+
+async def _multiplexed_stream(
+    request: Request,
+    job_ids: Optional[List[str]],
+    job_type: Optional[str],
+    limit: int,
+    last_event_id: Optional[str],
+) -> AsyncIterator[bytes]:
+    subscriber = job_manager.watch(job_ids, job_type)
+    missed = job_manager.watch_events_since(subscriber, last_event_id)
+    try:
+        if missed is not None:
+            if missed:
+                yield b"".join(item[2] for item in missed)
+        else:
+            if job_ids is not None:
+                found = (job_manager.get(job_id) for job_id in job_ids)
+                jobs = [job for job in found if job is not None and (job_type is None or job.type == job_type)]
+                next_cursor = None
+            else:
+                jobs, next_cursor = job_manager.list_jobs(job_type=job_type, limit=limit)
+            yield _format_sse(
+                "hello",
+                {"jobs": [_job_payload(job) for job in jobs], "nextCursor": next_cursor},
+                subscriber.last_seq,
+            )
+        async for frame in _pump_subscriber(subscriber, request, stop_on_end=False):
+            yield frame
+    finally:
+        job_manager.unwatch(subscriber)
+
+
+async def _gzip_stream(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """逐块 gzip 压缩：每块后 Z_SYNC_FLUSH，客户端无需等待整个流结束即可解码。"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    try:
+        async for chunk in chunks:
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush(zlib.Z_FINISH)
+    finally:
+        aclose = getattr(chunks, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+def _job_stream_response(
+    job: JobRecord,
+    request: Request,
+    last_event_id: Optional[str],
+    logs: str,
+    gzip_enabled: bool,
+) -> StreamingResponse:
+    verbosity = LOG_LEVELS.get((logs or "info").strip().lower())
+    if verbosity is None:
+        raise HTTPException(status_code=400, detail=f"logs must be one of: {', '.join(LOG_LEVELS)}")
+    stream = _event_stream(job, request, request.headers.get("last-event-id") or last_event_id, verbosity)
+    return _sse_response(stream, request, gzip_enabled)
+
+
+def _sse_response(stream: AsyncIterator[bytes], request: Request, gzip_enabled: bool) -> StreamingResponse:
+    headers = {"Cache-Control": "no-cache", "Connection": "keep-alive"}
+    if gzip_enabled and "gzip" in request.headers.get("accept-encoding", "").lower():
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+        stream = _gzip_stream(stream)
+    return StreamingResponse(stream, media_type="text/event-stream", headers=headers)
+
+
+# ----------------------------
+# 任务日志分段读取
+# ----------------------------
+
+LOG_CHUNK_DEFAULT = 64 * 1024
+LOG_CHUNK_MAX = 1024 * 1024
+# follow 模式下检查日志文件增长的间隔（秒）
+LOG_FOLLOW_INTERVAL = 0.5
+# 小于该大小的读取直接 seek + read，更大的用 mmap 切片，避免一次性缓冲整段文件
+_LOG_MMAP_THRESHOLD = 256 * 1024
+
+
+def _read_log_chunk(path: Path, offset: int, limit: int, *, whole_lines: bool = True) -> Tuple[bytes, int, int]:
+    """从 offset 读取至多 limit 字节，返回 (数据, 下一个 offset, 文件大小)。
+
+    offset 为负数时表示从文件末尾倒数。whole_lines 时尽量在换行处截断，
+    避免把一行（以及多字节字符）拆到两次读取中；下一次从截断处继续。
+    """
+    with path.open("rb") as fp:
+        size = os.fstat(fp.fileno()).st_size
+        if offset < 0:
+            offset = max(0, size + offset)
+        offset = min(offset, size)
+        end = min(size, offset + limit)
+        if end <= offset:
+            return b"", offset, size
+        if end - offset >= _LOG_MMAP_THRESHOLD:
+            with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                data = mapped[offset:end]
+        else:
+            fp.seek(offset)
+            data = fp.read(end - offset)
+    if whole_lines and end < size:
+        cut = data.rfind(b"\n")
+        if cut >= 0:
+            data = data[: cut + 1]
+    return data, offset + len(data), size
+
+
+def _log_size(path_str: Optional[str]) -> Optional[int]:
+    """日志文件当前的大小，作为本次任务日志的起点；文件尚不存在时为 0。"""
+    if not path_str:
+        return None
+    try:
+        return os.stat(path_str).st_size
+    except OSError:
+        return 0
+
+
+def _job_log_file(job: JobRecord) -> Path:
+    if not job.log_path:
+        raise HTTPException(status_code=404, detail="该任务没有日志文件")
+    path = Path(job.log_path)
+    if not path.is_file():
+        raise HTTPException(status_code=404, detail=f"日志文件不存在: {job.log_path}")
+    return path
+
+
+async def _follow_log(job: JobRecord, path: Path, offset: int, limit: int) -> AsyncIterator[bytes]:
+    """持续输出日志文件新增内容，任务结束且已读到末尾后结束。"""
+    loop = asyncio.get_running_loop()
+    while True:
+        data, offset, size = await loop.run_in_executor(None, _read_log_chunk, path, offset, limit)
+        if data:
+            yield data
+            if offset < size:
+                continue
+        if job.status not in _ACTIVE_STATUSES:
+            return
+        await asyncio.sleep(LOG_FOLLOW_INTERVAL)
 
 
 # ----------------------------
 # FastAPI 路由
 # ----------------------------
 
-app = FastAPI(title="Platform IDE Python API")
+@asynccontextmanager
+async def _lifespan(_: FastAPI) -> AsyncIterator[None]:
+    job_manager.start()
+    _reconcile_orphaned_jobs()
+    if pipeline_worker_pool.enabled:
+        pipeline_worker_pool.fill()
+    if sandbox_pool.enabled:
+        sandbox_pool.fill()
+    if execution_cache.enabled:
+        asyncio.get_running_loop().run_in_executor(None, execution_cache.prune)
+    try:
+        yield
+    finally:
+        await sandbox_pool.close()
+        await pipeline_worker_pool.close()
+        await job_manager.flush()
+        job_manager.close()
+
+
+app = FastAPI(title="Platform IDE Python API", lifespan=_lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -1154,11 +4153,47 @@ app.add_middleware(
 )
 
 
+@app.get("/api/pipeline/metrics")
+async def pipeline_metrics() -> JSONResponse:
+    return JSONResponse(job_manager.stream_metrics())
+
+
+@app.get("/api/pipeline/events")
+async def pipeline_events(
+    request: Request,
+    jobIds: Optional[str] = None,
+    type: Optional[str] = None,
+    limit: int = 50,
+    lastEventId: Optional[str] = None,
+    compress: bool = Query(False, alias="gzip"),
+) -> StreamingResponse:
+    """多任务复用的 SSE：指定任务（jobIds，逗号分隔）或全部任务的阶段/结束事件与任务列表增量。"""
+    if limit <= 0:
+        raise HTTPException(status_code=400, detail="limit 必须为正整数")
+    job_ids = [item.strip() for item in jobIds.split(",") if item.strip()] if jobIds else None
+    stream = _multiplexed_stream(
+        request,
+        job_ids,
+        type,
+        limit,
+        request.headers.get("last-event-id") or lastEventId,
+    )
+    return _sse_response(stream, request, compress)
+
+
 @app.get("/api/pipeline/jobs")
-async def pipeline_jobs() -> JSONResponse:
-    jobs = [_job_payload(job) for job in job_manager.list_jobs()]
-    jobs.sort(key=lambda item: item.get("startTs") or 0, reverse=True)
-    return JSONResponse({"jobs": jobs})
+async def pipeline_jobs(
+    type: Optional[str] = None,
+    include_consumed: bool = True,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+) -> JSONResponse:
+    if limit is not None and limit <= 0:
+        raise HTTPException(status_code=400, detail="limit 必须为正整数")
+    jobs, next_cursor = job_manager.list_jobs(
+        job_type=type, include_consumed=include_consumed, limit=limit, cursor=cursor
+    )
+    return JSONResponse({"jobs": [_job_payload(job) for job in jobs], "nextCursor": next_cursor})
 
 
 @app.get("/api/pipeline/jobs/latest")
@@ -1177,6 +4212,45 @@ async def pipeline_jobs_detail(job_id: str) -> JSONResponse:
     return JSONResponse({"job": _job_payload(job)})
 
 
+@app.get("/api/pipeline/jobs/{job_id}/log")
+async def pipeline_jobs_log(
+    job_id: str,
+    offset: int = 0,
+    limit: int = LOG_CHUNK_DEFAULT,
+    follow: bool = False,
+) -> Any:
+    """按字节区间读取任务日志：返回纯文本片段，X-Log-Next-Offset 头给出下一次读取的位置。
+
+    offset 为负数时从末尾倒数（如 -65536 表示最后 64KB）；follow=true 时持续输出新增内容直到任务结束。
+    """
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="job not found")
+    if limit <= 0:
+        raise HTTPException(status_code=400, detail="limit 必须为正整数")
+    limit = min(limit, LOG_CHUNK_MAX)
+    path = _job_log_file(job)
+    loop = asyncio.get_running_loop()
+    data, next_offset, size = await loop.run_in_executor(None, _read_log_chunk, path, offset, limit)
+    start = next_offset - len(data)
+    headers = {
+        "Cache-Control": "no-cache",
+        "X-Log-Offset": str(start),
+        "X-Log-Next-Offset": str(next_offset),
+        "X-Log-Size": str(size),
+    }
+    if not follow:
+        return Response(content=data, media_type="text/plain; charset=utf-8", headers=headers)
+
+    async def stream() -> AsyncIterator[bytes]:
+        if data:
+            yield data
+        async for chunk in _follow_log(job, path, next_offset, limit):
+            yield chunk
+
+    return StreamingResponse(stream(), media_type="text/plain; charset=utf-8", headers=headers)
+
+
 @app.post("/api/pipeline/jobs/{job_id}/consume")
 async def pipeline_jobs_consume(job_id: str) -> Dict[str, Any]:
     if not job_manager.mark_consumed(job_id):
@@ -1189,24 +4263,80 @@ async def root() -> Dict[str, str]:
     return {"message": "Platform IDE Python API server is running"}
 
 
-@app.post("/api/execute/run")
-async def execute_run(payload: Dict[str, Any]) -> Dict[str, Any]:
-    language = str(payload.get("language") or "python").strip().lower()
-    if language not in {"python", "py"}:
-        raise HTTPException(status_code=400, detail="当前仅支持 language=python")
-    code = payload.get("code")
+def _parse_snippet(item: Dict[str, Any], label: str = "") -> Tuple[str, float, Optional[str]]:
+    """校验一段代码的 code / timeout / stdin；label 用于在批量请求的报错中标明是哪一段。"""
+    code = item.get("code")
     if not isinstance(code, str) or not code.strip():
-        raise HTTPException(status_code=400, detail="请求体需提供非空的 code 字符串")
+        raise HTTPException(status_code=400, detail=f"{label}请求体需提供非空的 code 字符串")
 
-    timeout_raw = payload.get("timeout")
+    timeout_raw = item.get("timeout")
     timeout_val = DEFAULT_EXECUTION_TIMEOUT
     if timeout_raw is not None:
         try:
             timeout_val = float(timeout_raw)
         except (TypeError, ValueError):
-            raise HTTPException(status_code=400, detail="timeout 参数必须为数字") from None
+            raise HTTPException(status_code=400, detail=f"{label}timeout 参数必须为数字") from None
+
+    stdin = item.get("stdin")
+    if stdin is not None and not isinstance(stdin, str):
+        raise HTTPException(status_code=400, detail=f"{label}stdin 参数必须为字符串")
+    return code, timeout_val, stdin
+
+
+def _client_ip(request: Request) -> str:
+    if TRUST_PROXY_HEADERS:
+        forwarded = request.headers.get("x-real-ip") or request.headers.get("x-forwarded-for", "").split(",")[0]
+        if forwarded.strip():
+            return forwarded.strip()
+    return request.client.host if request.client else "unknown"
+
+
+def _rejection(exc: ExecutionRejected) -> HTTPException:
+    retry_after = max(1, int(exc.retry_after + 0.999))
+    return HTTPException(status_code=429, detail=exc.reason, headers={"Retry-After": str(retry_after)})
+
+
+def _execution_identity(request: Request, payload: Dict[str, Any]) -> Tuple[str, Optional[str]]:
+    """限流使用的 (来源 IP, 会话)；会话与任务调度相同，取 clientId / X-Client-Id。"""
+    session = payload.get("clientId") or request.headers.get("x-client-id")
+    return _client_ip(request), str(session)[:128] if session else None
+
+
+def _check_execution_rate(request: Request, payload: Dict[str, Any]) -> None:
+    """按来源 IP 与会话限流，超出时返回 429。"""
+    try:
+        execution_admission.check_rate(*_execution_identity(request, payload))
+    except ExecutionRejected as exc:
+        raise _rejection(exc) from None
+
+
+@app.get("/api/execute/stats")
+async def execute_stats() -> Dict[str, Any]:
+    """执行容量相关的运行时指标：并发与排队、等待时间分布、限流计数、预热容器池与结果缓存。"""
+    return {
+        "admission": execution_admission.stats(),
+        "pool": sandbox_pool.stats(),
+        "cache": execution_cache.stats(),
+    }
+
 
-    result = await _execute_python_snippet(code, timeout=timeout_val)
+@app.post("/api/execute/run")
+async def execute_run(payload: Dict[str, Any], request: Request) -> Dict[str, Any]:
+    language = str(payload.get("language") or "python").strip().lower()
+    if language not in {"python", "py"}:
+        raise HTTPException(status_code=400, detail="当前仅支持 language=python")
+    code, timeout_val, stdin = _parse_snippet(payload)
+    _check_execution_rate(request, payload)
+
+    try:
+        result = await _execute_python_snippet(
+            code,
+            timeout=timeout_val,
+            stdin=stdin,
+            deterministic=payload.get("deterministic") is True,
+        )
+    except ExecutionRejected as exc:
+        raise _rejection(exc) from None
     return {
         "status": result["status"],
         "language": "python",
@@ -1215,11 +4345,262 @@ async def execute_run(payload: Dict[str, Any]) -> Dict[str, Any]:
         "exitCode": result["exitCode"],
         "timedOut": result["timedOut"],
         "duration": result["duration"],
+        "truncated": result.get("truncated", False),
+        "cached": result.get("cached", False),
+    }
+
+
+# 流式执行时，两次输出之间推送 tick（已用时间）的间隔（秒）
+EXECUTION_TICK_INTERVAL = 1.0
+
+
+@app.post("/api/execute/stream")
+async def execute_stream(payload: Dict[str, Any], request: Request) -> StreamingResponse:
+    """流式执行一段代码，以 SSE 推送：
+
+    - start：{timeout}
+    - output：{stream: stdout|stderr, data, elapsed}，输出产生时即推送
+    - tick：{elapsed}，无输出期间每秒一次
+    - result：与 /api/execute/run 相同的字段（stdout/stderr 为空）外加 truncated
+
+    输出累计超过 EXECUTION_OUTPUT_LIMIT 时 runner 立即中止执行，result.truncated 为 true。
+    """
+    language = str(payload.get("language") or "python").strip().lower()
+    if language not in {"python", "py"}:
+        raise HTTPException(status_code=400, detail="当前仅支持 language=python")
+    code, timeout_val, stdin = _parse_snippet(payload)
+    safe_timeout = max(1.0, min(timeout_val, MAX_EXECUTION_TIMEOUT))
+    _check_execution_rate(request, payload)
+    try:
+        # 开始推送后就无法再返回 429，队列已满时在这里先拒绝
+        execution_admission.check_queue()
+    except ExecutionRejected as exc:
+        raise _rejection(exc) from None
+
+    async def _stream() -> AsyncIterator[bytes]:
+        chunks: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue()
+        started_at = time.monotonic()
+        budget = EXECUTION_OUTPUT_LIMIT
+        task = asyncio.create_task(
+            _execute_python_snippet(code, timeout=safe_timeout, stdin=stdin, on_output=chunks.put_nowait)
+        )
+        task.add_done_callback(lambda _: chunks.put_nowait(None))
+        try:
+            yield _format_sse("start", {"timeout": safe_timeout})
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.get(), timeout=EXECUTION_TICK_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield _format_sse("tick", {"elapsed": time.monotonic() - started_at})
+                    continue
+                if chunk is None:
+                    break
+                # runner 已按同一上限截断，这里再兜底一次，超出部分不再转发
+                data = str(chunk.get("data") or "")[:budget]
+                if not data:
+                    continue
+                budget -= len(data)
+                yield _format_sse(
+                    "output",
+                    {"stream": chunk.get("stream"), "data": data, "elapsed": chunk.get("elapsed")},
+                )
+            try:
+                result = task.result()
+            except ExecutionRejected as exc:
+                result = {
+                    "status": "rejected",
+                    "stdout": "",
+                    "stderr": exc.reason,
+                    "exitCode": None,
+                    "timedOut": False,
+                    "duration": 0.0,
+                    "truncated": False,
+                }
+            if result.get("truncated"):
+                elapsed = time.monotonic() - started_at
+                notice = "\n...[output truncated, execution stopped]...\n"
+                yield _format_sse("output", {"stream": "stderr", "data": notice, "elapsed": elapsed})
+            yield _format_sse("result", {"language": "python", **result})
+        finally:
+            # 客户端断开时停止执行（预热容器会被回收）
+            task.cancel()
+
+    return _sse_response(_stream(), request, gzip_enabled=False)
+
+
+# 批量执行：单次请求的代码段数量上限，以及 parallel 模式的并发上限
+EXECUTION_BATCH_MAX = max(1, _env_int("EXECUTION_BATCH_MAX", 500))
+EXECUTION_BATCH_CONCURRENCY = max(1, _env_int("EXECUTION_BATCH_CONCURRENCY", 4))
+
+
+class _BatchSnippet(NamedTuple):
+    index: int
+    id: Any
+    code: str
+    timeout: float
+    stdin: Optional[str]
+    # 非 Python 代码段（如 extract_code_examples.py 导出的 js 代码块）不执行，直接标记为 skipped
+    skipped: bool
+
+
+async def _run_batch_snippet(
+    snippet: _BatchSnippet, deterministic: bool, identity: Tuple[str, Optional[str]]
+) -> Dict[str, Any]:
+    head = {"index": snippet.index, "id": snippet.id}
+    if snippet.skipped:
+        return {**head, "status": "skipped"}
+    # 每段代码与单次执行一样计入限流与排队：令牌不足时按 retry_after 等待补充
+    await execution_admission.pace_rate(*identity)
+    result = await _execute_python_snippet(
+        snippet.code, timeout=snippet.timeout, stdin=snippet.stdin, deterministic=deterministic
+    )
+    return {**head, **result, "cached": result.get("cached", False)}
+
+
+def _rejected_snippet(snippet: _BatchSnippet, exc: ExecutionRejected) -> Dict[str, Any]:
+    return {
+        "index": snippet.index,
+        "id": snippet.id,
+        "status": "rejected",
+        "stdout": "",
+        "stderr": exc.reason,
+        "exitCode": None,
+        "timedOut": False,
+        "duration": 0.0,
+        "retryAfter": exc.retry_after,
+        "cached": False,
     }
 
 
+async def _run_batch(
+    snippets: List[_BatchSnippet],
+    *,
+    concurrency: int,
+    deterministic: bool,
+    identity: Tuple[str, Optional[str]],
+) -> AsyncIterator[Dict[str, Any]]:
+    """按完成顺序产出每段代码的结果；concurrency 为 1 时即按提交顺序逐段执行。
+
+    某段被限流或排队拒绝后，尚未开始的代码段不再执行，同样以 rejected 返回。
+    """
+    rejected: List[ExecutionRejected] = []
+
+    async def _run(snippet: _BatchSnippet) -> Dict[str, Any]:
+        if rejected and not snippet.skipped:
+            return _rejected_snippet(snippet, rejected[0])
+        try:
+            return await _run_batch_snippet(snippet, deterministic, identity)
+        except ExecutionRejected as exc:
+            rejected.append(exc)
+            return _rejected_snippet(snippet, exc)
+
+    if concurrency <= 1:
+        for snippet in snippets:
+            yield await _run(snippet)
+        return
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _bounded(snippet: _BatchSnippet) -> Dict[str, Any]:
+        async with semaphore:
+            return await _run(snippet)
+
+    tasks = [asyncio.create_task(_bounded(snippet)) for snippet in snippets]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # 客户端断开时取消尚未执行完的代码段
+        for task in tasks:
+            task.cancel()
+
+
+def _batch_summary(results: Iterable[Dict[str, Any]], started_at: float) -> Dict[str, Any]:
+    counts = {"total": 0, "success": 0, "error": 0, "timeout": 0, "skipped": 0, "rejected": 0}
+    for item in results:
+        counts["total"] += 1
+        status = str(item.get("status"))
+        counts[status if status in counts else "error"] += 1
+    return {**counts, "duration": time.monotonic() - started_at}
+
+
+@app.post("/api/execute/batch")
+async def execute_batch(payload: Dict[str, Any], request: Request) -> Any:
+    """批量执行多段代码，每段都在全新的全局命名空间中运行。
+
+    请求体：{"snippets": [{"code", "id"?, "lang"?, "timeout"?, "stdin"?}, ...],
+    "mode": "sequential" | "parallel", "concurrency"?, "deterministic"?, "stream"?}。
+    stream 默认为 true：以 SSE 推送每段的 result 事件（按完成顺序，带 index 与 id），最后推送 summary；
+    stream=false 时等全部完成后一次性返回按 index 排序的结果。
+    每段代码单独计入限流与执行排队；被拒绝的代码段（及其后未开始的代码段）status 为 rejected，带 retryAfter。
+    """
+    items = payload.get("snippets")
+    if not isinstance(items, list) or not items:
+        raise HTTPException(status_code=400, detail="请求体需提供非空的 snippets 数组")
+    if len(items) > EXECUTION_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"单次最多执行 {EXECUTION_BATCH_MAX} 段代码")
+
+    snippets: List[_BatchSnippet] = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise HTTPException(status_code=400, detail=f"snippets[{index}] 必须为对象")
+        language = str(item.get("lang") or item.get("language") or "python").strip().lower()
+        skipped = language not in {"python", "py"}
+        if skipped:
+            code, timeout_val, stdin = "", DEFAULT_EXECUTION_TIMEOUT, None
+        else:
+            code, timeout_val, stdin = _parse_snippet(item, f"snippets[{index}]: ")
+        snippets.append(_BatchSnippet(index, item.get("id"), code, timeout_val, stdin, skipped))
+
+    mode = str(payload.get("mode") or "sequential").strip().lower()
+    if mode not in {"sequential", "parallel"}:
+        raise HTTPException(status_code=400, detail="mode 仅支持 sequential 或 parallel")
+    concurrency = 1
+    if mode == "parallel":
+        # 默认与预热容器数一致，超出部分会退回一次性 docker run
+        default = min(EXECUTION_BATCH_CONCURRENCY, SANDBOX_POOL_SIZE or EXECUTION_BATCH_CONCURRENCY)
+        requested = _try_parse_int(payload.get("concurrency")) or default
+        concurrency = max(1, min(requested, EXECUTION_BATCH_CONCURRENCY))
+    deterministic = payload.get("deterministic") is True
+    identity = _execution_identity(request, payload)
+    try:
+        # 令牌按段扣除；这里只在排队已满时直接返回 429
+        execution_admission.check_queue()
+    except ExecutionRejected as exc:
+        raise _rejection(exc) from None
+    started_at = time.monotonic()
+
+    if payload.get("stream") is False:
+        batch = _run_batch(snippets, concurrency=concurrency, deterministic=deterministic, identity=identity)
+        results = [item async for item in batch]
+        results.sort(key=lambda item: item["index"])
+        return {"results": results, "summary": _batch_summary(results, started_at)}
+
+    async def _stream() -> AsyncIterator[bytes]:
+        results: List[Dict[str, Any]] = []
+        yield _format_sse("hello", {"total": len(snippets), "mode": mode, "concurrency": concurrency})
+        async for item in _run_batch(snippets, concurrency=concurrency, deterministic=deterministic, identity=identity):
+            results.append(item)
+            yield _format_sse("result", item)
+        yield _format_sse("summary", _batch_summary(results, started_at))
+
+    return _sse_response(_stream(), request, gzip_enabled=False)
+
+
+def _parse_priority(payload: Dict[str, Any], request: Request) -> int:
+    """只有持有 JOB_PRIORITY_TOKEN 的调用方（如内部批处理）才能指定优先级。"""
+    token = request.headers.get("x-priority-token")
+    if not JOB_PRIORITY_TOKEN or not token or not hmac.compare_digest(token.encode("utf-8"), JOB_PRIORITY_TOKEN.encode("utf-8")):
+        return 0
+    return _try_parse_int(payload.get("priority")) or 0
+
+
+def _queued_response(job: JobRecord) -> Dict[str, Any]:
+    return {"jobId": job.id, "status": job.status, "queuePosition": job_scheduler.position(job.id)}
+
+
 @app.post("/api/outline/start")
-async def outline_start(payload: Dict[str, Any]) -> Dict[str, Any]:
+async def outline_start(payload: Dict[str, Any], request: Request) -> Dict[str, Any]:
     subject = str(payload.get("subject") or "").strip()
     if not subject:
         raise HTTPException(status_code=400, detail="主题 subject 必填")
@@ -1242,6 +4623,9 @@ async def outline_start(payload: Dict[str, Any]) -> Dict[str, Any]:
     gemini_key = (payload.get("geminiKey") or None) and str(payload.get("geminiKey"))
     kimi_key = (payload.get("kimiKey") or None) and str(payload.get("kimiKey"))
 
+    if job_scheduler.is_full("outline"):
+        raise HTTPException(status_code=429, detail="大纲生成任务排队已满，请稍后再试")
+
     job = await _run_outline_job(
         subject=subject,
         learning_style=learning_style,
@@ -1251,20 +4635,24 @@ async def outline_start(payload: Dict[str, Any]) -> Dict[str, Any]:
         debug=debug,
         gemini_key=gemini_key,
         kimi_key=kimi_key,
+        client=_client_key(request),
+        priority=_parse_priority(payload, request),
     )
-    return {"jobId": job.id}
+    return _queued_response(job)
 
 
 @app.get("/api/outline/stream")
-async def outline_stream(jobId: str, request: Request) -> StreamingResponse:
+async def outline_stream(
+    jobId: str,
+    request: Request,
+    lastEventId: Optional[str] = None,
+    logs: str = "info",
+    compress: bool = Query(False, alias="gzip"),
+) -> StreamingResponse:
     job = job_manager.get(jobId)
     if not job:
         raise HTTPException(status_code=404, detail=f"job not found: {jobId}")
-    return StreamingResponse(
-        _event_stream(job, request),
-        media_type="text/event-stream",
-        headers={"Cache-Control": "no-cache", "Connection": "keep-alive"},
-    )
+    return _job_stream_response(job, request, lastEventId, logs, compress)
 
 
 @app.get("/api/outline/result")
@@ -1290,21 +4678,15 @@ async def outline_cancel(jobId: str) -> Dict[str, Any]:
     job = job_manager.get(jobId)
     if not job:
         raise HTTPException(status_code=404, detail="job not found")
-    proc = job.process
-    if proc and proc.returncode is None:
-        try:
-            proc.terminate()
-        except ProcessLookupError:
-            pass
-        except Exception as exc:
-            raise HTTPException(status_code=500, detail=str(exc)) from exc
+    job_scheduler.discard(job.id)
+    _terminate_job_process(job)
     job_manager.finish(job, "cancelled")
     job_manager.broadcast(job, "end", {"status": "cancelled"})
     return {"ok": True}
 
 
 @app.post("/api/content/start")
-async def content_start(payload: Dict[str, Any]) -> Dict[str, Any]:
+async def content_start(payload: Dict[str, Any], request: Request) -> Dict[str, Any]:
     ref_job_id = str(payload.get("refJobId") or "").strip() or None
     input_path_raw = payload.get("inputPath")
     selected_chapters = str(payload.get("selectedChapters") or "").strip() or None
@@ -1326,27 +4708,38 @@ async def content_start(payload: Dict[str, Any]) -> Dict[str, Any]:
     if not input_path.exists() or not input_path.is_file():
         raise HTTPException(status_code=400, detail=f"找不到集成大纲文件: {input_path}")
 
-    job = await _run_content_job(input_path=input_path, selected_chapters=selected_chapters, debug=debug)
-    return {"jobId": job.id}
+    if job_scheduler.is_full("content"):
+        raise HTTPException(status_code=429, detail="内容生成任务排队已满，请稍后再试")
+
+    job = await _run_content_job(
+        input_path=input_path,
+        selected_chapters=selected_chapters,
+        debug=debug,
+        client=_client_key(request),
+        priority=_parse_priority(payload, request),
+    )
+    return _queued_response(job)
 
 
 @app.get("/api/content/stream")
-async def content_stream(jobId: str, request: Request) -> StreamingResponse:
+async def content_stream(
+    jobId: str,
+    request: Request,
+    lastEventId: Optional[str] = None,
+    logs: str = "info",
+    compress: bool = Query(False, alias="gzip"),
+) -> StreamingResponse:
     job = job_manager.get(jobId)
     if not job:
         raise HTTPException(status_code=404, detail=f"job not found: {jobId}")
-    return StreamingResponse(
-        _event_stream(job, request),
-        media_type="text/event-stream",
-        headers={"Cache-Control": "no-cache", "Connection": "keep-alive"},
-    )
+    return _job_stream_response(job, request, lastEventId, logs, compress)
 
 
 def _infer_slug_from_report(report_path: Optional[str]) -> Optional[str]:
     if not report_path:
         return None
     base = Path(report_path).name
-    m = re.match(r"^pipeline_report_(.+)\.md$", base)
+    m = _CONTENT_REPORT_NAME_RE.match(base)
     if not m:
         return None
     return m.group(1)
@@ -1387,14 +4780,8 @@ async def content_cancel(jobId: str) -> Dict[str, Any]:
     job = job_manager.get(jobId)
     if not job:
         raise HTTPException(status_code=404, detail="job not found")
-    proc = job.process
-    if proc and proc.returncode is None:
-        try:
-            proc.terminate()
-        except ProcessLookupError:
-            pass
-        except Exception as exc:
-            raise HTTPException(status_code=500, detail=str(exc)) from exc
+    job_scheduler.discard(job.id)
+    _terminate_job_process(job)
     job_manager.finish(job, "cancelled")
     job_manager.broadcast(job, "end", {"status": "cancelled"})
     return {"ok": True}
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Machine-readable progress events for pipeline scripts.
+
+When PIPELINE_PROGRESS=1 (set by scripts/api_server.py), each event is written
+to the process's original stdout as one line: the PROGRESS_PREFIX sentinel
+followed by a JSON object {"event": "<stage>.<name>", ...fields}. Writing to
+sys.__stdout__ keeps these lines out of log files that tee sys.stdout. The
+server dispatches them directly instead of matching log wording. Outside the
+server this is a no-op.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+import threading
+from typing import Any
+
+PROGRESS_PREFIX = "@@progress "
+PROGRESS_ENV = "PIPELINE_PROGRESS"
+
+_lock = threading.Lock()
+
+
+def progress_enabled() -> bool:
+    return os.environ.get(PROGRESS_ENV) == "1"
+
+
+def emit_progress(event: str, **fields: Any) -> None:
+    """Emit one progress event; safe to call from worker threads."""
+    if not progress_enabled():
+        return
+    payload = {"event": event, **fields}
+    line = PROGRESS_PREFIX + json.dumps(payload, ensure_ascii=False, default=str) + "\n"
+    stream = sys.__stdout__ or sys.stdout
+    with _lock:
+        try:
+            stream.write(line)
+            stream.flush()
+        except Exception:
+            pass
@@ -169,6 +169,7 @@ class WorkState(TypedDict, total=False):
 
 
 from scripts.common.llm import build_llm_registry, select_llm_for_node, pick_llm, AsyncLLM as _AsyncLLM
+from scripts.common.progress import emit_progress
 
 
 def _prompt_from_catalog(key: str) -> str:
@@ -714,6 +715,7 @@ async def _propose_fix(
         review_json=json.dumps(review, ensure_ascii=False),
         extras_block=f"{prior_block}{feedback_block}",
     )
+    emit_progress("content.review", pointId=point_id)
     if debug:
         logging.getLogger(__name__).debug("\n==== LLM Prompt [propose_fix] BEGIN ====\n%s\n==== LLM Prompt [propose_fix] END ====\n", prompt)
     try:
@@ -854,6 +856,7 @@ async def generate_and_review_by_chapter_node(state: WorkState, llm_generate, ll
                     draft_path = (drafts_dir / f"{sid}.md")
                     draft_path.write_text(txt_s, encoding="utf-8")
                     logging.getLogger(__name__).info(f"[已保存初稿] {draft_path}")
+                    emit_progress("content.draft", path=str(draft_path))
                 except Exception:
                     pass
         else:
@@ -901,6 +904,7 @@ async def generate_and_review_by_chapter_node(state: WorkState, llm_generate, ll
                     draft_path = (drafts_dir / f"{sid}.md")
                     draft_path.write_text(txt_s, encoding="utf-8")
                     logging.getLogger(__name__).info(f"[已保存初稿] {draft_path}")
+                    emit_progress("content.draft", path=str(draft_path))
                 except Exception:
                     pass
 
@@ -961,6 +965,7 @@ async def generate_and_review_by_chapter_node(state: WorkState, llm_generate, ll
                         draft_path = (drafts_dir / f"{sid}.md")
                         draft_path.write_text(txt_s, encoding="utf-8")
                         logging.getLogger(__name__).info(f"[已保存初稿] {draft_path}")
+                        emit_progress("content.draft", path=str(draft_path))
                     except Exception:
                         pass
 
@@ -1152,6 +1157,7 @@ async def generate_and_review_by_chapter_node_tool(state: WorkState, llm_generat
                     draft_path = drafts_dir / f"{sid}.md"
                     draft_path.write_text(txt_s, encoding="utf-8")
                     logging.getLogger(__name__).info(f"[已保存初稿] {draft_path}")
+                    emit_progress("content.draft", path=str(draft_path))
                 except Exception:
                     pass
         else:
@@ -1199,6 +1205,7 @@ async def generate_and_review_by_chapter_node_tool(state: WorkState, llm_generat
                     draft_path = drafts_dir / f"{sid}.md"
                     draft_path.write_text(txt_s, encoding="utf-8")
                     logging.getLogger(__name__).info(f"[已保存初稿] {draft_path}")
+                    emit_progress("content.draft", path=str(draft_path))
                 except Exception:
                     pass
 
@@ -1264,6 +1271,7 @@ async def generate_and_review_by_chapter_node_tool(state: WorkState, llm_generat
                         draft_path = drafts_dir / f"{sid}.md"
                         draft_path.write_text(txt_s, encoding="utf-8")
                         logging.getLogger(__name__).info(f"[已保存初稿] {draft_path}")
+                        emit_progress("content.draft", path=str(draft_path))
                     except Exception:
                         pass
 
@@ -1597,6 +1605,7 @@ def save_and_publish_node(state: WorkState) -> WorkState:
             outline_path.write_text(outline_md, encoding="utf-8")
             publish_paths.append(str(outline_path.relative_to(BASE_DIR)))
             logging.getLogger(__name__).info(f"大纲已保存: {outline_path}")
+            emit_progress("content.published", path=str(outline_path))
         except Exception as e:
             logging.getLogger(__name__).error(f"保存大纲失败 {outline_path}: {e}")
     return {**state, "publish_paths": publish_paths}
@@ -1684,6 +1693,7 @@ def gather_and_report_node(state: WorkState) -> WorkState:
     try:
         out.write_text(report_md, encoding="utf-8")
         logging.getLogger(__name__).info(f"报告已写出: {out}")
+        emit_progress("content.report", path=str(out))
     except Exception:
         pass
     return {**state, "report_md": report_md}
@@ -2009,6 +2019,7 @@ def main() -> int:
         indices = _parse_selected(args.selected_chapters, total)
         selected_titles = [chapters[i - 1].get("title", "") for i in indices]
         logger.info(f"选择章节: {indices} -> {[t or '未命名' for t in selected_titles]}")
+        emit_progress("content.selected", chapters=indices)
 
         state_local: WorkState = {
             "topic": subject_local,
@@ -2238,6 +2249,7 @@ def main() -> int:
         logger.error(f"[错误] {exc}")
         return 1
 
+    emit_progress("content.done")
     report_md = state.get("report_md", "")
     if report_md:
         print("\n✅ 完成。报告如下：\n")
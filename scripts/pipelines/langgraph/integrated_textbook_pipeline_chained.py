@@ -55,6 +55,7 @@ if str(_REPO_ROOT_CANDIDATE) not in sys.path:
     sys.path.insert(0, str(_REPO_ROOT_CANDIDATE))
 
 from scripts.common.utils import repo_root as _repo_root, load_config as _load_config, slugify as _slugify
+from scripts.common.progress import emit_progress
 from scripts.pipelines.langgraph.textbook_toc_pipeline_langgraph import (
     TextbookTOCResult,
     run_textbook_toc_pipeline,
@@ -100,6 +101,13 @@ class _Tee:
             return False
 
 
+def _retarget_log_handlers(old, new) -> None:
+    """把根 logger 上写往 old 的 StreamHandler 改为写往 new。"""
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, logging.StreamHandler) and handler.stream is old:
+            handler.setStream(new)
+
+
 class StepExecutionError(RuntimeError):
     """封装阶段执行失败的异常，用于统一错误处理。"""
 
@@ -372,6 +380,7 @@ def main(argv: Optional[List[str]] = None) -> int:
     parser.add_argument("--config", default=str(CONFIG_PATH), help="配置文件路径（默认项目根 config.json）")
     parser.add_argument("--out", help="输出 JSON 文件路径（留空则自动生成）")
     parser.add_argument("--log", action="store_true", help="full 阶段：将终端输出镜像到日志文件")
+    parser.add_argument("--log-file", help="full 阶段：将终端输出镜像到指定的日志文件（隐含 --log）")
     parser.add_argument("--debug", action="store_true", help="full 阶段：开启日志并提升日志级别到 DEBUG")
     parser.add_argument("--retry-delay", type=float, default=1.0, help="重试之间的等待秒数（默认 1 秒）")
     parser.add_argument("--load-config-retries", type=int, default=1, help="加载配置的最大尝试次数（默认 1）")
@@ -486,6 +495,7 @@ def main(argv: Optional[List[str]] = None) -> int:
             logger=logger,
         )
         logger.info("[完成] 输出文件: %s", out_path)
+        emit_progress("outline.output", path=str(out_path))
         recs = toc_result.get("recommendations", []) or []
         logger.info("推荐教材: %d 本 (展示前 %d 本)", len(recs), min(3, len(recs)))
         for i, book in enumerate(recs[:3], 1):
@@ -493,6 +503,7 @@ def main(argv: Optional[List[str]] = None) -> int:
         tocs = toc_result.get("tocs", []) or []
         ok = sum(1 for t in tocs if not t.get("error"))
         logger.info("目录获取成功: %d/%d", ok, len(tocs))
+        emit_progress("collect.done", ok=ok, total=len(tocs))
         return 0
 
     if stage == "reconstruct":
@@ -598,13 +609,17 @@ def main(argv: Optional[List[str]] = None) -> int:
     log_fp = None
     orig_stdout, orig_stderr = sys.stdout, sys.stderr
 
-    if args.log or args.debug:
-        log_dir = BASE_DIR / "output" / "integrated_pipeline"
-        log_dir.mkdir(parents=True, exist_ok=True)
-        log_path = log_dir / f"{slug}-integrated-{ts}.log"
+    if args.log or args.debug or args.log_file:
+        if args.log_file:
+            log_path = Path(args.log_file)
+        else:
+            log_path = BASE_DIR / "output" / "integrated_pipeline" / f"{slug}-integrated-{ts}.log"
+        log_path.parent.mkdir(parents=True, exist_ok=True)
         log_fp = open(log_path, "w", encoding="utf-8")
         sys.stdout = _Tee(sys.stdout, log_fp)
         sys.stderr = _Tee(sys.stderr, log_fp)
+        # basicConfig 的 handler 绑定的是替换前的 stderr，改指向 Tee，日志行才会写进日志文件
+        _retarget_log_handlers(orig_stderr, sys.stderr)
 
     try:
         combined, toc_result, recon_result = run_full_pipeline(
@@ -636,6 +651,7 @@ def main(argv: Optional[List[str]] = None) -> int:
                 sys.stderr.flush()
             except Exception:
                 pass
+            _retarget_log_handlers(sys.stderr, orig_stderr)
             sys.stdout = orig_stdout
             sys.stderr = orig_stderr
             try:
@@ -668,6 +684,7 @@ def main(argv: Optional[List[str]] = None) -> int:
     )
 
     logger.info("[完成] 输出文件: %s", out_path)
+    emit_progress("outline.output", path=str(out_path))
     recs = toc_result.get("recommendations", []) or []
     logger.info("推荐教材: %d 本 (展示前 %d 本)", len(recs), min(3, len(recs)))
     for i, book in enumerate(recs[:3], 1):
@@ -675,10 +692,12 @@ def main(argv: Optional[List[str]] = None) -> int:
     tocs = toc_result.get("tocs", []) or []
     ok = sum(1 for t in tocs if not t.get("error"))
     logger.info("目录获取成功: %d/%d", ok, len(tocs))
+    emit_progress("collect.done", ok=ok, total=len(tocs))
     if recon_result.outline:
         logger.info("大纲重构: 成功")
     else:
         logger.warning("大纲重构: 结果为空")
+    emit_progress("outline.done", ok=bool(recon_result.outline))
 
     if log_fp is not None:
         try:
@@ -686,6 +705,7 @@ def main(argv: Optional[List[str]] = None) -> int:
             sys.stderr.flush()
         except Exception:
             pass
+        _retarget_log_handlers(sys.stderr, orig_stderr)
         sys.stdout = orig_stdout
         sys.stderr = orig_stderr
         try:
@@ -35,6 +35,7 @@ from datetime import datetime
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 from scripts.common.llm import build_llm_registry, pick_llm
+from scripts.common.progress import emit_progress
 from scripts.common.utils import repo_root as _repo_root, load_config as _load_config, slugify as _slugify, extract_json_object as _extract_json
 
 # -----------------------------
@@ -281,6 +282,7 @@ def run_reconstruct_outline(
             raise RuntimeError(f"主题分类失败: {final_subject_type}")
     logger.info("主题分类: %s → %s", subject, final_subject_type)
     print(f"[信息] 主题分类结果: {subject} → {final_subject_type}", file=sys.stderr)
+    emit_progress("outline.start", subjectType=final_subject_type)
 
     materials_obj = materials or {"subject": subject, "materials": []}
     usable_materials = []
@@ -306,6 +308,7 @@ def run_reconstruct_outline(
     try:
         if stream:
             print("[信息] 正在以流式方式接收模型输出…", file=sys.stderr)
+            emit_progress("outline.stream")
             buf: List[str] = []
             for piece in caller.stream_complete(prompt, max_tokens=max_tokens_arg):
                 buf.append(piece)
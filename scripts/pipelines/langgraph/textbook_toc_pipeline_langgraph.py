@@ -40,6 +40,7 @@ from datetime import datetime
 from pathlib import Path
 from typing import Any, Dict, List, Optional, TypedDict
 from scripts.common.llm import build_llm_registry, pick_llm, select_llm_for_node
+from scripts.common.progress import emit_progress
 from scripts.common.utils import repo_root as _repo_root, load_config as _load_config, slugify as _slugify, parse_json as _parse_json, ensure_dir
 
 # --- 依赖导入（若缺失给出友好提示） ---
@@ -204,6 +205,7 @@ def recommend_textbooks(state: PipelineState) -> PipelineState:
         logger.info("[1/2] 调用 LLM 推荐教材 … 主题=%s | 学习者期望已提供", subject)
     else:
         logger.info("[1/2] 调用 LLM 推荐教材 … 主题=%s", subject)
+    emit_progress("collect.start")
     prompt_tmpl = _prompt_from_catalog(
         "toc.recommend",
         "你是资深课程设计专家。请基于全球范围内的经典/权威/广泛采用的教材，推荐与主题“[subject]”最相关的教材。\n\n"
@@ -395,6 +397,7 @@ def fetch_kimi_tocs(state: PipelineState) -> PipelineState:
         raise ValueError("没有教材推荐，无法执行 Kimi TOC 查询。")
 
     logger.info("[2/2] 并行检索教材目录 … 并行度=%d，待检索=%d 本", max_parallel, len(recs))
+    emit_progress("collect.fetch", total=len(recs))
     results: List[Dict[str, Any]] = []
     with cf.ThreadPoolExecutor(max_workers=max_parallel) as executor:
         future_map = {executor.submit(_fetch_one_toc, kimi_cfg, b, bool(state.get("print_prompt"))): b for b in recs}
@@ -408,9 +411,11 @@ def fetch_kimi_tocs(state: PipelineState) -> PipelineState:
                     logger.warning("完成但有错误: 《%s》 -> %s", title, res.get("error"))
                 else:
                     logger.info("完成: 《%s》 (目录获取成功)", title)
+                emit_progress("collect.item", title=title, ok=not res.get("error"))
             except Exception as e:
                 logger.error("任务异常: 《%s》 -> %s", title, e)
                 results.append({"book": {"title": title}, "error": f"并行任务失败: {e}"})
+                emit_progress("collect.item", title=title, ok=False)
 
     new_state = dict(state)
     new_state["tocs"] = results
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+预热的流水线工作进程（api_server 的 worker pool 模式使用）。
+
+- 启动后先导入 langgraph / openai / google-generativeai 以及两个流水线脚本，然后向 stdout 输出就绪标记
+- 随后从 stdin 读取一行 JSON 任务描述：{"script": "outline" | "content", "argv": [...]}
+- 在本进程内调用对应脚本的 main()，stdout/stderr 即任务日志，与直接启动脚本时完全一致
+- 每个进程只执行一个任务，结束后以脚本返回码退出，避免任务之间共享状态
+
+用法（通常由 api_server 启动）：
+  python -u -m scripts.pipelines.pipeline_worker
+"""
+
+from __future__ import annotations
+
+import importlib
+import importlib.util
+import json
+import os
+import sys
+from contextlib import redirect_stderr, redirect_stdout
+from pathlib import Path
+from types import ModuleType
+from typing import Dict, List
+
+_REPO_ROOT = Path(__file__).resolve().parents[2]
+if str(_REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(_REPO_ROOT))
+
+READY_MARKER = "@@PIPELINE_WORKER_READY@@"
+
+PIPELINE_SCRIPTS: Dict[str, Path] = {
+    "outline": _REPO_ROOT / "scripts" / "pipelines" / "langgraph" / "integrated_textbook_pipeline_chained.py",
+    "content": _REPO_ROOT / "scripts" / "pipelines" / "generation" / "generate_chapters_from_integrated_standalone.py",
+}
+
+# 可通过 PIPELINE_WORKER_PRELOAD（逗号分隔）覆盖
+DEFAULT_PRELOAD = ("langgraph", "openai", "google.generativeai")
+
+
+def _preload(names: List[str]) -> None:
+    for name in names:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            # 缺失的可选依赖留到真正执行时再报错
+            continue
+
+
+def _load_script(kind: str) -> ModuleType:
+    path = PIPELINE_SCRIPTS[kind]
+    module_name = f"_pipeline_{kind}"
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    if spec is None or spec.loader is None:
+        raise ImportError(f"无法加载流水线脚本: {path}")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def main() -> int:
+    raw_preload = os.environ.get("PIPELINE_WORKER_PRELOAD")
+    preload = [name.strip() for name in (raw_preload or ",".join(DEFAULT_PRELOAD)).split(",") if name.strip()]
+    modules: Dict[str, ModuleType] = {}
+    # 预加载阶段的输出不属于任何任务，丢弃；导入失败时在收到任务后重试，错误会出现在任务日志里
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull), redirect_stderr(devnull):
+        _preload(preload)
+        for kind in PIPELINE_SCRIPTS:
+            try:
+                modules[kind] = _load_script(kind)
+            except (Exception, SystemExit):
+                sys.modules.pop(f"_pipeline_{kind}", None)
+
+    print(READY_MARKER, flush=True)
+
+    line = sys.stdin.readline()
+    if not line.strip():
+        # 服务端关闭了空闲进程
+        return 0
+    spec = json.loads(line)
+    kind = str(spec.get("script") or "")
+    if kind not in PIPELINE_SCRIPTS:
+        print(f"[worker] 未知的流水线类型: {kind}", file=sys.stderr)
+        return 2
+    argv = [str(arg) for arg in spec.get("argv") or []]
+
+    module = modules.get(kind) or _load_script(kind)
+    sys.argv = [str(PIPELINE_SCRIPTS[kind]), *argv]
+    if kind == "outline":
+        code = module.main(argv)
+    else:
+        code = module.main()
+    return int(code or 0)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from scripts import api_server  # noqa: E402
+
+
+@pytest.fixture
+def state_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """把任务存储（快照、追加日志、索引、SQLite、归档）指向临时目录。"""
+    monkeypatch.setattr(api_server, "JOBS_STATE_FILE", tmp_path / "jobs.json")
+    monkeypatch.setattr(api_server, "JOBS_JOURNAL_FILE", tmp_path / "jobs.journal.jsonl")
+    monkeypatch.setattr(api_server, "JOBS_INDEX_FILE", tmp_path / "jobs.index.json")
+    monkeypatch.setattr(api_server, "JOBS_SQLITE_FILE", tmp_path / "jobs.sqlite3")
+    monkeypatch.setattr(api_server, "JOBS_ARCHIVE_DIR", tmp_path / "archive")
+    # 保留策略由需要的测试单独开启
+    monkeypatch.setattr(api_server, "JOBS_RETENTION_MAX", 0)
+    monkeypatch.setattr(api_server, "JOBS_RETENTION_DAYS", 0)
+    return tmp_path
+
+
+@pytest.fixture
+def manager(state_dir: Path, monkeypatch: pytest.MonkeyPatch) -> "api_server.JobManager":
+    """隔离的 JobManager，同时替换模块级的 job_manager，供日志解析与路由函数使用。"""
+    instance = api_server.JobManager()
+    monkeypatch.setattr(api_server, "job_manager", instance)
+    return instance
@@ -0,0 +1,84 @@
+"""代码执行准入：令牌桶与批量执行的逐段计费。"""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Dict
+
+import pytest
+
+from scripts import api_server
+
+
+@pytest.fixture
+def rates(monkeypatch):
+    def configure(per_ip: int, burst_ip: int, per_session: int = 0, burst_session: int = 1) -> None:
+        monkeypatch.setattr(api_server, "EXECUTION_RATE_PER_IP", per_ip)
+        monkeypatch.setattr(api_server, "EXECUTION_BURST_PER_IP", burst_ip)
+        monkeypatch.setattr(api_server, "EXECUTION_RATE_PER_SESSION", per_session)
+        monkeypatch.setattr(api_server, "EXECUTION_BURST_PER_SESSION", burst_session)
+
+    return configure
+
+
+def test_rejected_check_takes_no_token(rates):
+    rates(per_ip=1, burst_ip=5, per_session=1, burst_session=1)
+    admission = api_server.ExecutionAdmission(1, 1, 1)
+
+    admission.check_rate("1.2.3.4", "s")
+    with pytest.raises(api_server.ExecutionRejected):
+        admission.check_rate("1.2.3.4", "s")
+
+    # 会话桶已空，IP 桶不应被白白扣掉一个令牌
+    assert admission._buckets["ip:1.2.3.4"].tokens == pytest.approx(4, abs=0.01)
+    assert admission.stats()["rejectedRate"] == 1
+
+
+def test_pace_rate_waits_for_refill_without_counting(rates):
+    rates(per_ip=1200, burst_ip=1)
+    admission = api_server.ExecutionAdmission(1, 1, 5)
+
+    async def scenario() -> None:
+        await admission.pace_rate("ip", None)
+        await admission.pace_rate("ip", None)
+
+    asyncio.run(scenario())
+
+    assert admission.stats()["rejectedRate"] == 0
+
+
+def test_pace_rate_rejects_beyond_queue_timeout(rates):
+    rates(per_ip=1, burst_ip=1)
+    admission = api_server.ExecutionAdmission(1, 1, 1)
+
+    async def scenario() -> None:
+        await admission.pace_rate("ip", None)
+        await admission.pace_rate("ip", None)
+
+    with pytest.raises(api_server.ExecutionRejected):
+        asyncio.run(scenario())
+    assert admission.stats()["rejectedRate"] == 1
+
+
+def test_batch_charges_each_snippet(rates, monkeypatch):
+    rates(per_ip=1, burst_ip=2)
+    monkeypatch.setattr(api_server, "execution_admission", api_server.ExecutionAdmission(2, 4, 1))
+
+    async def fake_execute(code: str, **kwargs: Any) -> Dict[str, Any]:
+        return {"status": "success", "stdout": code, "stderr": "", "exitCode": 0, "timedOut": False, "duration": 0.0}
+
+    monkeypatch.setattr(api_server, "_execute_python_snippet", fake_execute)
+    snippets = [
+        api_server._BatchSnippet(index, None, f"print({index})", 1.0, None, index == 3) for index in range(5)
+    ]
+
+    async def scenario():
+        batch = api_server._run_batch(snippets, concurrency=1, deterministic=False, identity=("ip", None))
+        return [item async for item in batch]
+
+    results = asyncio.run(scenario())
+
+    assert [item["status"] for item in results] == ["success", "success", "rejected", "skipped", "rejected"]
+    assert results[2]["retryAfter"] > 0
+    summary = api_server._batch_summary(results, 0.0)
+    assert summary["rejected"] == 2 and summary["success"] == 2
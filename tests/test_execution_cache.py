@@ -0,0 +1,65 @@
+"""执行结果缓存：不确定代码的识别与镜像 ID 查询。"""
+
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from scripts import api_server
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        "import random\nprint(random.random())",
+        "from time import sleep",
+        "import datetime as dt",
+        "import numpy.random",
+        "from numpy import random",
+        "from numpy.random import default_rng",
+        "def f():\n    import uuid\n    return uuid.uuid4()",
+        "import os\nprint(os.getpid())",
+    ],
+)
+def test_nondeterministic_imports(code):
+    assert api_server._is_nondeterministic(code)
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        "# 计算 time complexity\nprint(sum(range(10)))",
+        "timer = 3\nprint('random')",
+        "import numpy as np\nprint(np.arange(3))",
+        "from . import random",
+        "def broken(:\n    pass",
+    ],
+)
+def test_deterministic_code(code):
+    assert not api_server._is_nondeterministic(code)
+
+
+def test_concurrent_callers_share_one_digest_lookup(tmp_path):
+    cache = api_server.ExecutionResultCache(True, tmp_path, 8, 60)
+    calls = []
+
+    async def lookup():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        cache._digest = "sha256:abc"
+        cache._digest_checked = api_server.time.monotonic()
+        return cache._digest
+
+    cache._lookup_digest = lookup
+
+    async def scenario():
+        digests = await asyncio.gather(*(cache._image_digest() for _ in range(5)))
+        return digests, cache._digest_task, await cache._image_digest()
+
+    digests, task, again = asyncio.run(scenario())
+
+    assert digests == ["sha256:abc"] * 5
+    assert again == "sha256:abc"
+    assert len(calls) == 1
+    assert task is None
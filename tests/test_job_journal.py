@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import importlib.util
+import json
+import sys
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Dict
+
+import pytest
+
+from scripts import api_server
+from scripts.common import utils as common_utils
+from scripts.api_server import JobRecord, _JobJournal
+
+
+def _record(job_id: str, start_ts: float, **fields: Any) -> Dict[str, Any]:
+    job = JobRecord(id=job_id, type=fields.pop("type", "outline"), start_ts=start_ts, **fields)
+    return dict(job.record())
+
+
+def _journal(state_dir: Path, compact_every: int = 100) -> _JobJournal:
+    return _JobJournal(state_dir / "jobs.json", state_dir / "jobs.journal.jsonl", compact_every)
+
+
+def test_replay_keeps_last_record_and_applies_deletes(state_dir: Path) -> None:
+    journal = _journal(state_dir)
+    journal.append([_record("outline-1-a", 1.0), _record("outline-2-b", 2.0)])
+    journal.append([_record("outline-1-a", 1.0, status="success")])
+    journal.remove(["outline-2-b"])
+
+    reloaded = _journal(state_dir)
+    records, summaries = reloaded.load()
+
+    assert summaries == []
+    assert [(item["id"], item["status"]) for item in records] == [("outline-1-a", "success")]
+    assert not reloaded.needs_compaction
+    # 每条追加记录（含删除）都计入压缩阈值
+    eager = _journal(state_dir, compact_every=4)
+    eager.load()
+    assert eager.needs_compaction
+
+
+def test_compaction_round_trip_serves_records_from_index(state_dir: Path) -> None:
+    journal = _journal(state_dir)
+    first = _record("outline-1-a", 1.0, status="success", subject="线性代数")
+    second = _record("content-2-b", 2.0, type="content", status="error", consumed=True)
+    journal.append([first, second])
+    journal.compact([first, second])
+
+    assert not (state_dir / "jobs.journal.jsonl").exists()
+    reloaded = _journal(state_dir)
+    records, summaries = reloaded.load()
+
+    # 有有效索引时启动只加载摘要，完整记录按偏移读取
+    assert records == []
+    assert {summary.id: (summary.type, summary.status, summary.consumed) for summary in summaries} == {
+        "outline-1-a": ("outline", "success", False),
+        "content-2-b": ("content", "error", True),
+    }
+    assert reloaded.get("outline-1-a") == first
+    assert reloaded.get("content-2-b") == second
+    assert json.loads((state_dir / "jobs.json").read_text(encoding="utf-8")) == [first, second]
+
+
+def test_compaction_carries_unloaded_jobs_byte_for_byte(state_dir: Path) -> None:
+    journal = _journal(state_dir)
+    old = _record("outline-1-a", 1.0, status="success", subject="概率论")
+    journal.compact([old])
+
+    reloaded = _journal(state_dir)
+    _, summaries = reloaded.load()
+    fresh = _record("outline-2-b", 2.0)
+    reloaded.compact([fresh], carry=summaries)
+
+    again = _journal(state_dir)
+    records, summaries = again.load()
+    assert records == []
+    assert sorted(summary.id for summary in summaries) == ["outline-1-a", "outline-2-b"]
+    assert again.get("outline-1-a") == old
+    assert again.get("outline-2-b") == fresh
+
+
+def test_index_survives_crash_mid_append(state_dir: Path) -> None:
+    journal = _journal(state_dir)
+    journal.compact([_record("outline-1-a", 1.0, status="success")])
+    journal.append([_record("outline-2-b", 2.0, status="running")])
+    # 进程在追加写到一半时崩溃：最后一行不完整
+    with (state_dir / "jobs.journal.jsonl").open("a", encoding="utf-8") as fh:
+        fh.write('{"op": "put", "job": {"id": "outline-3-c", "sta')
+
+    reloaded = _journal(state_dir)
+    records, summaries = reloaded.load()
+
+    # 快照未被改动，索引仍然有效；完整的追加记录照常重放，半行被跳过
+    assert [summary.id for summary in summaries] == ["outline-1-a"]
+    assert [item["id"] for item in records] == ["outline-2-b"]
+    assert reloaded.get("outline-1-a")["status"] == "success"
+    assert not reloaded.needs_compaction
+
+
+def test_stale_index_falls_back_to_full_snapshot_parse(state_dir: Path) -> None:
+    journal = _journal(state_dir)
+    journal.compact([_record("outline-1-a", 1.0)])
+    # 模拟快照已替换、索引尚未写出时崩溃：索引记录的大小与快照不一致
+    first = _record("outline-1-a", 1.0, status="success")
+    second = _record("outline-2-b", 2.0)
+    (state_dir / "jobs.json").write_text(json.dumps([first, second], ensure_ascii=False), encoding="utf-8")
+
+    reloaded = _journal(state_dir)
+    records, summaries = reloaded.load()
+
+    assert summaries == []
+    assert sorted(item["id"] for item in records) == ["outline-1-a", "outline-2-b"]
+    assert reloaded.needs_compaction
+    assert reloaded.get("outline-1-a") is None
+
+
+def test_job_manager_round_trip_through_journal(manager: api_server.JobManager) -> None:
+    job = manager.create_job("outline", subject="离散数学")
+    manager.update_stage(job, "collect", {"status": "completed", "progress": 1})
+    manager.finish(job, "success")
+    manager.close()
+
+    reloaded = api_server.JobManager()
+    restored = reloaded.get(job.id)
+
+    assert restored is not None
+    assert restored.status == "success"
+    assert restored.subject == "离散数学"
+    assert restored.stages["collect"].status == "completed"
+
+
+def _import_fresh(root: Path, monkeypatch: pytest.MonkeyPatch) -> ModuleType:
+    """以 root 为仓库根重新执行一遍 api_server 模块，模拟服务重启（模块级 job_manager 在导入时加载任务）。"""
+    monkeypatch.setattr(common_utils, "repo_root", lambda start=None: root)
+    spec = importlib.util.spec_from_file_location("api_server_restarted", api_server.__file__)
+    module = importlib.util.module_from_spec(spec)
+    # dataclass 需要在 sys.modules 中找到所属模块
+    monkeypatch.setitem(sys.modules, spec.name, module)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_jobs_survive_module_reimport(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    before = _import_fresh(tmp_path, monkeypatch)
+    job = before.job_manager.create_job("outline", subject="python")
+    job.log_offset = 42
+    before.job_manager.finish(job, "success")
+    before.job_manager._flush_sync()
+
+    after = _import_fresh(tmp_path, monkeypatch)
+    restored = after.job_manager.get(job.id)
+
+    assert restored is not None
+    assert restored.status == "success"
+    assert restored.log_offset == 42
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from pathlib import Path
+from typing import Any, Callable, List
+
+import pytest
+
+from scripts import api_server
+
+
+def _failing_once(original: Callable[..., Any]) -> Callable[..., Any]:
+    calls: List[int] = []
+
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        calls.append(1)
+        if len(calls) == 1:
+            raise OSError("disk full")
+        return original(*args, **kwargs)
+
+    return wrapper
+
+
+def test_failed_async_flush_keeps_dirty_jobs(manager: api_server.JobManager, monkeypatch: pytest.MonkeyPatch) -> None:
+    store = manager._store
+    monkeypatch.setattr(store, "append", _failing_once(store.append))
+
+    async def scenario() -> str:
+        job = manager.create_job("outline", subject="编译原理")
+        manager.finish(job, "success")
+        await manager.flush()
+        # 第一次写盘失败：任务仍在待落盘集合中，并已安排重试
+        assert job.id in manager._dirty
+        assert manager._flush_task is not None and not manager._flush_task.done()
+        await manager.flush()
+        assert not manager._dirty
+        manager.close()
+        return job.id
+
+    job_id = asyncio.run(scenario())
+    restored = api_server.JobManager().get(job_id)
+    assert restored is not None and restored.status == "success"
+
+
+def test_failed_sync_flush_is_retried_on_close(manager: api_server.JobManager, monkeypatch: pytest.MonkeyPatch) -> None:
+    store = manager._store
+    monkeypatch.setattr(store, "append", _failing_once(store.append))
+
+    job = manager.create_job("content", subject="操作系统")
+    assert job.id in manager._dirty
+    manager.close()
+
+    restored = api_server.JobManager().get(job.id)
+    assert restored is not None and restored.subject == "操作系统"
+
+
+def _finished(manager: api_server.JobManager, job_type: str = "outline") -> api_server.JobRecord:
+    # 归档按任务 id 中的时间戳定位月份文件，start_ts 保持真实时间；间隔 2ms 保证先后顺序
+    time.sleep(0.002)
+    job = manager.create_job(job_type)
+    manager.finish(job, "success")
+    return job
+
+
+def test_failed_archive_keeps_evicted_jobs(manager: api_server.JobManager, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(api_server, "JOBS_RETENTION_MAX", 1)
+    archive = manager._archive
+    monkeypatch.setattr(archive, "write", _failing_once(archive.write))
+
+    old = _finished(manager)
+    new = _finished(manager)
+
+    # 归档失败：任务仍可读取，且压缩快照时不会被丢掉
+    assert old.id in manager._evicted
+    assert manager.get(old.id).status == "success"
+    manager._persist_jobs()
+    assert api_server.JobManager().get(old.id) is not None
+
+    manager.close()
+    assert not manager._evicted
+    assert archive.get(old.id)["status"] == "success"
+    jobs, _ = manager.list_jobs()
+    assert [job.id for job in jobs] == [new.id]
+
+
+def test_mark_consumed_on_archived_job_stays_archived(
+    manager: api_server.JobManager, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(api_server, "JOBS_RETENTION_MAX", 1)
+    old = _finished(manager)
+    new = _finished(manager)
+    assert not manager._evicted
+
+    assert manager.mark_consumed(old.id)
+    manager.close()
+
+    reloaded = api_server.JobManager()
+    jobs, _ = reloaded.list_jobs()
+    assert [job.id for job in jobs] == [new.id]
+    restored = reloaded.get(old.id)
+    assert restored is not None and restored.consumed
+
+
+def test_sqlite_retention_counts_stored_jobs(state_dir: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(api_server, "JOBS_STORE", "sqlite")
+    writer = api_server.JobManager()
+    old = [_finished(writer) for _ in range(3)]
+    writer.close()
+
+    # 新进程只把运行中的任务读入内存，保留策略仍需按库中的全部任务计算
+    monkeypatch.setattr(api_server, "JOBS_RETENTION_MAX", 2)
+    reader = api_server.JobManager()
+    assert not reader._jobs
+    latest = _finished(reader)
+    reader.close()
+
+    jobs, _ = reader.list_jobs()
+    assert [job.id for job in jobs] == [latest.id, old[2].id]
+    assert reader._store.get(old[0].id) is None
+    assert reader._archive.get(old[0].id) is not None
+    assert reader.get(old[1].id).status == "success"
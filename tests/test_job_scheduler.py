@@ -0,0 +1,111 @@
+"""任务调度：启动期间取消的任务不能被复活；优先级与公平调度不受调用方自报信息左右。"""
+
+from __future__ import annotations
+
+import asyncio
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+from scripts import api_server
+
+
+def test_cancel_during_slow_spawn_kills_process(manager, monkeypatch):
+    scheduler = api_server.JobScheduler(manager, {"outline": 1}, 10)
+    monkeypatch.setattr(api_server, "job_scheduler", scheduler)
+    spawned: List[Any] = []
+
+    async def scenario() -> api_server.JobRecord:
+        requested = asyncio.Event()
+        release = asyncio.Event()
+
+        async def slow_spawn(script: str, script_path: Path, argv: List[str]):
+            requested.set()
+            await release.wait()
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, "-c", "import time; time.sleep(30)"
+            )
+            spawned.append(process)
+            return process, "sleep"
+
+        monkeypatch.setattr(api_server, "_spawn_pipeline", slow_spawn)
+        job = await api_server._run_outline_job(
+            "python", "实践", None, None, False, False, None, None, client="test"
+        )
+        await asyncio.wait_for(requested.wait(), 5)
+
+        await api_server.outline_cancel(job.id)
+        release.set()
+        await asyncio.wait_for(asyncio.gather(*scheduler._tasks), 5)
+        return job
+
+    job = asyncio.run(scenario())
+
+    assert job.status == "cancelled"
+    assert job.process is None
+    assert len(spawned) == 1
+    assert spawned[0].returncode is not None
+
+
+def test_rounds_advance_per_priority_level(manager):
+    scheduler = api_server.JobScheduler(manager, {"outline": 1}, 10)
+    started: List[str] = []
+    gates: Dict[str, asyncio.Event] = {}
+
+    async def scenario() -> None:
+        def submit(name: str, client: str, priority: int = 0) -> None:
+            job = manager.create_job("outline", subject=name, status="queued")
+            gates[name] = asyncio.Event()
+
+            async def launch() -> None:
+                started.append(name)
+                await gates[name].wait()
+
+            scheduler.submit(job, launch, client=client, priority=priority)
+
+        async def finish(name: str) -> None:
+            gates[name].set()
+            for _ in range(5):
+                await asyncio.sleep(0)
+
+        submit("blocker", "x")
+        await asyncio.sleep(0)
+        submit("H1", "b", 5)
+        submit("H2", "b", 5)
+        submit("L1", "a")
+        submit("L2", "a")
+        for name in ("blocker", "H1", "H2"):
+            await finish(name)
+        # 高优先级任务出队推进的轮次不影响普通队列：新客户端排在 a 的第二个任务之前
+        submit("C1", "c")
+        for name in ("L1", "C1", "L2"):
+            await finish(name)
+
+    asyncio.run(scenario())
+
+    assert started == ["blocker", "H1", "H2", "L1", "C1", "L2"]
+
+
+class _Request:
+    def __init__(self, headers: Dict[str, str], host: str = "10.0.0.1") -> None:
+        self.headers = headers
+        self.client = SimpleNamespace(host=host)
+
+
+def test_priority_requires_token(monkeypatch):
+    payload = {"priority": 9}
+    monkeypatch.setattr(api_server, "JOB_PRIORITY_TOKEN", None)
+    assert api_server._parse_priority(payload, _Request({"x-priority-token": "anything"})) == 0
+
+    monkeypatch.setattr(api_server, "JOB_PRIORITY_TOKEN", "secret")
+    assert api_server._parse_priority(payload, _Request({})) == 0
+    assert api_server._parse_priority(payload, _Request({"x-priority-token": "wrong"})) == 0
+    assert api_server._parse_priority(payload, _Request({"x-priority-token": "secret"})) == 9
+
+
+def test_fairness_key_ignores_self_declared_client_id():
+    first = api_server._client_key(_Request({"x-client-id": "one"}))
+    second = api_server._client_key(_Request({"x-client-id": "two"}))
+
+    assert first == second == "ip:10.0.0.1"
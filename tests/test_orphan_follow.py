@@ -0,0 +1,83 @@
+"""重启后跟踪遗留子进程：从启动时的 offset 回放日志，并确认 pid 仍属于该任务。"""
+
+from __future__ import annotations
+
+import asyncio
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from scripts import api_server
+
+
+def _orphan(manager, log_path: Path, offset: int):
+    job = manager.create_job("outline", status="running")
+    job.log_path = str(log_path)
+    job.log_offset = offset
+    job.pid = None
+    return job
+
+
+def test_replay_starts_at_launch_offset(manager, tmp_path, monkeypatch):
+    # 块远小于一行，确保多字节字符被拆到两次读取中也能正确拼接
+    monkeypatch.setattr(api_server, "ORPHAN_REPLAY_CHUNK", 5)
+    previous = "大纲重构: 失败\n".encode("utf-8")
+    log_path = tmp_path / "outline.log"
+    log_path.write_bytes(previous + "大纲重构: 成功\n".encode("utf-8"))
+    job = _orphan(manager, log_path, len(previous))
+
+    asyncio.run(api_server._follow_orphan(job))
+
+    assert job.status == "success"
+    assert job.stages["outline"].status == "completed"
+    events = [event for _, event, _, _ in job.events]
+    # 重启前已写入的内容只用于恢复进度，不再作为日志推送
+    assert "log" not in events
+    assert events[-1] == "end"
+
+
+def test_missing_log_fails_orphan(manager, tmp_path):
+    job = _orphan(manager, tmp_path / "missing.log", 0)
+
+    asyncio.run(api_server._follow_orphan(job))
+
+    assert job.status == "error"
+
+
+@pytest.fixture
+def sleeper():
+    processes = []
+
+    def spawn(*extra: str) -> subprocess.Popen:
+        code = "import time; print('ready', flush=True); time.sleep(30)"
+        process = subprocess.Popen([sys.executable, "-c", code, *extra], stdout=subprocess.PIPE)
+        processes.append(process)
+        # 等子进程完成 exec，命令行才是它自己的
+        process.stdout.readline()
+        return process
+
+    yield spawn
+    for process in processes:
+        process.kill()
+        process.wait()
+        process.stdout.close()
+
+
+def test_worker_pid_needs_matching_start_time(sleeper):
+    worker = sleeper(api_server.PIPELINE_WORKER_MODULE)
+    started = api_server._process_start_time(worker.pid)
+
+    assert started is not None
+    # 仅凭工作进程模块名无法确认是哪个任务的进程（可能是空闲进程或另一类任务）
+    assert not api_server._pid_is_pipeline(worker.pid, "outline")
+    assert api_server._pid_is_pipeline(worker.pid, "content", started)
+    assert not api_server._pid_is_pipeline(worker.pid, "outline", started + 1)
+
+
+def test_script_pid_matches_by_type(sleeper):
+    script = sleeper(api_server.OUTLINE_SCRIPT.name)
+
+    assert api_server._pid_is_pipeline(script.pid, "outline")
+    assert not api_server._pid_is_pipeline(script.pid, "content")
@@ -0,0 +1,70 @@
+"""子进程输出解析：Prompt 块折叠为摘要。"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import List
+
+from scripts import api_server
+
+
+def _run(manager, lines: List[str]):
+    job = manager.create_job("outline", status="running")
+
+    async def scenario() -> None:
+        reader = asyncio.StreamReader()
+        reader.feed_data("".join(f"{line}\n" for line in lines).encode("utf-8"))
+        reader.feed_eof()
+        await api_server._stream_process_output(job, reader, lambda j, t: None, lambda j, d: None, {})
+
+    asyncio.run(scenario())
+    # 默认订阅级别（info）能看到的日志
+    return [
+        json.loads(frame.split(b"data: ", 1)[1])["line"]
+        for _, event, frame, level in job.events
+        if event == "log" and level <= api_server.LOG_INFO
+    ]
+
+
+def test_outline_debug_prompts_are_collapsed(manager):
+    lines = _run(
+        manager,
+        [
+            "========== DEBUG: Kimi System Prompt Begin ==========",
+            "你是一名教材编写专家",
+            "=========== DEBUG: Kimi System Prompt End ===========",
+            "========== DEBUG: Prompt Begin ==========",
+            "a",
+            "b",
+            "=========== DEBUG: Prompt End ===========",
+            "after",
+        ],
+    )
+
+    assert len(lines) == 3
+    assert lines[0].startswith("[prompt] Kimi System: 1 行")
+    assert lines[1].startswith("[prompt] prompt: 2 行")
+    assert lines[2] == "after"
+
+
+def test_unterminated_prompt_is_capped(manager, monkeypatch):
+    monkeypatch.setattr(api_server, "PROMPT_BLOCK_MAX_LINES", 3)
+    lines = _run(
+        manager,
+        ["==== LLM Prompt [draft] BEGIN ====", "1", "2", "3", "visible"],
+    )
+
+    assert lines[0].startswith("[prompt] draft: 3 行") and "未找到结束标记" in lines[0]
+    assert lines[1] == "visible"
+
+
+def test_progress_event_closes_prompt(manager):
+    progress = api_server.PROGRESS_PREFIX + json.dumps({"stage": "outline"})
+    lines = _run(
+        manager,
+        ["========== DEBUG: Recommend Prompt Begin ==========", "body", progress, "visible"],
+    )
+
+    assert lines[0].startswith("[prompt] Recommend: 1 行")
+    assert lines[1] == "visible"
@@ -0,0 +1,54 @@
+"""沙箱 runner（docker/sandbox/runner.py）在本机直接执行的部分。"""
+
+from __future__ import annotations
+
+import importlib.util
+import resource
+import time
+from pathlib import Path
+
+import pytest
+
+RUNNER_PATH = Path(__file__).resolve().parents[1] / "docker" / "sandbox" / "runner.py"
+
+
+@pytest.fixture(scope="module")
+def runner():
+    spec = importlib.util.spec_from_file_location("sandbox_runner", RUNNER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_timeout_never_splits_a_main_thread_frame(runner):
+    written = []
+
+    def emit(frame):
+        # 模拟一次耗时的写出：超时落在写到一半时
+        written.append("begin")
+        time.sleep(0.3)
+        written.append("end")
+
+    # 超过 FLUSH_SIZE 的输出由主线程直接写出
+    code = "print('x' * 5000)\nwhile True:\n    pass"
+    result = runner.execute({"code": code, "timeout": 0.1}, emit)
+
+    assert result["timedOut"]
+    assert written and written.count("begin") == written.count("end")
+
+
+def test_timeout_without_output(runner):
+    result = runner.execute({"code": "while True:\n    pass", "timeout": 0.1})
+
+    assert result["status"] == "timeout"
+
+
+def test_forked_run_reports_child_peak_rss(runner):
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    code = "block = bytearray(96 * 1024 * 1024)\nprint(len(block))"
+
+    result = runner.execute_forked({"code": code, "timeout": 5}, ())
+
+    assert result["status"] == "success"
+    # 子进程额外分配的 96MB 必须体现在 maxRss 中（单位 KB），而不是 fork server 自身的峰值
+    assert result["maxRss"] - before > 64 * 1024
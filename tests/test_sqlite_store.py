@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import pytest
+
+from scripts import api_server
+from scripts.api_server import JobRecord, _SqliteJobStore
+
+
+def _record(job_id: str, start_ts: float, **fields: Any) -> Dict[str, Any]:
+    job = JobRecord(id=job_id, type=fields.pop("type", "outline"), start_ts=start_ts, **fields)
+    return dict(job.record())
+
+
+@pytest.fixture
+def store(state_dir: Path) -> _SqliteJobStore:
+    instance = _SqliteJobStore(state_dir / "jobs.sqlite3")
+    instance.append(
+        [
+            _record("outline-1-a", 1.0, status="success"),
+            _record("outline-2-b", 2.0, status="error", consumed=True),
+            # 与上一条同一时间戳，按 id 倒序决定先后
+            _record("outline-2-c", 2.0, status="success"),
+            _record("content-3-d", 3.0, type="content", status="success"),
+            _record("outline-4-e", 4.0, status="running"),
+        ]
+    )
+    return instance
+
+
+def _pages(store: _SqliteJobStore, limit: int, **filters: Any) -> List[List[str]]:
+    pages: List[List[str]] = []
+    cursor: Optional[tuple] = None
+    while True:
+        items = store.query(limit=limit, cursor=cursor, **filters)
+        if not items:
+            return pages
+        pages.append([item["id"] for item in items])
+        last = items[-1]
+        cursor = (float(last["startTs"]), last["id"])
+
+
+def test_query_pages_in_start_ts_order(store: _SqliteJobStore) -> None:
+    assert _pages(store, 2) == [
+        ["outline-4-e", "content-3-d"],
+        ["outline-2-c", "outline-2-b"],
+        ["outline-1-a"],
+    ]
+
+
+def test_query_filters_by_type_and_consumed(store: _SqliteJobStore) -> None:
+    assert _pages(store, 2, job_type="outline", include_consumed=False) == [
+        ["outline-4-e", "outline-2-c"],
+        ["outline-1-a"],
+    ]
+    assert [item["id"] for item in store.query(job_type="content")] == ["content-3-d"]
+
+
+def test_load_returns_only_active_jobs(store: _SqliteJobStore) -> None:
+    records, summaries = store.load()
+    assert [item["id"] for item in records] == ["outline-4-e"]
+    assert summaries == []
+
+
+def test_upsert_replaces_row(store: _SqliteJobStore) -> None:
+    store.append([_record("outline-4-e", 4.0, status="success")])
+    assert store.get("outline-4-e")["status"] == "success"
+    store.remove(["outline-4-e"])
+    assert store.get("outline-4-e") is None
+
+
+def test_job_manager_paginates_memory_and_store(state_dir: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(api_server, "JOBS_STORE", "sqlite")
+    writer = api_server.JobManager()
+    ids = []
+    for idx in range(5):
+        job = writer.create_job("outline", subject=f"主题{idx}")
+        job.start_ts = 100.0 + idx
+        writer.finish(job, "success")
+        ids.append(job.id)
+    writer.close()
+
+    reader = api_server.JobManager()
+    # 一个仍在内存中运行的新任务排在最前面，且不在存储中重复出现
+    live = reader.create_job("outline", subject="进行中")
+    live.start_ts = 200.0
+    reader.touch(live)
+
+    seen: List[str] = []
+    cursor: Optional[str] = None
+    while True:
+        jobs, cursor = reader.list_jobs(job_type="outline", limit=2, cursor=cursor)
+        seen.extend(job.id for job in jobs)
+        if cursor is None:
+            break
+    assert seen == [live.id, *reversed(ids)]
+    latest = reader.latest_job("outline", include_consumed=True)
+    assert latest is not None and latest.id == live.id
@@ -0,0 +1,124 @@
+"""任务事件流：Last-Event-ID 续传与结束后的缓冲释放。"""
+
+from __future__ import annotations
+
+import asyncio
+
+from scripts import api_server
+
+
+def _logs(manager, job, count: int) -> None:
+    for idx in range(count):
+        manager.broadcast(job, "log", {"line": f"[orchestrator] line {idx}"})
+
+
+def test_resume_returns_only_missed_events(manager):
+    job = manager.create_job("outline", status="running")
+    _logs(manager, job, 5)
+
+    missed = manager.events_since(job, api_server._event_id(2))
+
+    assert [seq for seq, _, _, _ in missed] == [3, 4, 5]
+    assert manager.events_since(job, api_server._event_id(5)) == []
+
+
+def test_resume_rejects_foreign_or_evicted_ids(manager):
+    job = manager.create_job("outline", status="running")
+    _logs(manager, job, 3)
+
+    assert manager.events_since(job, None) is None
+    assert manager.events_since(job, "other-epoch:1") is None
+    assert manager.events_since(job, api_server._event_id(9)) is None
+    # 已被挤出缓冲的位置无法续传
+    job.events.popleft()
+    assert manager.events_since(job, api_server._event_id(0)) is None
+
+
+def test_finished_job_releases_events_after_grace(manager, monkeypatch):
+    monkeypatch.setattr(api_server, "JOB_EVENT_RETAIN_S", 0.01)
+    job = manager.create_job("outline", status="running")
+
+    async def scenario() -> None:
+        _logs(manager, job, 3)
+        manager.finish(job, "success")
+        manager.broadcast(job, "end", {"status": "success"})
+        assert len(job.events) == 4
+        await asyncio.sleep(0.05)
+
+    asyncio.run(scenario())
+
+    assert not job.events
+    # 缓冲释放后重连退回完整快照
+    assert manager.events_since(job, api_server._event_id(2)) is None
+
+
+class _IdleRequest:
+    """客户端一直保持连接、但不读取数据。"""
+
+    async def receive(self):
+        await asyncio.Event().wait()
+
+
+def test_saturated_subscriber_still_gets_gap_and_end(manager, monkeypatch):
+    monkeypatch.setattr(api_server, "SSE_QUEUE_SIZE", 4)
+    monkeypatch.setattr(api_server, "SSE_LOG_BATCH", 0)
+    job = manager.create_job("outline", status="running")
+
+    async def scenario():
+        stream = api_server._event_stream(job, _IdleRequest())
+        frames = [await stream.__anext__() for _ in range(1 + len(job.stages))]
+        # 让流进入实时阶段，在空队列上等待
+        pending = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0.01)
+        # 消费者不读取期间队列写满，后续事件（包括 end）都会放不下
+        _logs(manager, job, 20)
+        manager.finish(job, "success")
+        manager.broadcast(job, "end", {"status": "success"})
+
+        async def drain():
+            frames.append(await pending)
+            frames.extend([frame async for frame in stream])
+
+        await asyncio.wait_for(drain(), 5)
+        return frames
+
+    frames = asyncio.run(scenario())
+
+    events = [frame.split(b"event: ", 1)[1].split(b"\n", 1)[0] for frame in frames if b"event: " in frame]
+    assert events[-1] == b"end"
+    assert b"gap" in events
+    assert events.index(b"gap") < len(events) - 1
+
+
+def test_heartbeat_resumes_after_burst(manager, monkeypatch):
+    monkeypatch.setattr(api_server, "SSE_HEARTBEAT", 0.2)
+    monkeypatch.setattr(api_server, "SSE_LOG_BATCH", 0)
+    job = manager.create_job("outline", status="running")
+
+    async def scenario():
+        stream = api_server._event_stream(job, _IdleRequest())
+        for _ in range(1 + len(job.stages)):
+            await stream.__anext__()
+        pending = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0.15)
+        # 心跳定时器恰好在队列里还有积压时触发
+        _logs(manager, job, 4)
+        await asyncio.sleep(0.1)
+        frames = [await pending]
+        for _ in range(3):
+            frames.append(await stream.__anext__())
+        # 之后进入空闲期
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + 1.0
+        while loop.time() < deadline:
+            try:
+                frames.append(await asyncio.wait_for(stream.__anext__(), deadline - loop.time()))
+            except asyncio.TimeoutError:
+                break
+        await stream.aclose()
+        return frames
+
+    frames = asyncio.run(scenario())
+
+    assert frames[:4] == [frame for frame in frames[:4] if b"event: log" in frame]
+    assert frames[4:].count(b": ping\n\n") >= 3
@@ -61,7 +61,7 @@ export function InteractiveCodeBlock({
 
     try {
       if (language === 'python') {
-        const result = await pyodideService.runPython(code);
+        const result = await pyodideService.runPython(code, { deterministic: code === initialCode });
         if (result.error) {
           setError(result.error);
         } else {
@@ -6,22 +6,54 @@ interface ExecutionResponse {
   exitCode: number | null;
   timedOut: boolean;
   duration: number;
+  truncated?: boolean;
+  cached?: boolean;
+}
+
+interface RunOptions {
+  // 未经修改的课程示例：允许后端返回缓存的执行结果（需后端开启 EXECUTION_CACHE）
+  deterministic?: boolean;
 }
 
 const API_BASE = (process.env.NEXT_PUBLIC_BACKEND_URL || '').replace(/\/$/, '');
 const EXECUTE_ENDPOINT = `${API_BASE}/api/execute/run`;
 
+// 会话标识：后端按 IP 与会话限流（X-Client-Id），同一标签页内保持不变
+function getSessionId(): string | null {
+  if (typeof window === 'undefined') return null;
+  try {
+    const key = 'execute-session-id';
+    let id = window.sessionStorage.getItem(key);
+    if (!id) {
+      id = Math.random().toString(36).slice(2) + Date.now().toString(36);
+      window.sessionStorage.setItem(key, id);
+    }
+    return id;
+  } catch {
+    return null;
+  }
+}
+
 class RemoteExecutionService {
-  async runPython(code: string): Promise<{ output: string; error: string | null }> {
+  async runPython(code: string, options: RunOptions = {}): Promise<{ output: string; error: string | null }> {
+    const sessionId = getSessionId();
     const res = await fetch(
       EXECUTE_ENDPOINT,
       {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ language: 'python', code }),
+        headers: {
+          'Content-Type': 'application/json',
+          ...(sessionId ? { 'X-Client-Id': sessionId } : {}),
+        },
+        body: JSON.stringify({ language: 'python', code, deterministic: options.deterministic ?? false }),
       }
     );
 
+    if (res.status === 429) {
+      const retryAfter = res.headers.get('Retry-After');
+      throw new Error(`执行请求过多，请${retryAfter ? ` ${retryAfter} 秒后` : '稍后'}再试。`);
+    }
+
     if (!res.ok) {
       const text = await res.text();
       throw new Error(`执行服务不可用：${res.status} ${text}`);